@@ -0,0 +1,70 @@
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.5):
+            return
+        time.sleep(0.1)
+    raise TimeoutError(f"server on port {port} did not come up")
+
+
+@contextlib.contextmanager
+def run_server(port, workers=1, env=None):
+    # Runs src.main:app under uvicorn against whatever DATABASE_URL is configured
+    cmd = [
+        sys.executable, "-m", "uvicorn", "src.main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning",
+    ]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env={**os.environ, **(env or {})})
+    try:
+        wait_for_port(port)
+        # Workers bind lazily; give them a moment to finish their lifespan startup
+        time.sleep(0.5 * workers)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    if not samples:
+        return {f"p{p}": None for p in points}
+    ordered = sorted(samples)
+    out = {}
+    for p in points:
+        idx = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        out[f"p{p}"] = ordered[idx]
+    return out
+
+
+async def bench_user(session, url, prefix="bench"):
+    # Registers a throwaway user and returns (access_token, user) for it.
+    # session is an aiohttp.ClientSession.
+    name = f"{prefix}-{uuid.uuid4().hex[:10]}"
+    creds = {"email": f"{name}@bench.local", "password": "bench-password"}
+    async with session.post(f"{url}/api/auth/register", json={**creds, "username": name}) as resp:
+        resp.raise_for_status()
+    async with session.post(f"{url}/api/auth/login", json=creds) as resp:
+        resp.raise_for_status()
+        body = await resp.json()
+    return body["access_token"], body["user"]
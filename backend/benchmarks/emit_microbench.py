@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import json
+import time
+import socketio
+from engineio.async_socket import AsyncSocket
+from src.core.fanout import FastEmitManager
+
+# Room broadcast throughput, in-process: python-socketio's stock AsyncManager
+# vs FastEmitManager, plus FastEmitManager with several messages per "batch"
+# frame. Recipients are real engine.io sockets without a transport; their
+# queues are drained outside the timed section, so this measures the emit
+# path only.
+#
+#   python -m benchmarks.emit_microbench --members 100 1000 5000
+
+
+def payload(i):
+    return {
+        "id": i,
+        "content": "the quick brown fox jumps over the lazy dog " * 2,
+        "sender": "bench-user",
+        "channel_id": "1",
+        "created_at": "2026-01-01T12:00:00",
+    }
+
+
+async def build_room(manager, members):
+    sio = socketio.AsyncServer(async_mode='asgi', client_manager=manager)
+    sockets = []
+    for _ in range(members):
+        eio_sid = sio.eio.generate_id()
+        sock = AsyncSocket(sio.eio, eio_sid)
+        sock.connected = True
+        sio.eio.sockets[eio_sid] = sock
+        sid = await sio.manager.connect(eio_sid, '/')
+        await sio.manager.enter_room(sid, '/', 'room')
+        sockets.append(sock)
+    return sio, sockets
+
+
+def drain(sockets):
+    frames = 0
+    for sock in sockets:
+        while not sock.queue.empty():
+            sock.queue.get_nowait()
+            frames += 1
+    return frames
+
+
+async def measure(manager, members, messages, batch=1):
+    sio, sockets = await build_room(manager, members)
+    elapsed = 0.0
+    frames = 0
+    for i in range(0, messages, batch):
+        if batch == 1:
+            event, data = 'new_message', payload(i)
+        else:
+            event, data = 'batch', [['new_message', payload(i + j)] for j in range(batch)]
+        start = time.perf_counter()
+        await sio.emit(event, data, room='room')
+        elapsed += time.perf_counter() - start
+        frames += drain(sockets)
+    return {
+        "messages_per_s": messages / elapsed,
+        "deliveries_per_s": messages * members / elapsed,
+        "frames": frames,
+    }
+
+
+async def run(args):
+    results = []
+    for members in args.members:
+        stock = await measure(socketio.AsyncManager(), members, args.messages)
+        fast = await measure(FastEmitManager(), members, args.messages)
+        batched = await measure(FastEmitManager(), members, args.messages, batch=args.batch)
+        results.append({
+            "members": members,
+            "stock": stock,
+            "fast": fast,
+            f"fast_batched_{args.batch}": batched,
+            "speedup": fast["messages_per_s"] / stock["messages_per_s"],
+            "speedup_batched": batched["messages_per_s"] / stock["messages_per_s"],
+        })
+    return {"benchmark": "emit_microbench", "messages": args.messages, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Room broadcast throughput: stock vs fast fan-out")
+    parser.add_argument("--members", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=10)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
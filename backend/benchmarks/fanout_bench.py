@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import time
+import uuid
+import aiohttp
+import socketio
+from benchmarks.common import bench_user, free_port, run_server
+
+# Multi-worker fan-out benchmark.
+#
+# For each worker count, starts `uvicorn --workers N` with the configured
+# SOCKETIO_MANAGER_URL, connects listeners (spread over several client
+# processes) to one channel, fires messages from a single sender and measures
+# total deliveries/sec across all listeners.
+#
+#   python -m benchmarks.fanout_bench --workers 1 2 4 --clients 600 \
+#       --manager-url postgresql://... --channel-id 1
+
+
+async def _listen(url, token, count, channel_id, marker, expected, ready, results, timeout):
+    clients, received = [], []
+    stamps = []
+    done = asyncio.Event()
+
+    for _ in range(count):
+        client = socketio.AsyncClient(reconnection=False)
+
+        @client.on('new_message')
+        async def on_message(msg):
+            if msg.get("content", "").startswith(marker):
+                received.append(1)
+                stamps.append(time.time())
+                if len(received) >= expected:
+                    done.set()
+
+        await client.connect(url, transports=['websocket'], auth={'token': token})
+        await client.emit('join_channel', {'channel_id': channel_id})
+        clients.append(client)
+
+    ready.put(count)
+    try:
+        await asyncio.wait_for(done.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    results.put({"received": len(received), "first": min(stamps, default=None), "last": max(stamps, default=None)})
+    for client in clients:
+        await client.disconnect()
+
+
+def _listener_process(*args):
+    asyncio.run(_listen(*args))
+
+
+async def _login(url):
+    async with aiohttp.ClientSession() as session:
+        token, _ = await bench_user(session, url, prefix="fanout")
+    return token
+
+
+async def _send(url, token, messages, channel_id, marker):
+    client = socketio.AsyncClient(reconnection=False)
+    await client.connect(url, transports=['websocket'], auth={'token': token})
+    for i in range(messages):
+        await client.emit('send_message', {'content': f"{marker}{i}", 'channel_id': channel_id})
+    # Let the last emits drain before closing the socket
+    await asyncio.sleep(1)
+    await client.disconnect()
+
+
+def run(workers, args):
+    port = free_port()
+    env = {"SOCKETIO_MANAGER_URL": args.manager_url} if args.manager_url else {}
+    with run_server(port, workers=workers, env=env) as url:
+        token = asyncio.run(_login(url))
+        marker = f"bench-{uuid.uuid4().hex[:8]}-"
+        ready, results = mp.Queue(), mp.Queue()
+        per_proc = [args.clients // args.procs + (1 if i < args.clients % args.procs else 0) for i in range(args.procs)]
+        procs = [
+            mp.Process(target=_listener_process, args=(url, token, n, args.channel_id, marker, args.messages * n, ready, results, args.timeout))
+            for n in per_proc if n
+        ]
+        for p in procs:
+            p.start()
+        for _ in procs:
+            ready.get(timeout=args.timeout)
+
+        asyncio.run(_send(url, token, args.messages, args.channel_id, marker))
+        stats = [results.get(timeout=args.timeout + 30) for _ in procs]
+        for p in procs:
+            p.join()
+
+    delivered = sum(s["received"] for s in stats)
+    firsts = [s["first"] for s in stats if s["first"]]
+    lasts = [s["last"] for s in stats if s["last"]]
+    elapsed = (max(lasts) - min(firsts)) if firsts else None
+    return {
+        "workers": workers,
+        "clients": args.clients,
+        "messages": args.messages,
+        "expected_deliveries": args.clients * args.messages,
+        "deliveries": delivered,
+        "elapsed_s": elapsed,
+        "deliveries_per_s": delivered / elapsed if elapsed else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-worker Socket.IO fan-out benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=400)
+    parser.add_argument("--procs", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--channel-id", type=int, default=1)
+    parser.add_argument("--manager-url", default=os.getenv("SOCKETIO_MANAGER_URL"))
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    runs = [run(w, args) for w in args.workers]
+    base = runs[0]["deliveries_per_s"]
+    for r in runs:
+        if base and r["deliveries_per_s"]:
+            # 1.0 == perfectly linear scaling relative to the first run
+            r["scaling_efficiency"] = r["deliveries_per_s"] / (base * r["workers"] / runs[0]["workers"])
+    print(json.dumps({"benchmark": "fanout", "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import random
+import time
+import uuid
+import aiohttp
+import socketio
+from benchmarks.common import bench_user, free_port, percentiles, run_server
+from src.core.wire import COLUMNAR_MEDIA_TYPE
+
+# Mixed load against the whole app: N socket clients spread over M channels
+# sending messages, typing and reconnecting (presence churn), while REST
+# clients page history and list channels. Reports throughput and p50/p95/p99
+# latencies as JSON, so runs can be compared between releases.
+#
+# Delivery latency is send -> receive as seen by the other clients in the
+# channel; the send time travels in the message content. Socket clients run in
+# several processes so the load generator isn't the bottleneck.
+#
+#   python -m benchmarks.loadgen --clients 500 --channels 20 --duration 60
+#   python -m benchmarks.loadgen --url http://127.0.0.1:4000   # existing server
+#   python -m benchmarks.loadgen --wire compact                 # compact events / columnar history
+
+MAX_SAMPLES = 50000  # per process, reservoir-sampled
+REST_ENDPOINTS = {
+    # name -> (weight, path template)
+    "history": (6, "/api/messages/{channel_id}?limit=50"),
+    "channels": (2, "/api/channels/"),
+    "unread": (2, "/api/channels/unread"),
+}
+
+
+class Reservoir:
+    def __init__(self, size=MAX_SAMPLES):
+        self.size = size
+        self.seen = 0
+        self.samples = []
+
+    def add(self, value):
+        self.seen += 1
+        if len(self.samples) < self.size:
+            self.samples.append(value)
+        else:
+            i = random.randrange(self.seen)
+            if i < self.size:
+                self.samples[i] = value
+
+
+async def _setup(url, args):
+    # Bench accounts (each a member of every channel) and the channels themselves
+    async with aiohttp.ClientSession() as session:
+        users = [await bench_user(session, url, prefix="load") for _ in range(args.users)]
+        headers = {"Authorization": f"Bearer {users[0][0]}"}
+        channel_ids = []
+        for _ in range(args.channels):
+            name = f"load-{uuid.uuid4().hex[:8]}"
+            async with session.post(f"{url}/api/channels/", json={"name": name}, headers=headers) as resp:
+                resp.raise_for_status()
+                channel_ids.append((await resp.json())["id"])
+        for token, _ in users[1:]:
+            for cid in channel_ids:
+                async with session.post(f"{url}/api/channels/{cid}/join", headers={"Authorization": f"Bearer {token}"}) as resp:
+                    await resp.read()
+    return [token for token, _ in users], channel_ids
+
+
+async def _wait(delay, until):
+    # Sleeps delay seconds; False if that would run past the end of the run
+    remaining = until - time.time()
+    await asyncio.sleep(max(0.0, min(delay, remaining)))
+    return delay < remaining
+
+
+class SocketClient:
+    def __init__(self, url, token, channel_id, marker, args, stats):
+        self.url = url
+        self.token = token
+        self.channel_id = channel_id
+        self.marker = marker
+        self.args = args
+        self.stats = stats
+        self.client = None
+
+    async def connect(self):
+        client = socketio.AsyncClient(reconnection=False)
+
+        async def on_message(msg):
+            # Compact new_message: [id, channel_id, sender, content, created_ms, ...]
+            content = msg[3] if isinstance(msg, list) else msg.get("content", "")
+            if content.startswith(self.marker):
+                self.stats["deliveries"] += 1
+                sent_at = float(content[len(self.marker):].split(":", 1)[0])
+                self.stats["latency"].add((time.time() - sent_at) * 1000)
+
+        async def on_batch(items):
+            for event, data in items:
+                if event == 'new_message':
+                    await on_message(data)
+
+        client.on('new_message', on_message)
+        client.on('batch', on_batch)
+        try:
+            auth = {'token': self.token}
+            if self.args.wire == 'compact':
+                auth['format'] = 'compact'
+            await client.connect(self.url, transports=['websocket'], auth=auth)
+            await client.call('join_channel', {'channel_id': self.channel_id}, timeout=30)
+        except Exception:
+            self.stats["connect_errors"] += 1
+            return False
+        self.client = client
+        return True
+
+    async def send_loop(self, until):
+        rate = self.args.send_rate
+        while rate > 0:
+            if not await _wait(random.expovariate(rate), until):
+                return
+            if not self.client or not self.client.connected:
+                continue
+            try:
+                await self.client.emit('send_message', {
+                    'content': f"{self.marker}{time.time():.6f}:{uuid.uuid4().hex[:6]}",
+                    'channel_id': self.channel_id,
+                })
+                self.stats["sent"][self.channel_id] = self.stats["sent"].get(self.channel_id, 0) + 1
+            except Exception:
+                self.stats["send_errors"] += 1
+
+    async def typing_loop(self, until):
+        rate = self.args.typing_rate
+        payload = {'channel_id': self.channel_id, 'username': 'load'}
+        while rate > 0:
+            if not await _wait(random.expovariate(rate), until):
+                return
+            if self.client and self.client.connected:
+                await self.client.emit('typing_start', payload)
+                await asyncio.sleep(random.uniform(0.5, 2))
+                if self.client and self.client.connected:
+                    await self.client.emit('typing_stop', payload)
+                self.stats["typing"] += 1
+
+    async def churn_loop(self, until):
+        # Disconnect and come back: drives presence updates and reconnect catch-up
+        mean = self.args.churn_interval
+        while mean > 0:
+            if not await _wait(random.expovariate(1 / mean), until):
+                return
+            old, self.client = self.client, None
+            if old:
+                await old.disconnect()
+            if await self.connect():
+                self.stats["reconnects"] += 1
+
+    async def close(self):
+        if self.client:
+            await self.client.disconnect()
+
+
+async def _run_clients(url, tokens, assignments, marker, args, ready, go, results):
+    stats = {
+        "connected": 0, "connect_errors": 0, "sent": {}, "send_errors": 0,
+        "deliveries": 0, "typing": 0, "reconnects": 0, "latency": Reservoir(),
+    }
+    clients = []
+    for i, channel_id in assignments:
+        client = SocketClient(url, tokens[i % len(tokens)], channel_id, marker, args, stats)
+        if await client.connect():
+            stats["connected"] += 1
+            clients.append(client)
+    ready.put(len(clients))
+
+    await asyncio.get_running_loop().run_in_executor(None, go.wait)
+    until = time.time() + args.duration
+    loops = [c.send_loop(until) for c in clients]
+    loops += [c.typing_loop(until) for c in clients]
+    loops += [c.churn_loop(until) for c in clients]
+    await asyncio.gather(*loops)
+    # Let in-flight broadcasts arrive before counting
+    await asyncio.sleep(args.drain)
+
+    for c in clients:
+        await c.close()
+    latency = stats.pop("latency")
+    results.put({**stats, "latency_samples": latency.samples, "latency_seen": latency.seen})
+
+
+def _client_process(*args):
+    asyncio.run(_run_clients(*args))
+
+
+async def _rest_load(url, tokens, channel_ids, args):
+    names = list(REST_ENDPOINTS)
+    weights = [REST_ENDPOINTS[n][0] for n in names]
+    samples = {n: [] for n in names}
+    errors = {}
+    # Each worker paces itself so the total stays near --rest-rate
+    interval = args.rest_concurrency / args.rest_rate if args.rest_rate > 0 else None
+
+    async def worker(session, until):
+        while time.time() < until:
+            started = time.perf_counter()
+            name = random.choices(names, weights)[0]
+            path = REST_ENDPOINTS[name][1].format(channel_id=random.choice(channel_ids))
+            headers = {"Authorization": f"Bearer {random.choice(tokens)}"}
+            if args.wire == "compact" and name == "history":
+                headers["Accept"] = COLUMNAR_MEDIA_TYPE
+            try:
+                async with session.get(f"{url}{path}", headers=headers) as resp:
+                    await resp.read()
+                    ok = resp.status < 400
+            except aiohttp.ClientError:
+                ok = False
+            elapsed = time.perf_counter() - started
+            if ok:
+                samples[name].append(elapsed * 1000)
+            else:
+                errors[name] = errors.get(name, 0) + 1
+            await asyncio.sleep(max(0.0, interval - elapsed))
+
+    if interval is None:
+        return {"requests": 0}
+    start = time.time()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(worker(session, start + args.duration) for _ in range(args.rest_concurrency)))
+    elapsed = time.time() - start
+    total = sum(len(s) for s in samples.values())
+    return {
+        "requests": total,
+        "requests_per_s": total / elapsed,
+        "errors": errors,
+        "latency_ms": {n: {"count": len(s), **percentiles(s)} for n, s in samples.items()},
+    }
+
+
+def run(url, args):
+    tokens, channel_ids = asyncio.run(_setup(url, args))
+    marker = f"load-{uuid.uuid4().hex[:8]}-"
+    # Clients round-robin over the channels, then over the processes
+    assignments = [(i, channel_ids[i % len(channel_ids)]) for i in range(args.clients)]
+    members = {cid: 0 for cid in channel_ids}
+    ready, go, results = mp.Queue(), mp.Event(), mp.Queue()
+    procs = [
+        mp.Process(target=_client_process, args=(url, tokens, assignments[p::args.procs], marker, args, ready, go, results))
+        for p in range(args.procs) if assignments[p::args.procs]
+    ]
+    for p in procs:
+        p.start()
+    connected = sum(ready.get(timeout=args.timeout) for _ in procs)
+    for _, cid in assignments:
+        members[cid] += 1
+
+    time.sleep(args.warmup)
+    go.set()
+    rest = asyncio.run(_rest_load(url, tokens, channel_ids, args))
+    stats = [results.get(timeout=args.timeout + args.duration) for _ in procs]
+    for p in procs:
+        p.join()
+
+    sent = {}
+    for s in stats:
+        for cid, n in s["sent"].items():
+            sent[cid] = sent.get(cid, 0) + n
+    # Every member of the channel (the sender included) should get each message;
+    # connect failures and churn make the real audience a bit smaller
+    expected = sum(n * members[cid] for cid, n in sent.items())
+    deliveries = sum(s["deliveries"] for s in stats)
+    latencies = [v for s in stats for v in s["latency_samples"]]
+    total_sent = sum(sent.values())
+    return {
+        "benchmark": "loadgen",
+        "config": {
+            "clients": args.clients, "channels": args.channels, "users": args.users,
+            "duration_s": args.duration, "send_rate": args.send_rate, "typing_rate": args.typing_rate,
+            "churn_interval_s": args.churn_interval, "rest_rate": args.rest_rate, "workers": args.workers,
+            "wire": args.wire,
+        },
+        "sockets": {
+            "connected": connected,
+            "connect_errors": sum(s["connect_errors"] for s in stats),
+            "reconnects": sum(s["reconnects"] for s in stats),
+            "typing_bursts": sum(s["typing"] for s in stats),
+            "messages_sent": total_sent,
+            "send_errors": sum(s["send_errors"] for s in stats),
+            "messages_per_s": total_sent / args.duration,
+            "deliveries": deliveries,
+            "expected_deliveries": expected,
+            "delivery_ratio": deliveries / expected if expected else None,
+            "deliveries_per_s": deliveries / args.duration,
+            "delivery_latency_ms": percentiles(latencies),
+        },
+        "rest": rest,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mixed socket + REST load with latency percentiles")
+    parser.add_argument("--url", help="target a running server instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers when starting the server")
+    parser.add_argument("--manager-url", default=os.getenv("SOCKETIO_MANAGER_URL"))
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--users", type=int, default=20, help="bench accounts shared by the clients")
+    parser.add_argument("--send-rate", type=float, default=0.2, help="messages/s per client")
+    parser.add_argument("--typing-rate", type=float, default=0.1, help="typing bursts/s per client")
+    parser.add_argument("--churn-interval", type=float, default=0, help="mean seconds between a client's reconnects (0 = off)")
+    parser.add_argument("--rest-rate", type=float, default=20, help="REST requests/s in total")
+    parser.add_argument("--rest-concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--drain", type=float, default=2)
+    parser.add_argument("--wire", choices=["json", "compact"], default="json", help="socket/history wire format")
+    parser.add_argument("--procs", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    if args.url:
+        result = run(args.url.rstrip("/"), args)
+    else:
+        env = {"SOCKETIO_MANAGER_URL": args.manager_url} if args.manager_url else {}
+        with run_server(free_port(), workers=args.workers, env=env) as url:
+            result = run(url, args)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
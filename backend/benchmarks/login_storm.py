@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import json
+import time
+import aiohttp
+import socketio
+from benchmarks.common import bench_user, free_port, percentiles, run_server
+
+# Socket latency under a login storm.
+#
+# A probe socket measures ack round-trips of a cheap event (join_channel)
+# while N concurrent clients hammer POST /api/auth/login. With bcrypt on the
+# event loop the probe's p99 jumps to hundreds of ms; with the hashing pool it
+# should stay close to the idle baseline.
+#
+#   python -m benchmarks.login_storm --concurrency 50 --duration 10
+
+
+async def probe(client, duration, interval):
+    samples = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await client.call('join_channel', {'channel_id': 0}, timeout=30)
+        samples.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+    return samples
+
+
+async def storm(session, url, creds, duration, stats):
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        async with session.post(f"{url}/api/auth/login", json=creds) as resp:
+            await resp.read()
+            stats[resp.status] = stats.get(resp.status, 0) + 1
+
+
+async def run(url, args):
+    async with aiohttp.ClientSession() as session:
+        token, user = await bench_user(session, url, prefix="storm")
+        creds = {"email": user["email"], "password": "bench-password"}
+
+        client = socketio.AsyncClient(reconnection=False)
+        await client.connect(url, transports=['websocket'], auth={'token': token})
+
+        baseline = await probe(client, args.baseline, args.interval)
+
+        stats = {}
+        start = time.perf_counter()
+        storms = [storm(session, url, creds, args.duration, stats) for _ in range(args.concurrency)]
+        results = await asyncio.gather(probe(client, args.duration, args.interval), *storms)
+        elapsed = time.perf_counter() - start
+        await client.disconnect()
+
+    under_load = results[0]
+    return {
+        "benchmark": "login_storm",
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "logins_per_s": sum(stats.values()) / elapsed,
+        "login_status_counts": stats,
+        "socket_rtt_ms_idle": {**percentiles(baseline), "samples": len(baseline)},
+        "socket_rtt_ms_under_load": {**percentiles(under_load), "samples": len(under_load)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket latency while logins are hammered")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--baseline", type=float, default=3.0)
+    parser.add_argument("--interval", type=float, default=0.01)
+    parser.add_argument("--url", help="benchmark an already running server instead of starting one")
+    args = parser.parse_args()
+
+    if args.url:
+        result = asyncio.run(run(args.url, args))
+    else:
+        with run_server(free_port()) as url:
+            result = asyncio.run(run(url, args))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
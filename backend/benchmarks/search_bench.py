@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import aiohttp
+import asyncpg
+from dotenv import load_dotenv
+from benchmarks.common import bench_user, free_port, percentiles, run_server
+
+load_dotenv()
+
+# Full-text search latency over a large seeded message table.
+#
+# Seeds --messages rows of random word salad into a dedicated channel (in
+# batches, straight through SQL), then times GET /api/messages/search for a
+# mix of rare and common terms, scoped to the channel and across the user's
+# channels.
+#
+#   python -m benchmarks.search_bench --messages 3000000 --queries 200
+
+WORDS = [
+    "deploy", "rollback", "latency", "database", "socket", "channel", "invoice", "review",
+    "migration", "index", "release", "coffee", "standup", "incident", "pager", "cache",
+    "kubernetes", "budget", "roadmap", "design", "frontend", "backend", "launch", "bug",
+    "customer", "ticket", "metrics", "dashboard", "alert", "weekend", "lunch", "meeting",
+]
+RARE_WORDS = ["zeppelin", "quasar", "marzipan", "obsidian"]
+
+SEED_SQL = """
+    INSERT INTO messages (channel_id, user_id, content, created_at)
+    SELECT $1, $2,
+           array_to_string(ARRAY(
+               SELECT ($3::text[])[1 + floor(random() * array_length($3::text[], 1))::int]
+               FROM generate_series(1, 6 + (g % 10))
+           ), ' ')
+           || CASE WHEN random() < 0.0005 THEN ' ' || ($4::text[])[1 + floor(random() * 4)::int] ELSE '' END,
+           now() - make_interval(secs => g)
+    FROM generate_series($5::bigint, $6::bigint) AS g
+"""
+
+
+async def seed(db_url, channel_id, user_id, total, batch):
+    conn = await asyncpg.connect(db_url)
+    try:
+        done = 0
+        while done < total:
+            n = min(batch, total - done)
+            await conn.execute(SEED_SQL, channel_id, user_id, WORDS, RARE_WORDS, done + 1, done + n)
+            done += n
+            print(f"seeded {done}/{total}", flush=True)
+        await conn.execute("ANALYZE messages")
+    finally:
+        await conn.close()
+
+
+async def run(url, args):
+    async with aiohttp.ClientSession() as session:
+        token, user = await bench_user(session, url, prefix="search")
+        headers = {"Authorization": f"Bearer {token}"}
+        async with session.post(f"{url}/api/channels", json={"name": f"search-bench-{user['id']}"}, headers=headers) as resp:
+            resp.raise_for_status()
+            channel_id = (await resp.json())["id"]
+
+        seed_start = time.perf_counter()
+        await seed(args.database_url, channel_id, user["id"], args.messages, args.batch)
+        seed_s = time.perf_counter() - seed_start
+
+        terms = RARE_WORDS + WORDS[:8] + ["deploy rollback", '"cache index"', "release -bug"]
+        results = {}
+        for scope in ("channel", "all_channels"):
+            samples = {}
+            for i in range(args.queries):
+                term = terms[i % len(terms)]
+                params = {"q": term, "limit": "20"}
+                if scope == "channel":
+                    params["channel_id"] = str(channel_id)
+                start = time.perf_counter()
+                async with session.get(f"{url}/api/messages/search", params=params, headers=headers) as resp:
+                    resp.raise_for_status()
+                    await resp.read()
+                samples.setdefault(term, []).append((time.perf_counter() - start) * 1000)
+            every = [ms for values in samples.values() for ms in values]
+            results[scope] = {
+                "overall_ms": percentiles(every),
+                "by_term_p95_ms": {t: percentiles(v, (95,))["p95"] for t, v in samples.items()},
+            }
+
+    return {
+        "benchmark": "message_search",
+        "seeded_messages": args.messages,
+        "seed_seconds": seed_s,
+        "queries_per_scope": args.queries,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text search latency benchmark")
+    parser.add_argument("--messages", type=int, default=3_000_000)
+    parser.add_argument("--batch", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--url", help="benchmark an already running server instead of starting one")
+    args = parser.parse_args()
+
+    if args.url:
+        result = asyncio.run(run(args.url, args))
+    else:
+        with run_server(free_port()) as url:
+            result = asyncio.run(run(url, args))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import gzip
+import json
+import random
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from socketio import packet
+from src.core import wire
+from src.schemas.message import MessageOut
+
+# Wire formats, in-process: bytes per message and encode cost of the JSON
+# events/pages sent today vs the compact socket events and columnar pages
+# from core/wire.py (plus MessagePack when it is installed).
+#
+# Socket events are measured as the full Socket.IO packet text, raw and after
+# permessage-deflate: with context takeover (the default; one zlib stream per
+# connection, so repeated keys compress away) and without it (each frame
+# compressed on its own, which is what bounded-memory servers do). History
+# pages are measured the way the API builds them: response_model validation +
+# JSON for the default format, and gzip'd as a proxy would send them.
+#
+#   python -m benchmarks.wire_bench --messages 5000 --page 50
+
+WORDS = (
+    "the a to and of you i it is that in we for on this be with are have not "
+    "ok yes no thanks lol meeting deploy build fix later today tomorrow review "
+    "merge ticket bug prod staging coffee lunch call sure sounds good let's"
+).split()
+
+
+def make_messages(n, senders=50, channel_id=1, seed=1):
+    rng = random.Random(seed)
+    names = [f"user{rng.randrange(10**6)}" for _ in range(senders)]
+    at = datetime(2026, 1, 1, 9, 0, 0)
+    out = []
+    for i in range(n):
+        at += timedelta(seconds=rng.expovariate(1 / 20), microseconds=rng.randrange(10**6))
+        words = max(1, int(rng.lognormvariate(2, 0.8)))  # mostly short chat lines
+        out.append({
+            "id": 1_000_000 + i,
+            "content": " ".join(rng.choice(WORDS) for _ in range(words)),
+            "sender": rng.choice(names),
+            "channel_id": channel_id,
+            "created_at": at,
+            "edited_at": at + timedelta(seconds=30) if rng.random() < 0.05 else None,
+            "attachments": [{
+                "id": 5000 + i, "filename": "photo.jpg", "content_type": "image/jpeg",
+                "size": rng.randrange(10**5, 5 * 10**6), "has_thumbnail": True,
+            }] if rng.random() < 0.03 else [],
+        })
+    return out
+
+
+def json_event(m):
+    # What send_message broadcasts today
+    return {
+        "id": m["id"],
+        "content": m["content"],
+        "sender": m["sender"],
+        "channel_id": str(m["channel_id"]),
+        "created_at": m["created_at"].isoformat(),
+        "attachments": m["attachments"],
+    }
+
+
+def socket_packet(event, data):
+    return packet.Packet(packet.EVENT, data=[event, data]).encode()
+
+
+def deflate_sizes(frames):
+    # permessage-deflate: raw deflate + sync flush, minus the 4-byte tail
+    stream = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    start = time.perf_counter()
+    takeover = sum(len(stream.compress(f) + stream.flush(zlib.Z_SYNC_FLUSH)) - 4 for f in frames)
+    takeover_s = time.perf_counter() - start
+    start = time.perf_counter()
+    fresh = 0
+    for f in frames:
+        c = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        fresh += len(c.compress(f) + c.flush(zlib.Z_SYNC_FLUSH)) - 4
+    fresh_s = time.perf_counter() - start
+    n = len(frames)
+    return {
+        "deflate_bytes_per_msg": takeover / n,
+        "deflate_us_per_msg": takeover_s / n * 1e6,
+        "deflate_no_takeover_bytes_per_msg": fresh / n,
+        "deflate_no_takeover_us_per_msg": fresh_s / n * 1e6,
+    }
+
+
+def bench_events(messages, repeat):
+    payloads = [json_event(m) for m in messages]
+    n = len(payloads)
+    results = {}
+    for name, encode in (
+        ("json", lambda p: socket_packet("new_message", p)),
+        ("compact", lambda p: socket_packet("new_message", wire.compact_event("new_message", p))),
+    ):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            frames = [encode(p) for p in payloads]
+            best = min(best, time.perf_counter() - start)
+        frames = [f.encode() for f in frames]
+        results[name] = {
+            "bytes_per_msg": sum(len(f) for f in frames) / n,
+            "encode_us_per_msg": best / n * 1e6,
+            **deflate_sizes(frames),
+        }
+    results["compact_vs_json_bytes"] = results["compact"]["bytes_per_msg"] / results["json"]["bytes_per_msg"]
+    results["compact_vs_json_deflated_bytes"] = (
+        results["compact"]["deflate_bytes_per_msg"] / results["json"]["deflate_bytes_per_msg"]
+    )
+    return results
+
+
+def bench_pages(messages, page, repeat):
+    adapter = TypeAdapter(List[MessageOut])
+    # Pages are newest first, like the API returns them
+    pages = [list(reversed(messages[i:i + page])) for i in range(0, len(messages) - page + 1, page)]
+    n = len(pages) * page
+    formats = {
+        "json": lambda rows: json.dumps(jsonable_encoder(adapter.validate_python(rows))).encode(),
+        "columnar": lambda rows: wire.encode_page(rows, wire.COLUMNAR_MEDIA_TYPE),
+    }
+    if wire.msgpack is not None:
+        formats["msgpack"] = lambda rows: wire.encode_page(rows, wire.MSGPACK_MEDIA_TYPE)
+    results = {}
+    for name, encode in formats.items():
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            bodies = [encode(rows) for rows in pages]
+            best = min(best, time.perf_counter() - start)
+        results[name] = {
+            "bytes_per_msg": sum(len(b) for b in bodies) / n,
+            "gzip_bytes_per_msg": sum(len(gzip.compress(b, 6)) for b in bodies) / n,
+            "encode_us_per_page": best / len(pages) * 1e6,
+        }
+    for name in formats:
+        if name != "json":
+            results[f"{name}_vs_json_bytes"] = results[name]["bytes_per_msg"] / results["json"]["bytes_per_msg"]
+            results[f"{name}_vs_json_encode"] = (
+                results[name]["encode_us_per_page"] / results["json"]["encode_us_per_page"]
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes per message and encode cost: JSON vs compact wire formats")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--page", type=int, default=50, help="history page size")
+    parser.add_argument("--senders", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5, help="best of N timing runs")
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages, senders=args.senders)
+    print(json.dumps({
+        "benchmark": "wire_bench",
+        "messages": args.messages,
+        "page": args.page,
+        "msgpack": wire.msgpack is not None,
+        "events": bench_events(messages, args.repeat),
+        "history_pages": bench_pages(messages, args.page, args.repeat),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
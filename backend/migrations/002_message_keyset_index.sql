@@ -0,0 +1,10 @@
+-- migrate:no-transaction
+-- Keyset pagination for message history
+
+-- (channel_id, created_at, id) lets history pages seek with a row comparison
+-- and gives a stable order for messages sharing the same created_at.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_channel_created_id
+  ON messages (channel_id, created_at DESC, id DESC);
+
+-- Superseded by the index above
+DROP INDEX CONCURRENTLY IF EXISTS idx_messages_channel_created;
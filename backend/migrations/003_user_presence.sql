@@ -0,0 +1,4 @@
+-- Presence columns persisted in bulk by the presence registry
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS is_online BOOLEAN DEFAULT FALSE;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS last_seen TIMESTAMP NULL;
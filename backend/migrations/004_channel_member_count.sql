@@ -0,0 +1,26 @@
+-- Maintained member counts for the channel list
+
+ALTER TABLE channels ADD COLUMN IF NOT EXISTS member_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE channels c
+SET member_count = (SELECT COUNT(*) FROM channel_members cm WHERE cm.channel_id = c.id);
+
+CREATE OR REPLACE FUNCTION channel_member_count_trg() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    UPDATE channels SET member_count = member_count + 1 WHERE id = NEW.channel_id;
+  ELSIF TG_OP = 'DELETE' THEN
+    UPDATE channels SET member_count = member_count - 1 WHERE id = OLD.channel_id;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_channel_member_count ON channel_members;
+CREATE TRIGGER trg_channel_member_count
+  AFTER INSERT OR DELETE ON channel_members
+  FOR EACH ROW EXECUTE FUNCTION channel_member_count_trg();
+
+-- Keyset paging of the listing, and the per-user "my channels" lookup
+CREATE INDEX IF NOT EXISTS idx_channels_created_id ON channels (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_channel_members_user ON channel_members (user_id, channel_id);
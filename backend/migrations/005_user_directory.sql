@@ -0,0 +1,32 @@
+-- Paginated / prefix-searchable user directory with delta sync
+
+-- Case-insensitive prefix search and keyset paging on the same index.
+-- The C collation lets LIKE 'abc%' use a plain btree.
+CREATE INDEX IF NOT EXISTS idx_users_username_lower
+  ON users ((lower(username) COLLATE "C"), id);
+
+-- Every change to a user's profile or presence gets a new version number,
+-- so clients can ask for "everything since version N".
+CREATE SEQUENCE IF NOT EXISTS users_version_seq;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS version BIGINT;
+UPDATE users SET version = nextval('users_version_seq') WHERE version IS NULL;
+ALTER TABLE users ALTER COLUMN version SET DEFAULT nextval('users_version_seq');
+ALTER TABLE users ALTER COLUMN version SET NOT NULL;
+
+CREATE OR REPLACE FUNCTION users_bump_version_trg() RETURNS trigger AS $$
+BEGIN
+  IF NEW.username IS DISTINCT FROM OLD.username
+     OR NEW.email IS DISTINCT FROM OLD.email
+     OR NEW.is_online IS DISTINCT FROM OLD.is_online THEN
+    NEW.version := nextval('users_version_seq');
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_users_bump_version ON users;
+CREATE TRIGGER trg_users_bump_version
+  BEFORE UPDATE ON users
+  FOR EACH ROW EXECUTE FUNCTION users_bump_version_trg();
+
+CREATE INDEX IF NOT EXISTS idx_users_version ON users (version);
@@ -0,0 +1,25 @@
+-- migrate:no-transaction
+-- Full-text message search
+--
+-- search_vector is a plain nullable column kept current by a trigger: a
+-- stored generated column would rewrite the whole table under an ACCESS
+-- EXCLUSIVE lock. Adding it is metadata-only; existing rows are filled in
+-- batches by migration 013 and are not searchable until then.
+
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+CREATE OR REPLACE FUNCTION messages_search_vector_trg() RETURNS trigger AS $$
+BEGIN
+  NEW.search_vector := to_tsvector('english', coalesce(NEW.content, ''));
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_messages_search_vector ON messages;
+CREATE TRIGGER trg_messages_search_vector
+  BEFORE INSERT OR UPDATE OF content ON messages
+  FOR EACH ROW EXECUTE FUNCTION messages_search_vector_trg();
+
+-- Built before the backfill (over NULLs, so quickly); the backfill's
+-- updates maintain it from there
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_search ON messages USING GIN (search_vector);
@@ -0,0 +1,49 @@
+-- migrate:no-transaction
+-- Bring databases created by the old cloud_setup.py / fix_db.py /
+-- fix_messages.py scripts in line with 001_init.sql and the app code.
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT NOW();
+ALTER TABLE channels ADD COLUMN IF NOT EXISTS created_by INTEGER REFERENCES users(id);
+ALTER TABLE channel_members ADD COLUMN IF NOT EXISTS joined_at TIMESTAMP DEFAULT NOW();
+
+-- The app writes messages.user_id; 001_init.sql called it sender_id
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id);
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS edited_at TIMESTAMP NULL;
+
+-- Copies sender_id into user_id for the id range after `after_id`, one
+-- batch per call, and returns the last id it looked at (NULL when done).
+CREATE OR REPLACE FUNCTION backfill_message_user_id(after_id BIGINT, batch_size INTEGER)
+RETURNS BIGINT AS $$
+DECLARE
+  last_id BIGINT;
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = 'messages' AND column_name = 'sender_id'
+  ) THEN
+    RETURN NULL;
+  END IF;
+
+  EXECUTE '
+    WITH batch AS (
+      SELECT id FROM messages WHERE id > $1 ORDER BY id LIMIT $2
+    ), updated AS (
+      UPDATE messages m SET user_id = m.sender_id
+      FROM batch b
+      WHERE m.id = b.id AND m.user_id IS NULL AND m.sender_id IS NOT NULL
+    )
+    SELECT max(id) FROM batch'
+  INTO last_id USING after_id, batch_size;
+  RETURN last_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- migrate:batch
+SELECT backfill_message_user_id($1, 5000);
+
+DROP FUNCTION IF EXISTS backfill_message_user_id(BIGINT, INTEGER);
+
+-- cloud_setup.py used to seed this
+INSERT INTO channels (name, description)
+SELECT 'General', 'The main lobby'
+WHERE NOT EXISTS (SELECT 1 FROM channels WHERE name = 'General');
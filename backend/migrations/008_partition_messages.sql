@@ -0,0 +1,105 @@
+-- migrate:no-transaction
+-- Range-partition messages by month (created_at)
+--
+-- The existing table is not rewritten: it becomes the first partition,
+-- messages_legacy, covering everything before a cut-over month, and new
+-- monthly partitions take over from there. Every step that touches the old
+-- rows (constraint validation, the new unique index) runs without blocking
+-- writes; the swap itself is a short metadata-only transaction.
+-- Future partitions and retention are handled by src/core/partitions.py.
+
+-- 1. Pick the cut-over month (a week of headroom past the current month) and
+--    prove every row is before it. NOT VALID so adding it doesn't scan.
+DO $$
+DECLARE
+  cutover TIMESTAMP := date_trunc('month', LOCALTIMESTAMP + INTERVAL '7 days') + INTERVAL '1 month';
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = 'messages'::regclass) = 'p'
+     OR EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'messages_legacy_range') THEN
+    RETURN;
+  END IF;
+  UPDATE messages SET created_at = LOCALTIMESTAMP WHERE created_at IS NULL;
+  EXECUTE format(
+    'ALTER TABLE messages ADD CONSTRAINT messages_legacy_range CHECK (created_at IS NOT NULL AND created_at < %L) NOT VALID',
+    cutover);
+  EXECUTE format('COMMENT ON CONSTRAINT messages_legacy_range ON messages IS %L', cutover);
+END;
+$$;
+
+-- 2. Validate with only a SHARE UPDATE EXCLUSIVE lock (reads and writes go on)
+DO $$
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = 'messages'::regclass) <> 'p' THEN
+    ALTER TABLE messages VALIDATE CONSTRAINT messages_legacy_range;
+  END IF;
+END;
+$$;
+
+-- 3. The partitioned primary key has to include the partition key
+-- migrate:skip-if SELECT relkind = 'p' FROM pg_class WHERE oid = 'messages'::regclass
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS messages_id_created_at_key ON messages (id, created_at);
+
+-- 4. Swap: the old table becomes messages_legacy, attached under a new
+--    partitioned messages with matching indexes, keys and sequence.
+DO $$
+DECLARE
+  cutover TIMESTAMP;
+  seq TEXT;
+  old_pkey TEXT;
+  fk RECORD;
+  month TIMESTAMP;
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = 'messages'::regclass) = 'p' THEN
+    RETURN;
+  END IF;
+
+  SELECT obj_description(oid, 'pg_constraint')::TIMESTAMP INTO cutover
+  FROM pg_constraint WHERE conname = 'messages_legacy_range';
+  seq := pg_get_serial_sequence('messages', 'id');
+
+  -- The valid CHECK lets SET NOT NULL and ATTACH skip their table scans
+  ALTER TABLE messages ALTER COLUMN created_at SET NOT NULL;
+  SELECT conname INTO old_pkey FROM pg_constraint WHERE conrelid = 'messages'::regclass AND contype = 'p';
+  IF old_pkey IS NOT NULL THEN
+    EXECUTE format('ALTER TABLE messages DROP CONSTRAINT %I', old_pkey);
+  END IF;
+  ALTER TABLE messages ADD CONSTRAINT messages_legacy_pkey PRIMARY KEY USING INDEX messages_id_created_at_key;
+  ALTER INDEX IF EXISTS idx_messages_channel_created_id RENAME TO idx_messages_legacy_channel_created_id;
+  ALTER INDEX IF EXISTS idx_messages_search RENAME TO idx_messages_legacy_search;
+  ALTER TABLE messages RENAME TO messages_legacy;
+
+  CREATE TABLE messages (LIKE messages_legacy INCLUDING DEFAULTS)
+    PARTITION BY RANGE (created_at);
+  ALTER TABLE messages ADD CONSTRAINT messages_pkey PRIMARY KEY (id, created_at);
+  CREATE INDEX idx_messages_channel_created_id ON messages (channel_id, created_at DESC, id DESC);
+  CREATE INDEX idx_messages_search ON messages USING GIN (search_vector);
+  -- Row triggers on the parent are cloned onto every partition, the legacy
+  -- one included, so its own copy (migration 006) goes
+  DROP TRIGGER IF EXISTS trg_messages_search_vector ON messages_legacy;
+  CREATE TRIGGER trg_messages_search_vector
+    BEFORE INSERT OR UPDATE OF content ON messages
+    FOR EACH ROW EXECUTE FUNCTION messages_search_vector_trg();
+  -- Same foreign keys as the old table, so ATTACH reuses them instead of re-validating
+  FOR fk IN
+    SELECT conname, pg_get_constraintdef(oid) AS def FROM pg_constraint
+    WHERE conrelid = 'messages_legacy'::regclass AND contype = 'f'
+  LOOP
+    EXECUTE format('ALTER TABLE messages ADD CONSTRAINT %I %s', fk.conname, fk.def);
+  END LOOP;
+
+  EXECUTE format('ALTER TABLE messages ATTACH PARTITION messages_legacy FOR VALUES FROM (MINVALUE) TO (%L)', cutover);
+  ALTER TABLE messages_legacy DROP CONSTRAINT messages_legacy_range;
+  -- Keep the id sequence alive when messages_legacy is archived and dropped
+  IF seq IS NOT NULL THEN
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY messages.id', seq);
+  END IF;
+
+  -- A few months ahead; the app's partition maintenance keeps this topped up
+  FOR i IN 0..2 LOOP
+    month := cutover + make_interval(months => i);
+    EXECUTE format(
+      'CREATE TABLE IF NOT EXISTS %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+      'messages_p' || to_char(month, 'YYYY_MM'), month, month + INTERVAL '1 month');
+  END LOOP;
+END;
+$$;
@@ -0,0 +1,14 @@
+-- Per-user read cursors for unread badges
+--
+-- The cursor is the (created_at, id) of the last message read, so counting
+-- what's unread is a range on idx_messages_channel_created_id: an index-only
+-- scan per channel, capped by the app, never a COUNT(*) over the channel.
+
+CREATE TABLE IF NOT EXISTS channel_read_state (
+  user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  channel_id INTEGER NOT NULL REFERENCES channels(id) ON DELETE CASCADE,
+  last_read_id BIGINT NOT NULL,
+  last_read_at TIMESTAMP NOT NULL,
+  updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (user_id, channel_id)
+);
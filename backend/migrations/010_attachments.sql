@@ -0,0 +1,23 @@
+-- File attachments
+--
+-- Blobs are stored content-addressed (sha256) by the storage backend, so the
+-- same file uploaded twice is one blob and two rows here. A row is unattached
+-- (message_id NULL) from upload until the uploader sends a message with it.
+-- No foreign key to messages: its primary key is (id, created_at) since the
+-- partitioning in migration 008; message deletes remove the rows themselves.
+
+CREATE TABLE IF NOT EXISTS attachments (
+  id BIGSERIAL PRIMARY KEY,
+  sha256 CHAR(64) NOT NULL,
+  size BIGINT NOT NULL,
+  content_type VARCHAR(255) NOT NULL,
+  filename VARCHAR(255) NOT NULL,
+  uploaded_by INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  message_id BIGINT,
+  channel_id INTEGER REFERENCES channels(id) ON DELETE CASCADE,
+  has_thumbnail BOOLEAN NOT NULL DEFAULT FALSE,
+  created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_attachments_message ON attachments (message_id) WHERE message_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_attachments_sha256 ON attachments (sha256);
@@ -0,0 +1,19 @@
+-- Presence shared across uvicorn workers
+--
+-- Each worker heartbeats a row in presence_workers and holds a row in
+-- presence_sockets for every user with a socket open on it. A user is only
+-- marked offline once no live worker (recent heartbeat) holds a row for them;
+-- rows of workers that stopped heartbeating are reaped by the others.
+
+CREATE TABLE IF NOT EXISTS presence_workers (
+  worker_id VARCHAR(64) PRIMARY KEY,
+  heartbeat_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS presence_sockets (
+  user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  worker_id VARCHAR(64) NOT NULL REFERENCES presence_workers(worker_id) ON DELETE CASCADE,
+  PRIMARY KEY (user_id, worker_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_presence_sockets_worker ON presence_sockets (worker_id);
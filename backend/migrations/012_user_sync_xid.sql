@@ -0,0 +1,35 @@
+-- migrate:no-transaction
+-- Commit-order-safe delta sync for the user directory
+--
+-- Versions from users_version_seq were taken when a row changed but only
+-- became visible when its transaction committed, and transactions commit
+-- out of order: a row could appear with a version below a watermark a
+-- client already had, and ?since= would never send it. A user's version is
+-- now the id of the transaction that last changed it, and the API only
+-- hands out versions below txid_snapshot_xmin(), the oldest transaction
+-- still running, which nothing can commit under any more.
+--
+-- Existing rows keep their sequence numbers. At worst they are sent once
+-- more by a later sync; tokens ahead of the new versions get a 410 and the
+-- client re-reads the directory.
+
+CREATE OR REPLACE FUNCTION users_bump_version_trg() RETURNS trigger AS $$
+BEGIN
+  IF NEW.username IS DISTINCT FROM OLD.username
+     OR NEW.email IS DISTINCT FROM OLD.email
+     OR NEW.is_online IS DISTINCT FROM OLD.is_online THEN
+    NEW.version := txid_current();
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE users ALTER COLUMN version SET DEFAULT txid_current();
+
+DROP SEQUENCE IF EXISTS users_version_seq;
+
+-- Delta pages are keyset-paginated on (version, id): one transaction can
+-- change more users than fit on a page
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_version_id ON users (version, id);
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_users_version;
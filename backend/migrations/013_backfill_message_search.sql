@@ -0,0 +1,14 @@
+-- migrate:no-transaction
+-- Fill in search_vector (migration 006) for messages written before its
+-- trigger existed, 5000 rows per transaction. Rows written since already
+-- have it, and the trigger keeps later edits current.
+
+-- migrate:batch
+WITH batch AS (
+  SELECT id, created_at FROM messages WHERE id > $1 ORDER BY id LIMIT 5000
+), updated AS (
+  UPDATE messages m SET search_vector = to_tsvector('english', coalesce(m.content, ''))
+  FROM batch b
+  WHERE m.id = b.id AND m.created_at = b.created_at AND m.search_vector IS NULL
+)
+SELECT max(id) FROM batch;
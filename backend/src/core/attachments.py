@@ -0,0 +1,180 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+import asyncpg
+from dotenv import load_dotenv
+from src.core.database import DATABASE_URL, SERVER_SETTINGS, database, read_database
+from src.core.storage import blob_store
+
+load_dotenv()
+
+ATTACHMENTS_PER_MESSAGE = int(os.getenv("ATTACHMENTS_PER_MESSAGE", "10"))
+# Garbage collection: uploads never sent with a message expire after
+# ATTACHMENT_UNCLAIMED_TTL, and blobs (with their thumbnails) that no row
+# references any more are deleted. Anything written within the last
+# ATTACHMENT_GC_GRACE seconds is left alone: its row may not exist yet.
+ATTACHMENT_GC_INTERVAL = float(os.getenv("ATTACHMENT_GC_INTERVAL", "3600"))  # 0 = off
+ATTACHMENT_UNCLAIMED_TTL = float(os.getenv("ATTACHMENT_UNCLAIMED_TTL", "86400"))
+ATTACHMENT_GC_GRACE = float(os.getenv("ATTACHMENT_GC_GRACE", "3600"))
+
+ADVISORY_LOCK_ID = 0x7EAC4A9  # one collector at a time across workers
+
+# What messages carry (new_message, history, catch-up); clients build
+# /api/attachments/{id} and /api/attachments/{id}/thumbnail from the id
+ATTACHMENT_FIELDS = "id, filename, content_type, size, has_thumbnail"
+
+
+def _out(row):
+    return {
+        "id": row["id"],
+        "filename": row["filename"],
+        "content_type": row["content_type"],
+        "size": row["size"],
+        "has_thumbnail": row["has_thumbnail"],
+    }
+
+
+def parse_ids(raw):
+    # attachment_ids from a socket payload -> list of ints, or None if malformed
+    if not raw:
+        return []
+    if not isinstance(raw, list):
+        return None
+    try:
+        ids = list(dict.fromkeys(int(i) for i in raw))
+    except (TypeError, ValueError):
+        return None
+    return ids if len(ids) <= ATTACHMENTS_PER_MESSAGE else None
+
+
+async def claim(user_id: int, channel_id: int, message_id: int, ids):
+    # Links the user's own unattached uploads to a message; ids that aren't
+    # theirs or are already used are ignored
+    if not ids:
+        return []
+    rows = await database.fetch_all(
+        f"""
+        UPDATE attachments SET message_id = :mid, channel_id = :cid
+        WHERE id = ANY(:ids) AND uploaded_by = :uid AND message_id IS NULL
+        RETURNING {ATTACHMENT_FIELDS}
+        """,
+        values={"mid": message_id, "cid": channel_id, "ids": ids, "uid": user_id},
+        name="attachment_claim",
+    )
+    return sorted((_out(row) for row in rows), key=lambda a: a["id"])
+
+
+async def for_messages(message_ids, db=read_database):
+    # message id -> [attachment], one indexed lookup for a whole page
+    message_ids = list(message_ids)
+    if not message_ids:
+        return {}
+    rows = await db.fetch_all(
+        f"""
+        SELECT message_id, {ATTACHMENT_FIELDS} FROM attachments
+        WHERE message_id = ANY(:ids)
+        ORDER BY id
+        """,
+        values={"ids": message_ids},
+        name="attachment_lookup",
+    )
+    out = {}
+    for row in rows:
+        out.setdefault(row["message_id"], []).append(_out(row))
+    return out
+
+
+async def with_attachments(rows, db=read_database):
+    attached = await for_messages((row["id"] for row in rows), db)
+    return [{**row, "attachments": attached.get(row["id"], [])} for row in rows]
+
+
+async def release(message_id: int):
+    # The message is gone; its rows go too. Blobs may be shared with other
+    # rows (content-addressed), so the collector deletes them once unreferenced
+    await database.execute(
+        "DELETE FROM attachments WHERE message_id = :mid", values={"mid": message_id}, name="attachment_release"
+    )
+
+
+class AttachmentCollector:
+    def __init__(self, url, store, interval=3600, unclaimed_ttl=86400, grace=3600):
+        self.url = url
+        self.store = store
+        self.interval = interval
+        self.unclaimed_ttl = unclaimed_ttl
+        self.grace = grace
+        self._task = None
+        self.expired = 0
+        self.collected = 0
+        self.temp_removed = 0
+        self.last_run = None
+
+    async def start(self):
+        if self.interval <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Error collecting attachments: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self):
+        conn = await asyncpg.connect(self.url, server_settings=SERVER_SETTINGS)
+        try:
+            # Every worker runs this loop; whoever gets the lock does the work
+            if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", ADVISORY_LOCK_ID):
+                return
+            status = await conn.execute(
+                """
+                DELETE FROM attachments
+                WHERE message_id IS NULL AND created_at < NOW() - make_interval(secs => $1)
+                """,
+                self.unclaimed_ttl,
+            )
+            self.expired += int(status.split()[-1])
+            # Blobs written after the cutoff are left alone, including ones
+            # uploaded again while this runs (delete() re-checks)
+            cutoff = time.time() - self.grace
+            async for shas in self.store.scan(cutoff):
+                referenced = await conn.fetch(
+                    "SELECT DISTINCT sha256 FROM attachments WHERE sha256 = ANY($1::bpchar[])", list(shas)
+                )
+                for sha in set(shas) - {row["sha256"] for row in referenced}:
+                    self.collected += await self.store.delete(sha, cutoff)
+            self.temp_removed += await self.store.clean_temp(cutoff)
+            self.last_run = datetime.utcnow()
+        finally:
+            # Closing the session also releases the advisory lock
+            await conn.close()
+
+    def stats(self):
+        return {
+            "expired": self.expired,
+            "collected": self.collected,
+            "temp_removed": self.temp_removed,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+        }
+
+
+attachment_collector = AttachmentCollector(
+    DATABASE_URL,
+    blob_store,
+    interval=ATTACHMENT_GC_INTERVAL,
+    unclaimed_ttl=ATTACHMENT_UNCLAIMED_TTL,
+    grace=ATTACHMENT_GC_GRACE,
+)
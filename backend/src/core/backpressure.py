@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import weakref
+import engineio
+import socketio
+from engineio import packet as eio_packet
+from socketio import packet
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Every socket's outbound packets wait in an OutboundQueue until its transport
+# writer sends them. Producers never block on it, so a slow reader can't hold
+# up a broadcast; instead its queue is bounded:
+#   1. typing/presence updates for the same key replace the queued older one
+#   2. when full, queued droppable events (typing, presence) go first
+#   3. if only chat events are left, the backlog is thrown away and the client
+#      gets a "resync" event plus a close, so it reconnects and refetches
+SOCKET_QUEUE_MAX = int(os.getenv("SOCKET_QUEUE_MAX", "1000"))
+SOCKET_DROPPABLE_EVENTS = frozenset(
+    e.strip() for e in os.getenv("SOCKET_DROPPABLE_EVENTS", "typing_start,typing_stop,presence_batch").split(",") if e.strip()
+)
+COALESCED_EVENTS = {
+    # event -> fields that identify "the same" update
+    "typing_start": ("channel_id", "username"),
+    "typing_stop": ("channel_id", "username"),
+}
+
+
+class OutboundStats:
+    def __init__(self):
+        self.queues = weakref.WeakSet()  # live sockets' queues, for the depth gauges
+        self.high_water = 0     # deepest single queue seen
+        self.dropped = {}       # reason -> count
+        self.coalesced = 0
+        self.overflow_disconnects = 0
+
+    def drop(self, reason, n=1):
+        self.dropped[reason] = self.dropped.get(reason, 0) + n
+
+    def stats(self):
+        return {
+            "queue_limit": SOCKET_QUEUE_MAX,
+            "sockets": len(self.queues),
+            "queued": sum(q.qsize() for q in self.queues),
+            "deepest": max((q.qsize() for q in self.queues), default=0),
+            "high_water": self.high_water,
+            "dropped": dict(self.dropped),
+            "coalesced": self.coalesced,
+            "overflow_disconnects": self.overflow_disconnects,
+        }
+
+
+outbound_stats = OutboundStats()
+
+
+def classify(pkt):
+    # -> (event name or None, coalesce key or None), cached on the packet since
+    # one broadcast packet object is shared by every recipient's queue
+    cached = getattr(pkt, "_outbound_class", None)
+    if cached is not None:
+        return cached
+    event, key = None, None
+    data = pkt.data
+    # Default-namespace event without an ack id: 2["event",...]
+    if pkt.packet_type == eio_packet.MESSAGE and isinstance(data, str) and data.startswith('2["'):
+        end = data.find('"', 3)
+        event = data[3:end] if end > 0 else None
+        fields = COALESCED_EVENTS.get(event)
+        if fields:
+            try:
+                args = json.loads(data[1:])
+                payload = args[1] if len(args) > 1 and isinstance(args[1], dict) else {}
+                key = (event.split("_")[0],) + tuple(str(payload.get(f)) for f in fields)
+            except ValueError:
+                key = None
+    pkt._outbound_class = (event, key)
+    return pkt._outbound_class
+
+
+def _resync_packets():
+    # Tells the client its stream has a gap, then closes the engine.io session
+    event = packet.Packet(packet.EVENT, data=["resync", {"reason": "slow_consumer"}]).encode()
+    return [eio_packet.Packet(eio_packet.MESSAGE, event), eio_packet.Packet(eio_packet.CLOSE)]
+
+
+class OutboundQueue(asyncio.Queue):
+    # Unbounded as far as asyncio is concerned (put never waits); the limit
+    # is enforced here with the drop/coalesce/resync policy instead.
+    def __init__(self, limit=SOCKET_QUEUE_MAX, stats=outbound_stats):
+        self.limit = limit
+        self.stats = stats
+        self.overflowed = False
+        super().__init__()
+        stats.queues.add(self)
+
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self._latest = {}  # coalesce key -> queued packet
+
+    def _put(self, item):
+        super()._put(item)
+        if len(self._queue) > self.stats.high_water:
+            self.stats.high_water = len(self._queue)
+
+    def _get(self):
+        item = super()._get()
+        if item is not None:
+            _, key = classify(item)
+            if key is not None and self._latest.get(key) is item:
+                del self._latest[key]
+        return item
+
+    def _discard(self, item):
+        self._queue.remove(item)
+        _, key = classify(item)
+        if key is not None and self._latest.get(key) is item:
+            del self._latest[key]
+        self.task_done()  # keeps join() balanced
+
+    async def put(self, item):
+        self.put_nowait(item)
+
+    def put_nowait(self, item):
+        if item is None:
+            # engine.io's "stop the writer" sentinel always gets through
+            return super().put_nowait(item)
+        if self.overflowed:
+            self.stats.drop("after_resync")
+            return
+        event, key = classify(item)
+        if key is not None:
+            older = self._latest.get(key)
+            if older is not None:
+                self._discard(older)
+                self.stats.coalesced += 1
+            self._latest[key] = item
+        if len(self._queue) >= self.limit:
+            if event in SOCKET_DROPPABLE_EVENTS:
+                self._latest.pop(key, None)
+                self.stats.drop(event)
+                return
+            if not self._evict_droppable():
+                self._overflow()
+                return
+        super().put_nowait(item)
+
+    def _evict_droppable(self):
+        for queued in self._queue:
+            if queued is None:
+                continue
+            event, _ = classify(queued)
+            if event in SOCKET_DROPPABLE_EVENTS:
+                self._discard(queued)
+                self.stats.drop(event)
+                return True
+        return False
+
+    def _overflow(self):
+        stopping = None in self._queue
+        backlog = len(self._queue) - stopping
+        self._queue.clear()
+        self._latest.clear()
+        for _ in range(backlog):
+            self.task_done()
+        if stopping:
+            super()._put(None)
+        self.stats.drop("overflow", backlog + 1)
+        self.stats.overflow_disconnects += 1
+        for p in _resync_packets():
+            super().put_nowait(p)
+        self.overflowed = True
+
+
+class BackpressureEngineIOServer(engineio.AsyncServer):
+    def create_queue(self, *args, **kwargs):
+        return OutboundQueue()
+
+
+class AsyncServer(socketio.AsyncServer):
+    # socketio.AsyncServer whose engine.io sockets get bounded outbound queues
+    def _engineio_server_class(self):
+        return BackpressureEngineIOServer
@@ -1,7 +1,250 @@
+import asyncio
 import os
+import re
+import time
 from databases import Database
+from databases.core import Connection
 from dotenv import load_dotenv
+from src.core.metrics import track_db_time
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
-database = Database(DATABASE_URL)
\ No newline at end of file
+# Optional read replica for history/search/listing reads; without it the read
+# pool is a second, separately sized pool on the primary, so slow history
+# scans can't take every connection the socket handlers need for writes
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or DATABASE_URL
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_READ_POOL_MIN = int(os.getenv("DB_READ_POOL_MIN", "1"))
+DB_READ_POOL_MAX = int(os.getenv("DB_READ_POOL_MAX", "5"))  # 0 = reads share the main pool
+# Server-side backstop for every statement; queries can pass a shorter timeout=
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+# Client-side default for read-pool queries (history, search, listings)
+DB_READ_QUERY_TIMEOUT = float(os.getenv("DB_READ_QUERY_TIMEOUT", "5"))
+# Client-side limit for the main pool's hot-path queries (socket handlers,
+# presence, write-behind): a stalled connection fails the event quickly
+# instead of holding its handler until statement_timeout
+DB_HOT_QUERY_TIMEOUT = float(os.getenv("DB_HOT_QUERY_TIMEOUT", "2"))
+# Timestamp columns are naive UTC, and Python fills some of them with
+# datetime.utcnow() (write-behind created_at, edited_at, last_seen): every
+# session runs in UTC so column defaults and NOW() agree with those
+SERVER_SETTINGS = {"timezone": "UTC"}
+# asyncpg's per-connection prepared statement cache (set 0 behind pgbouncer in transaction mode)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+
+# "SELECT ... FROM messages m ..." -> "select:messages" when no name= is given
+QUERY_NAME_RE = re.compile(
+    r"^\s*(?:WITH\b.*?\)\s*)?(?:(UPDATE)\s+(\w+)|(\w+).*?\b(?:FROM|INTO)\s+(\w+))", re.I | re.S
+)
+
+
+# name -> timeout in seconds, for queries that don't pass timeout= themselves
+MAIN_QUERY_TIMEOUTS = {
+    **dict.fromkeys((
+        "message_insert", "message_ids", "message_anchor", "message_owner", "message_edit", "message_delete",
+        "message_catch_up", "channel_exists", "member_channels", "mark_read", "user_lookup", "user_lookup_many",
+        "attachment_claim", "attachment_release", "presence_heartbeat", "presence_lock", "presence_register",
+        "presence_online", "presence_unregister", "presence_offline",
+    ), DB_HOT_QUERY_TIMEOUT),
+    # Up to WRITE_BEHIND_BATCH_SIZE rows; retried on timeout (ON CONFLICT makes that safe)
+    "message_batch_insert": DB_HOT_QUERY_TIMEOUT * 5,
+}
+
+
+def query_name(query):
+    if not isinstance(query, str):
+        return "clause"
+    match = QUERY_NAME_RE.match(query)
+    if not match:
+        return "other"
+    verb, table = (match.group(1), match.group(2)) if match.group(1) else (match.group(3), match.group(4))
+    return f"{verb.lower()}:{table.lower()}"
+
+
+class QueryStats:
+    __slots__ = ("count", "errors", "timeouts", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms):
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def stats(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "avg_ms": self.total_ms / self.count if self.count else 0.0,
+            "max_ms": self.max_ms,
+        }
+
+
+class InstrumentedConnection(Connection):
+    # Times the pool acquire (the first __aenter__ of a task's connection)
+    async def __aenter__(self):
+        if self._connection_counter:
+            return await super().__aenter__()
+        start = time.perf_counter()
+        try:
+            return await super().__aenter__()
+        finally:
+            self._database.record_wait((time.perf_counter() - start) * 1000)
+
+
+class InstrumentedDatabase(Database):
+    # databases.Database plus per-query names and timeouts and pool metrics.
+    # The query methods take two optional keywords:
+    #   name=    groups latency stats (default: "<verb>:<table>" from the SQL)
+    #   timeout= seconds (default: timeouts[name], then default_timeout); the
+    #            query is cancelled (server-side too) past it
+    def __init__(self, url, label="main", statement_timeout_ms=0, default_timeout=None, timeouts=None, **options):
+        server_settings = options.setdefault("server_settings", {})
+        for key, value in SERVER_SETTINGS.items():
+            server_settings.setdefault(key, value)
+        if statement_timeout_ms:
+            server_settings["statement_timeout"] = str(statement_timeout_ms)
+        super().__init__(url, **options)
+        self.label = label
+        self.default_timeout = default_timeout or None
+        self.timeouts = timeouts or {}
+        self.queries = {}  # name -> QueryStats
+        self.acquires = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.slow_acquires = 0  # waited > 10ms for a free connection
+
+    def connection(self):
+        if self._global_connection is not None:
+            return self._global_connection
+        if not self._connection:
+            self._connection = InstrumentedConnection(self, self._backend)
+        return self._connection
+
+    def record_wait(self, ms):
+        self.acquires += 1
+        self.wait_total_ms += ms
+        if ms > self.wait_max_ms:
+            self.wait_max_ms = ms
+        if ms > 10:
+            self.slow_acquires += 1
+
+    async def _timed(self, query, name, timeout, call):
+        name = name or query_name(query)
+        stats = self.queries.get(name)
+        if stats is None:
+            stats = self.queries[name] = QueryStats()
+        start = time.perf_counter()
+        try:
+            # asyncio.timeout (not wait_for) keeps the query in this task, which
+            # is what databases keys the task's connection/transaction on
+            async with asyncio.timeout(timeout or self.timeouts.get(name) or self.default_timeout):
+                result = await call
+        except TimeoutError:
+            stats.timeouts += 1
+            raise
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            track_db_time(elapsed)  # DB time of the current request/event, for /metrics
+        stats.record(elapsed * 1000)
+        return result
+
+    async def fetch_all(self, query, values=None, *, name=None, timeout=None):
+        return await self._timed(query, name, timeout, super().fetch_all(query, values))
+
+    async def fetch_one(self, query, values=None, *, name=None, timeout=None):
+        return await self._timed(query, name, timeout, super().fetch_one(query, values))
+
+    async def fetch_val(self, query, values=None, column=0, *, name=None, timeout=None):
+        return await self._timed(query, name, timeout, super().fetch_val(query, values, column=column))
+
+    async def execute(self, query, values=None, *, name=None, timeout=None):
+        return await self._timed(query, name, timeout, super().execute(query, values))
+
+    async def execute_many(self, query, values, *, name=None, timeout=None):
+        return await self._timed(query, name, timeout, super().execute_many(query, values))
+
+    def pool_stats(self):
+        pool = getattr(self._backend, "_pool", None)
+        if pool is None:
+            return {"size": 0, "idle": 0, "active": 0, "max": 0}
+        size, idle = pool.get_size(), pool.get_idle_size()
+        return {"size": size, "idle": idle, "active": size - idle, "max": pool.get_max_size()}
+
+    def stats(self):
+        return {
+            "pool": self.pool_stats(),
+            "acquires": self.acquires,
+            "wait_avg_ms": self.wait_total_ms / self.acquires if self.acquires else 0.0,
+            "wait_max_ms": self.wait_max_ms,
+            "slow_acquires": self.slow_acquires,
+            "queries": {name: q.stats() for name, q in self.queries.items()},
+        }
+
+
+def _pool_options(min_size, max_size):
+    return {
+        "min_size": min_size,
+        "max_size": max_size,
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "statement_timeout_ms": DB_STATEMENT_TIMEOUT_MS,
+    }
+
+
+database = InstrumentedDatabase(
+    DATABASE_URL, label="main", timeouts=MAIN_QUERY_TIMEOUTS, **_pool_options(DB_POOL_MIN, DB_POOL_MAX)
+)
+if DB_READ_POOL_MAX > 0:
+    read_database = InstrumentedDatabase(
+        DATABASE_READ_URL, label="read", default_timeout=DB_READ_QUERY_TIMEOUT,
+        **_pool_options(DB_READ_POOL_MIN, DB_READ_POOL_MAX),
+    )
+else:
+    read_database = database
+
+
+async def connect_all():
+    await database.connect()
+    if read_database is not database:
+        await read_database.connect()
+
+
+async def disconnect_all():
+    if read_database is not database:
+        await read_database.disconnect()
+    await database.disconnect()
+
+
+def stats():
+    out = {"main": database.stats()}
+    if read_database is not database:
+        out["read"] = read_database.stats()
+    return out
+
+
+def metric_samples():
+    # For /metrics: pool gauges and per-query counters, labelled by pool and query name
+    pools = [database] if read_database is database else [database, read_database]
+    for db in pools:
+        pool = {"pool": db.label}
+        for state, n in db.pool_stats().items():
+            yield "db_pool_connections", {**pool, "state": state}, n
+        yield "db_pool_acquires_total", pool, db.acquires
+        yield "db_pool_wait_seconds_total", pool, db.wait_total_ms / 1000
+        yield "db_pool_wait_max_seconds", pool, db.wait_max_ms / 1000
+        for name, q in db.queries.items():
+            labels = {**pool, "query": name}
+            yield "db_queries_total", labels, q.count
+            yield "db_query_errors_total", labels, q.errors
+            yield "db_query_timeouts_total", labels, q.timeouts
+            yield "db_query_seconds_total", labels, q.total_ms / 1000
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import time
+import socketio
+from engineio import packet as eio_packet
+from socketio import packet
+from dotenv import load_dotenv
+from src.core.wire import COMPACT_EVENTS, compact_event, compact_sids
+
+load_dotenv()
+
+# Room broadcasts without python-socketio's per-recipient path (one task and
+# one send() coroutine per socket): the packet is encoded once and the same
+# Engine.IO packet object, with its encoded bytes cached, is queued on every
+# recipient's socket, where the transport writer picks it up. Sockets that
+# negotiated the compact wire format (core/wire.py) share a second encoding.
+SOCKETIO_FAST_FANOUT = os.getenv("SOCKETIO_FAST_FANOUT", "true").lower() in ("1", "true", "yes")
+# > 0: room broadcasts sent within this window go out as one "batch" frame
+FANOUT_BATCH_MS = float(os.getenv("FANOUT_BATCH_MS", "0"))
+FANOUT_BATCH_MAX = int(os.getenv("FANOUT_BATCH_MAX", "100"))
+
+
+def encode_event(server, event, data, namespace):
+    # Same argument handling as AsyncManager.emit: tuples expand to several args
+    if isinstance(data, tuple):
+        data = list(data)
+    elif data is not None:
+        data = [data]
+    else:
+        data = []
+    encoded = server.packet_class(packet.EVENT, namespace=namespace, data=[event] + data).encode()
+    if not isinstance(encoded, list):
+        encoded = [encoded]
+    packets = [eio_packet.Packet(eio_packet.MESSAGE, p) for p in encoded]
+    for p in packets:
+        p.encode()  # fills the packet's encode cache, shared by every writer
+    return packets
+
+
+class FastEmitManager(socketio.AsyncManager):
+    # Also mixed into the pub/sub managers (see pubsub.create_client_manager):
+    # their _handle_emit delivers locally through super().emit, which lands here.
+    fast_fanout = SOCKETIO_FAST_FANOUT
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fast_emits = 0
+        self.fast_deliveries = 0
+        self.compact_deliveries = 0
+
+    async def emit(self, event, data, namespace, room=None, skip_sid=None,
+                   callback=None, to=None, **kwargs):
+        if callback is not None or not self.fast_fanout:
+            # Acks need a per-recipient packet id; use the stock path
+            return await super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                                      callback=callback, to=to, **kwargs)
+        room = to or room
+        if namespace not in self.rooms:
+            return
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+        packets = encode_event(self.server, event, data, namespace)
+        # Encoded on first use: rooms without compact sockets never pay for it
+        compact = None
+        has_compact = compact_sids and event in COMPACT_EVENTS
+
+        eio = self.server.eio
+        now = time.time()
+        lagging = []
+        delivered = 0
+        compact_delivered = 0
+        for sid, eio_sid in self.get_participants(namespace, room):
+            if sid in skip_sid:
+                continue
+            sock = eio.sockets.get(eio_sid)
+            if sock is None or sock.closed or sock.closing:
+                continue
+            out = packets
+            if has_compact and sid in compact_sids:
+                if compact is None:
+                    compact = encode_event(self.server, event, compact_event(event, data), namespace)
+                out = compact
+                compact_delivered += 1
+            if sock.last_ping and now - sock.last_ping > eio.ping_timeout:
+                # Overdue pong: send() runs engine.io's timeout check and closes it
+                lagging.append((sock, out))
+                continue
+            for p in out:
+                sock.queue.put_nowait(p)
+            delivered += 1
+        for sock, out in lagging:
+            for p in out:
+                await sock.send(p)
+
+        self.fast_emits += 1
+        self.fast_deliveries += delivered
+        self.compact_deliveries += compact_delivered
+
+    def stats(self):
+        return {
+            "fast_emits": self.fast_emits,
+            "fast_deliveries": self.fast_deliveries,
+            "compact_deliveries": self.compact_deliveries,
+        }
+
+
+def with_fast_emit(manager_class):
+    # AsyncRedisManager -> FastAsyncRedisManager(AsyncRedisManager, FastEmitManager)
+    return type(f"Fast{manager_class.__name__}", (manager_class, FastEmitManager), {})
+
+
+# Coalesces room broadcasts: the first emit to a room opens a window; everything
+# emitted to that room until it closes goes out as one "batch" event carrying
+# [[event, data], ...] in order. A single queued event is sent as itself, so
+# quiet rooms see no change. Clients re-dispatch the items to their handlers.
+class BroadcastBatcher:
+    def __init__(self, sio, window_ms=0, max_batch=100):
+        self.sio = sio
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending = {}  # room -> [[event, data], ...]
+        self._timers = {}   # room -> flush task
+        self.batches = 0
+        self.batched_events = 0
+
+    async def emit(self, event, data, room):
+        if self.window <= 0:
+            return await self.sio.emit(event, data, room=room)
+        items = self._pending.setdefault(room, [])
+        items.append([event, data])
+        if len(items) >= self.max_batch:
+            timer = self._timers.pop(room, None)
+            if timer:
+                timer.cancel()
+            await self._flush(room)
+        elif room not in self._timers:
+            self._timers[room] = asyncio.create_task(self._flush_later(room))
+
+    async def _flush_later(self, room):
+        await asyncio.sleep(self.window)
+        self._timers.pop(room, None)
+        try:
+            await self._flush(room)
+        except Exception as e:
+            print(f"Error flushing broadcast batch: {e}")
+
+    async def _flush(self, room):
+        items = self._pending.pop(room, None)
+        if not items:
+            return
+        if len(items) == 1:
+            await self.sio.emit(items[0][0], items[0][1], room=room)
+            return
+        self.batches += 1
+        self.batched_events += len(items)
+        await self.sio.emit('batch', items, room=room)
+
+    async def close(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for room in list(self._pending):
+            await self._flush(room)
+
+    def stats(self):
+        return {
+            "window_ms": self.window * 1000,
+            "pending_rooms": len(self._pending),
+            "batches": self.batches,
+            "batched_events": self.batched_events,
+        }
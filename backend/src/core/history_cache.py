@@ -0,0 +1,139 @@
+﻿import os
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+from src.core.pubsub import SOCKETIO_MANAGER_URL
+
+load_dotenv()
+
+HISTORY_CACHE_PER_CHANNEL = int(os.getenv("HISTORY_CACHE_PER_CHANNEL", "50"))
+HISTORY_CACHE_MAX_MESSAGES = int(os.getenv("HISTORY_CACHE_MAX_MESSAGES", "200000"))
+# Sends only update the cache of the worker that handled them, so with a
+# cross-process client manager the cache is off unless explicitly enabled.
+HISTORY_CACHE_ENABLED = os.getenv(
+    "HISTORY_CACHE_ENABLED", "false" if SOCKETIO_MANAGER_URL else "true"
+).lower() in ("1", "true", "yes")
+
+
+class _ChannelBuffer:
+    __slots__ = ("messages", "complete")
+
+    def __init__(self, messages, complete):
+        self.messages = messages    # deque, newest first
+        self.complete = complete    # True if this is the channel's entire history
+
+
+# The newest messages of recently active channels, MessageOut-shaped and
+# newest first. A channel is only cached after being primed from the DB, so
+# a cached buffer is always an exact prefix of the channel's history.
+class HotChannelCache:
+    def __init__(self, per_channel=50, max_messages=200000, enabled=True):
+        self.per_channel = per_channel
+        self.max_messages = max_messages
+        self.enabled = enabled
+        self._channels = OrderedDict()  # channel_id -> _ChannelBuffer (LRU order)
+        self._writes = {}               # channel_id -> write counter, guards priming races
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_page(self, channel_id, limit):
+        buf = self._channels.get(channel_id) if self.enabled else None
+        if buf is None or (len(buf.messages) < limit and not buf.complete):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._channels.move_to_end(channel_id)
+        return list(buf.messages)[:limit]
+
+    def since(self, channel_id, message_id):
+        # Messages newer than message_id (newest first), or None if message_id
+        # isn't in the buffer and the caller has to ask the DB
+        buf = self._channels.get(channel_id) if self.enabled else None
+        if buf is None:
+            return None
+        newer = []
+        for m in buf.messages:
+            if m["id"] == message_id:
+                self.hits += 1
+                return newer
+            newer.append(m)
+        return None
+
+    def write_marker(self, channel_id):
+        # Taken before the priming query; prime() is skipped if a write landed meanwhile
+        return self._writes.get(channel_id, 0)
+
+    def prime(self, channel_id, rows, marker):
+        # rows: the newest messages (newest first), fetched with limit=per_channel
+        if not self.enabled or self._writes.get(channel_id, 0) != marker:
+            return
+        self._drop(channel_id)
+        buf = _ChannelBuffer(deque(rows[:self.per_channel], maxlen=self.per_channel), len(rows) < self.per_channel)
+        self._channels[channel_id] = buf
+        self._total += len(buf.messages)
+        self._evict()
+
+    def append(self, message):
+        channel_id = message["channel_id"]
+        self._writes[channel_id] = self._writes.get(channel_id, 0) + 1
+        buf = self._channels.get(channel_id)
+        if buf is None:
+            return
+        if len(buf.messages) == self.per_channel:
+            buf.complete = False
+        else:
+            self._total += 1
+        buf.messages.appendleft(message)
+        self._channels.move_to_end(channel_id)
+        self._evict()
+
+    def edit(self, channel_id, message_id, content, edited_at):
+        self._writes[channel_id] = self._writes.get(channel_id, 0) + 1
+        buf = self._channels.get(channel_id)
+        if buf is None:
+            return
+        for m in buf.messages:
+            if m["id"] == message_id:
+                m["content"] = content
+                m["edited_at"] = edited_at
+                return
+
+    def remove(self, channel_id, message_id):
+        self._writes[channel_id] = self._writes.get(channel_id, 0) + 1
+        buf = self._channels.get(channel_id)
+        if buf is None:
+            return
+        for m in buf.messages:
+            if m["id"] == message_id:
+                buf.messages.remove(m)
+                self._total -= 1
+                return
+
+    def _drop(self, channel_id):
+        buf = self._channels.pop(channel_id, None)
+        if buf is not None:
+            self._total -= len(buf.messages)
+
+    def _evict(self):
+        while self._total > self.max_messages and self._channels:
+            _, buf = self._channels.popitem(last=False)
+            self._total -= len(buf.messages)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "channels": len(self._channels),
+            "messages": self._total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+history_cache = HotChannelCache(
+    per_channel=HISTORY_CACHE_PER_CHANNEL,
+    max_messages=HISTORY_CACHE_MAX_MESSAGES,
+    enabled=HISTORY_CACHE_ENABLED,
+)
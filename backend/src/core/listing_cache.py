@@ -0,0 +1,71 @@
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
+
+
+class CachedListing:
+    __slots__ = ("body", "etag", "next_cursor", "expires_at")
+
+    def __init__(self, body, etag, next_cursor, expires_at):
+        self.body = body
+        self.etag = etag
+        self.next_cursor = next_cursor
+        self.expires_at = expires_at
+
+
+# Serialized listing pages keyed by query params. Any write calls bump(), which
+# drops every page and changes every ETag. The TTL bounds staleness for writes
+# made by other workers, and the per-process epoch in the ETag keeps one
+# worker's tags from matching another's.
+class ListingCache:
+    def __init__(self, ttl=30.0, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._epoch = uuid.uuid4().hex[:8]
+        self._version = 0
+        self._entries = OrderedDict()  # key -> CachedListing (LRU order)
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def bump(self):
+        self._version += 1
+        self._entries.clear()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, body: bytes, next_cursor=None):
+        self._entries.pop(key, None)
+        while len(self._entries) >= self.max_entries:
+            self._entries.popitem(last=False)
+        digest = hashlib.sha1(repr(key).encode() + body).hexdigest()[:16]
+        entry = CachedListing(
+            body=body,
+            etag=f'W/"{self._epoch}-{self._version}-{digest}"',
+            next_cursor=next_cursor,
+            expires_at=time.monotonic() + self.ttl,
+        )
+        self._entries[key] = entry
+        return entry
+
+    def matches(self, entry, if_none_match):
+        if not if_none_match:
+            return False
+        tags = [t.strip() for t in if_none_match.split(",")]
+        if entry.etag in tags or "*" in tags:
+            self.not_modified += 1
+            return True
+        return False
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "not_modified": self.not_modified}
@@ -0,0 +1,272 @@
+﻿import asyncio
+import os
+from datetime import datetime
+from asyncpg.exceptions import DataError, IntegrityConstraintViolationError
+from dotenv import load_dotenv
+from src.core.database import database
+
+load_dotenv()
+
+# Opt-in: assign ids/timestamps in-process, broadcast immediately and let a
+# background task persist messages in multi-row batches.
+WRITE_BEHIND_ENABLED = os.getenv("MESSAGE_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_FLUSH_MS = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "50"))
+# Queue bound: send_message waits once this many messages are unflushed
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+# Tries for a batch that fails on a transient error (connection lost, timeout)
+# before its messages are dropped; 0 = retry forever
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "10"))
+# How long shutdown waits for the queue to flush before giving up on it
+WRITE_BEHIND_STOP_TIMEOUT = float(os.getenv("WRITE_BEHIND_STOP_TIMEOUT", "10"))
+# "broadcast": ack as soon as the message is queued and fanned out
+# "persisted": also wait for the batch holding the message to commit
+WRITE_BEHIND_ACK = os.getenv("WRITE_BEHIND_ACK", "broadcast")
+ID_BLOCK_SIZE = int(os.getenv("WRITE_BEHIND_ID_BLOCK", "100"))
+
+# Errors caused by a row's data: retrying the same batch can never succeed,
+# so the batch is split until the bad rows are found and dropped
+ROW_ERRORS = (IntegrityConstraintViolationError, DataError)
+
+
+class MessageWriter:
+    def __init__(self, batch_size=200, flush_interval=0.05, max_pending=10000,
+                 max_retries=10, id_block_size=100, ack_persisted=False, stop_timeout=10.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.stop_timeout = stop_timeout
+        self.id_block_size = id_block_size
+        self.ack_persisted = ack_persisted
+
+        self._queue = None
+        self._task = None
+        self._on_drop = None
+        self._ids = []
+        self._id_lock = asyncio.Lock()
+        # id -> record for everything queued but not yet committed
+        self._pending = {}
+        # ids of the batch currently being written
+        self._inflight = set()
+
+        self.flushed_batches = 0
+        self.flushed_messages = 0
+        self.failed_batches = 0
+        self.dropped_messages = 0
+
+    async def start(self, on_drop=None):
+        # on_drop(record) is called for each message that could not be written
+        # (already broadcast, so the caller can retract it)
+        self._on_drop = on_drop
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Flush whatever is still queued before the pool goes away, but don't
+        # hang shutdown on a database that is down
+        if not self._task:
+            return
+        try:
+            async with asyncio.timeout(self.stop_timeout):
+                await self._queue.put(None)
+                await self._task
+        except TimeoutError:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            print(f"Message writer stopped with {len(self._pending)} messages unwritten")
+        self._task = None
+
+    async def _next_id(self):
+        async with self._id_lock:
+            if not self._ids:
+                # Reserve a block of ids from the table's own sequence in one round-trip
+                rows = await database.fetch_all(
+                    "SELECT nextval(pg_get_serial_sequence('messages', 'id')) AS id "
+                    "FROM generate_series(1, :n)",
+                    values={"n": self.id_block_size},
+                    name="message_ids",
+                )
+                self._ids = [row["id"] for row in reversed(rows)]
+            return self._ids.pop()
+
+    async def submit(self, channel_id: int, user_id: int, content: str):
+        record = {
+            "id": await self._next_id(),
+            "channel_id": channel_id,
+            "user_id": user_id,
+            "content": content,
+            # Naive UTC, like the column default on the synchronous path
+            # (sessions are pinned to UTC, see database.SERVER_SETTINGS)
+            "created_at": datetime.utcnow(),
+            "edited_at": None,
+            "persisted": asyncio.get_running_loop().create_future(),
+        }
+        self._pending[record["id"]] = record
+        # Blocks when max_pending messages are waiting: this is the backpressure
+        await self._queue.put(record)
+        return record
+
+    def pending(self, msg_id):
+        return self._pending.get(msg_id)
+
+    def pending_since(self, channel_id, created_at, msg_id):
+        # Queued messages of a channel after (created_at, msg_id), for
+        # reconnect catch-up: they were broadcast but aren't in the DB yet
+        return [
+            {k: v for k, v in r.items() if k != "persisted"}
+            for r in self._pending.values()
+            if r["channel_id"] == channel_id and (r["created_at"], r["id"]) > (created_at, msg_id)
+        ]
+
+    def discard(self, msg_id):
+        # Drop a message that has not reached the DB yet (e.g. deleted right away).
+        # Returns False if it is mid-flush; the caller must wait and delete it from the DB.
+        if msg_id in self._inflight:
+            return False
+        record = self._pending.pop(msg_id, None)
+        if record and not record["persisted"].done():
+            record["persisted"].set_result(False)
+        return record is not None
+
+    def edit(self, msg_id, content, edited_at):
+        # Patch a message that has not reached the DB yet; same contract as discard()
+        if msg_id in self._inflight:
+            return False
+        record = self._pending.get(msg_id)
+        if record is None:
+            return False
+        record["content"] = content
+        record["edited_at"] = edited_at
+        return True
+
+    async def wait_persisted(self, record):
+        return await record["persisted"]
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "flushed_batches": self.flushed_batches,
+            "flushed_messages": self.flushed_messages,
+            "failed_batches": self.failed_batches,
+            "dropped_messages": self.dropped_messages,
+        }
+
+    async def _run(self):
+        while True:
+            first = await self._queue.get()
+            if first is None:
+                return
+            if self._queue.qsize() < self.batch_size:
+                # Give the batch a short window to fill up
+                await asyncio.sleep(self.flush_interval)
+
+            batch = [first]
+            stop = False
+            while len(batch) < self.batch_size and not self._queue.empty():
+                record = self._queue.get_nowait()
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+
+            await self._flush(batch)
+            if stop:
+                # Drain anything queued behind the stop marker too
+                rest = []
+                while not self._queue.empty():
+                    record = self._queue.get_nowait()
+                    if record is not None:
+                        rest.append(record)
+                for i in range(0, len(rest), self.batch_size):
+                    await self._flush(rest[i:i + self.batch_size])
+                return
+
+    async def _flush(self, batch):
+        batch = [r for r in batch if r["id"] in self._pending]
+        if not batch:
+            return
+
+        self._inflight = {r["id"] for r in batch}
+        try:
+            written = await self._write(batch)
+        finally:
+            self._inflight = set()
+
+        if written:
+            self.flushed_batches += 1
+            self.flushed_messages += len(written)
+        for r in batch:
+            self._pending.pop(r["id"], None)
+            ok = r["id"] in written
+            if not r["persisted"].done():
+                r["persisted"].set_result(ok)
+            if not ok:
+                self.dropped_messages += 1
+                if self._on_drop:
+                    try:
+                        await self._on_drop(r)
+                    except Exception as e:
+                        print(f"Error retracting dropped message {r['id']}: {e}")
+
+    async def _write(self, batch):
+        # -> ids written. A row error splits the batch in halves until the bad
+        # rows are isolated, so the rest of the batch still gets written
+        try:
+            await self._insert(batch)
+            return {r["id"] for r in batch}
+        except ROW_ERRORS as e:
+            if len(batch) == 1:
+                r = batch[0]
+                print(f"Dropping message {r['id']} (channel {r['channel_id']}, user {r['user_id']}): {e}")
+                return set()
+            mid = len(batch) // 2
+            return await self._write(batch[:mid]) | await self._write(batch[mid:])
+        except Exception as e:
+            print(f"Dropping {len(batch)} messages after {self.max_retries} tries: {e}")
+            return set()
+
+    async def _insert(self, batch):
+        rows, values = [], {}
+        for i, r in enumerate(batch):
+            rows.append(f"(:id{i}, :cid{i}, :uid{i}, :content{i}, :ts{i}, :edited{i})")
+            values.update({
+                f"id{i}": r["id"], f"cid{i}": r["channel_id"], f"uid{i}": r["user_id"],
+                f"content{i}": r["content"], f"ts{i}": r["created_at"], f"edited{i}": r["edited_at"],
+            })
+        # ON CONFLICT makes retries of a partially-applied batch idempotent
+        query = f"""
+            INSERT INTO messages (id, channel_id, user_id, content, created_at, edited_at)
+            VALUES {", ".join(rows)}
+            ON CONFLICT DO NOTHING
+        """
+
+        attempt = 0
+        while True:
+            try:
+                await database.execute(query=query, values=values, name="message_batch_insert")
+                return
+            except ROW_ERRORS:
+                self.failed_batches += 1
+                raise
+            except Exception as e:
+                attempt += 1
+                self.failed_batches += 1
+                print(f"Error flushing {len(batch)} messages (attempt {attempt}): {e}")
+                if self.max_retries and attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(min(0.1 * 2 ** attempt, 5))
+
+
+message_writer = MessageWriter(
+    batch_size=WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=WRITE_BEHIND_FLUSH_MS / 1000,
+    max_pending=WRITE_BEHIND_MAX_PENDING,
+    max_retries=WRITE_BEHIND_MAX_RETRIES,
+    id_block_size=ID_BLOCK_SIZE,
+    ack_persisted=WRITE_BEHIND_ACK == "persisted",
+    stop_timeout=WRITE_BEHIND_STOP_TIMEOUT,
+)
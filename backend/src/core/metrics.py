@@ -0,0 +1,276 @@
+import asyncio
+import inspect
+import os
+import re
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Prometheus text-format metrics for /metrics. Hot paths only do a couple of
+# perf_counter() calls, a dict lookup and a bisect per event/request; gauges
+# from the other modules' stats() are only read when /metrics is scraped.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # if set, scrapes need "Authorization: Bearer <token>"
+METRICS_MAX_ROOMS = int(os.getenv("METRICS_MAX_ROOMS", "50"))  # largest rooms exported by name
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PREFIX = "teachat"
+
+# Seconds spent in DB queries by the current request / socket event
+_db_time = ContextVar("db_time", default=None)
+
+
+def track_db_time(seconds):
+    # Called by the instrumented database for every query
+    acc = _db_time.get()
+    if acc is not None:
+        acc[0] += seconds
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot: above the largest bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+        lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {self.count}')
+        lines.append(f'{name}_sum{_labels(labels)} {self.sum}')
+        lines.append(f'{name}_count{_labels(labels)} {self.count}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, **extra):
+    items = {**labels, **extra}
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items.items()) + "}"
+
+
+def _metric_name(*parts):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", "_".join(p for p in parts if p))
+
+
+class Metrics:
+    def __init__(self):
+        self.events = {}         # event -> Histogram (handler time)
+        self.event_db = {}       # event -> Histogram (DB time inside the handler)
+        self.event_errors = {}   # event -> count
+        self.requests = {}       # (method, route, status) -> Histogram
+        self.request_db = {}     # (method, route) -> Histogram
+        self.loop_lag = Histogram()
+        self.loop_lag_max = 0.0  # since the last scrape
+        self._collectors = []    # (prefix, fn -> dict of numbers, nested ok)
+        self._samplers = []      # fn -> [(name, labels, value)]
+        self._lag_task = None
+
+    # --- hot path ---
+
+    def observe_event(self, event, seconds, db_seconds, failed):
+        hist = self.events.get(event)
+        if hist is None:
+            hist = self.events[event] = Histogram()
+            self.event_db[event] = Histogram()
+        hist.observe(seconds)
+        self.event_db[event].observe(db_seconds)
+        if failed:
+            self.event_errors[event] = self.event_errors.get(event, 0) + 1
+
+    def observe_request(self, method, route, status, seconds, db_seconds):
+        key = (method, route, status)
+        hist = self.requests.get(key)
+        if hist is None:
+            hist = self.requests[key] = Histogram()
+        hist.observe(seconds)
+        db_hist = self.request_db.get((method, route))
+        if db_hist is None:
+            db_hist = self.request_db[(method, route)] = Histogram()
+        db_hist.observe(db_seconds)
+
+    # --- scrape-time sources ---
+
+    def register(self, prefix, fn):
+        # fn() -> a module's stats() dict; numbers (and bools) become gauges
+        self._collectors.append((prefix, fn))
+
+    def register_samples(self, fn):
+        # fn() -> [(metric name without prefix, labels dict, value)]
+        self._samplers.append(fn)
+
+    # --- event loop lag ---
+
+    async def start(self):
+        if METRICS_ENABLED and LOOP_LAG_INTERVAL > 0:
+            self._lag_task = asyncio.create_task(self._watch_loop_lag())
+
+    async def stop(self):
+        if self._lag_task:
+            self._lag_task.cancel()
+            try:
+                await self._lag_task
+            except asyncio.CancelledError:
+                pass
+            self._lag_task = None
+
+    async def _watch_loop_lag(self):
+        # How late a sleep wakes up = how long something else held the loop
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            lag = max(0.0, time.perf_counter() - start - LOOP_LAG_INTERVAL)
+            self.loop_lag.observe(lag)
+            if lag > self.loop_lag_max:
+                self.loop_lag_max = lag
+
+    # --- exposition ---
+
+    def render(self):
+        out = []
+
+        def histograms(name, help_text, items):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} histogram")
+            for labels, hist in items:
+                out.extend(hist.render(name, labels))
+
+        histograms(f"{PREFIX}_socket_event_seconds", "Socket.IO event handler time",
+                   [({"event": e}, h) for e, h in self.events.items()])
+        histograms(f"{PREFIX}_socket_event_db_seconds", "DB time per Socket.IO event",
+                   [({"event": e}, h) for e, h in self.event_db.items()])
+        out.append(f"# TYPE {PREFIX}_socket_event_errors_total counter")
+        for event, n in self.event_errors.items():
+            out.append(f'{PREFIX}_socket_event_errors_total{_labels({"event": event})} {n}')
+        histograms(f"{PREFIX}_http_request_seconds", "HTTP request time by route",
+                   [({"method": m, "route": r, "status": s}, h) for (m, r, s), h in self.requests.items()])
+        histograms(f"{PREFIX}_http_request_db_seconds", "DB time per HTTP request",
+                   [({"method": m, "route": r}, h) for (m, r), h in self.request_db.items()])
+        histograms(f"{PREFIX}_event_loop_lag_seconds", "Event loop wake-up delay", [({}, self.loop_lag)])
+        out.append(f"# TYPE {PREFIX}_event_loop_lag_max_seconds gauge")
+        out.append(f"{PREFIX}_event_loop_lag_max_seconds {self.loop_lag_max}")
+        self.loop_lag_max = 0.0
+
+        families = {}  # samples of one metric have to be listed together
+        for fn in self._samplers:
+            try:
+                for name, labels, value in fn():
+                    families.setdefault(name, []).append(f"{_metric_name(PREFIX, name)}{_labels(labels)} {value}")
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+        for lines in families.values():
+            out.extend(lines)
+        for prefix, fn in self._collectors:
+            try:
+                self._flatten(out, _metric_name(PREFIX, prefix), fn())
+            except Exception as e:
+                print(f"Error collecting {prefix} metrics: {e}")
+        return "\n".join(out) + "\n"
+
+    def _flatten(self, out, name, value):
+        if isinstance(value, dict):
+            for key, child in value.items():
+                self._flatten(out, _metric_name(name, str(key)), child)
+        elif isinstance(value, (bool, int, float)):
+            out.append(f"{name} {float(value)}")
+
+
+metrics = Metrics()
+
+
+def instrument_handlers(sio, namespace="/"):
+    # Wraps every registered Socket.IO handler with timing; call once after
+    # the handlers are defined
+    if not METRICS_ENABLED:
+        return
+    handlers = sio.handlers.get(namespace, {})
+    for event, handler in list(handlers.items()):
+        handlers[event] = _timed_handler(event, handler)
+
+
+def _timed_handler(event, handler):
+    # python-socketio picks how many args to pass by retrying on TypeError
+    # (e.g. disconnect(sid) vs disconnect(sid, reason)); the wrapper takes
+    # any count, so trim to what the handler accepts instead
+    params = inspect.signature(handler).parameters.values()
+    if any(p.kind == p.VAR_POSITIONAL for p in params):
+        arity = None
+    else:
+        arity = sum(p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) for p in params)
+
+    async def timed(*args):
+        if arity is not None:
+            args = args[:arity]
+        acc = [0.0]
+        token = _db_time.set(acc)
+        start = time.perf_counter()
+        failed = False
+        try:
+            return await handler(*args)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            metrics.observe_event(event, time.perf_counter() - start, acc[0], failed)
+            _db_time.reset(token)
+    timed.__name__ = handler.__name__
+    return timed
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware (no BaseHTTPMiddleware task/stream overhead).
+    # Routes are labelled by their path template, so /api/messages/12 and
+    # /api/messages/13 land in the same series.
+    def __init__(self, app, skip_prefixes=("/socket.io", "/metrics")):
+        self.app = app
+        self.skip_prefixes = skip_prefixes
+        self._routes = None  # endpoint -> path template
+
+    async def __call__(self, scope, receive, send):
+        if not METRICS_ENABLED or scope["type"] != "http" or scope["path"].startswith(self.skip_prefixes):
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        acc = [0.0]
+        token = _db_time.set(acc)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.observe_request(scope["method"], self._route(scope), status, time.perf_counter() - start, acc[0])
+            _db_time.reset(token)
+
+    def _route(self, scope):
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._routes is None:
+            app = scope.get("app")
+            self._routes = {
+                getattr(r, "endpoint", None): r.path for r in getattr(app, "routes", []) if hasattr(r, "path")
+            }
+        return self._routes.get(endpoint, getattr(endpoint, "__name__", "unknown"))
@@ -0,0 +1,51 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Optional, Tuple
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# Cursors are opaque to clients: "<created_at iso>,<id>" in urlsafe base64.
+# For convenience we also accept the raw forms "<id>" and "<created_at>,<id>".
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()},{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    # Returns (created_at, id); created_at is None when only an id was given
+    cursor = cursor.strip()
+    if cursor.isdigit():
+        return None, int(cursor)
+
+    raw = cursor
+    if "," not in cursor:
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        except (binascii.Error, UnicodeDecodeError):
+            raise InvalidCursor(cursor)
+
+    try:
+        ts, row_id = raw.rsplit(",", 1)
+        return datetime.fromisoformat(ts), int(row_id)
+    except ValueError:
+        raise InvalidCursor(cursor)
+
+
+# Same idea for lists ordered by a text key (e.g. usernames): "<key>,<id>"
+def encode_text_cursor(key: str, row_id: int) -> str:
+    raw = f"{key},{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_text_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        padded = cursor.strip() + "=" * (-len(cursor.strip()) % 4)
+        key, row_id = base64.urlsafe_b64decode(padded.encode()).decode().rsplit(",", 1)
+        return key, int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(cursor)
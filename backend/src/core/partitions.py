@@ -0,0 +1,217 @@
+import asyncio
+import gzip
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+import asyncpg
+from dotenv import load_dotenv
+from src.core.database import DATABASE_URL, SERVER_SETTINGS
+
+load_dotenv()
+
+# Upkeep for the monthly messages partitions (migration 008): keep a few
+# months created ahead of time, and detach, archive and drop the months that
+# fall out of the retention window.
+MESSAGE_PARTITIONS_AHEAD = int(os.getenv("MESSAGE_PARTITIONS_AHEAD", "3"))
+MESSAGE_RETENTION_MONTHS = int(os.getenv("MESSAGE_RETENTION_MONTHS", "0"))  # 0 = keep forever
+MESSAGE_ARCHIVE_DIR = os.getenv("MESSAGE_ARCHIVE_DIR", "archive")
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "3600"))
+PARTITION_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")
+
+ADVISORY_LOCK_ID = 0x7EAC4A8  # one maintainer at a time across workers
+UPPER_BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+ARCHIVABLE_RE = r"^messages_(p[0-9]{4}_[0-9]{2}|legacy)$"
+
+
+def month_start(dt):
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(dt, months):
+    years, month = divmod(dt.month - 1 + months, 12)
+    return dt.replace(year=dt.year + years, month=month + 1)
+
+
+def partition_name(month):
+    return f"messages_p{month:%Y_%m}"
+
+
+class PartitionMaintainer:
+    def __init__(self, url, months_ahead=3, retention_months=0, archive_dir="archive",
+                 interval=3600, lock_timeout="5s"):
+        self.url = url
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self.archive_dir = Path(archive_dir)
+        self.interval = interval
+        self.lock_timeout = lock_timeout
+        self._task = None
+        self.created = 0
+        self.archived = 0
+        self.last_run = None
+
+    async def start(self):
+        if self.interval <= 0:
+            return  # maintenance runs externally (python -m src.core.partitions)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Error maintaining message partitions: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self, now=None):
+        conn = await asyncpg.connect(self.url, server_settings=SERVER_SETTINGS)
+        try:
+            # Every worker runs this loop; whoever gets the lock does the work
+            if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", ADVISORY_LOCK_ID):
+                return
+            partitioned = await conn.fetchval(
+                "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('messages')"
+            )
+            if not partitioned:
+                return  # migration 008 not applied yet
+            await conn.execute(f"SET lock_timeout = '{self.lock_timeout}'")
+            now = now or datetime.utcnow()
+            await self._finalize_pending_detach(conn)
+            await self._create_ahead(conn, now)
+            if self.retention_months > 0:
+                await self._archive_expired(conn, now)
+            self.last_run = now
+        finally:
+            # Closing the session also releases the advisory lock
+            await conn.close()
+
+    async def _partitions(self, conn):
+        # name -> upper bound of its created_at range
+        rows = await conn.fetch(
+            """
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'messages'::regclass
+            """
+        )
+        bounds = {}
+        for r in rows:
+            match = UPPER_BOUND_RE.search(r["bound"] or "")
+            if match:
+                bounds[r["relname"]] = datetime.fromisoformat(match.group(1))
+        return bounds
+
+    async def _create_ahead(self, conn, now):
+        bounds = await self._partitions(conn)
+        upper = max(bounds.values(), default=month_start(now))
+        target = add_months(month_start(now), self.months_ahead + 1)
+        while upper < target:
+            nxt = add_months(month_start(upper), 1)
+            await conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(upper)} PARTITION OF messages "
+                f"FOR VALUES FROM ('{upper.isoformat()}') TO ('{nxt.isoformat()}')"
+            )
+            print(f"🗂️  Created partition {partition_name(upper)}")
+            self.created += 1
+            upper = nxt
+
+    async def _finalize_pending_detach(self, conn):
+        # An interrupted DETACH ... CONCURRENTLY leaves the partition half-detached
+        if conn.get_server_version().major < 14:
+            return
+        pending = await conn.fetch(
+            """
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'messages'::regclass AND i.inhdetachpending
+            """
+        )
+        for r in pending:
+            await conn.execute(f'ALTER TABLE messages DETACH PARTITION "{r["relname"]}" FINALIZE')
+
+    async def _archive_expired(self, conn, now):
+        cutoff = add_months(month_start(now), -self.retention_months)
+        for name, upper in (await self._partitions(conn)).items():
+            if upper <= cutoff:
+                await self._detach(conn, name)
+
+        # Detached earlier but not archived yet (e.g. a failed write) are retried too
+        detached = await conn.fetch(
+            """
+            SELECT relname FROM pg_class
+            WHERE relkind = 'r' AND NOT relispartition AND relname ~ $1
+              AND relnamespace = current_schema()::regnamespace
+            ORDER BY relname
+            """,
+            ARCHIVABLE_RE,
+        )
+        for r in detached:
+            await self._archive(conn, r["relname"])
+
+    async def _detach(self, conn, name):
+        # CONCURRENTLY (PG 14+) only locks the parent briefly, so history
+        # queries keep running while the month is taken out
+        concurrently = " CONCURRENTLY" if conn.get_server_version().major >= 14 else ""
+        await conn.execute(f'ALTER TABLE messages DETACH PARTITION "{name}"{concurrently}')
+        print(f"🗂️  Detached partition {name}")
+
+    async def _archive(self, conn, table):
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        path = self.archive_dir / f"{table}.csv.gz"
+        tmp = path.with_name(path.name + ".tmp")
+        loop = asyncio.get_running_loop()
+        raw = await loop.run_in_executor(None, open, tmp, "wb")
+        gz = gzip.GzipFile(fileobj=raw, mode="wb")
+
+        async def write(chunk):
+            # Compression runs off the event loop
+            await loop.run_in_executor(None, gz.write, chunk)
+
+        def finish():
+            gz.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+            raw.close()
+
+        try:
+            status = await conn.copy_from_table(table, output=write, format="csv", header=True)
+        finally:
+            await loop.run_in_executor(None, finish)
+        # Only a complete archive gets the final name, and only then is the table dropped
+        os.replace(tmp, path)
+        await conn.execute(f'DROP TABLE "{table}"')
+        self.archived += 1
+        print(f"🗂️  Archived {table} ({status.split()[-1]} rows) to {path}")
+
+    def stats(self):
+        return {
+            "months_ahead": self.months_ahead,
+            "retention_months": self.retention_months,
+            "created": self.created,
+            "archived": self.archived,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+        }
+
+
+partition_maintainer = PartitionMaintainer(
+    DATABASE_URL,
+    months_ahead=MESSAGE_PARTITIONS_AHEAD,
+    retention_months=MESSAGE_RETENTION_MONTHS,
+    archive_dir=MESSAGE_ARCHIVE_DIR,
+    interval=PARTITION_MAINTENANCE_INTERVAL,
+    lock_timeout=PARTITION_LOCK_TIMEOUT,
+)
+
+
+if __name__ == "__main__":
+    # One-off run, e.g. from cron instead of the in-app loop
+    asyncio.run(partition_maintainer.run_once())
@@ -0,0 +1,276 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+from dotenv import load_dotenv
+from src.core.database import database
+
+load_dotenv()
+
+PRESENCE_FLUSH_INTERVAL = float(os.getenv("PRESENCE_FLUSH_INTERVAL", "1.0"))
+# A user whose last socket closes stays "online" this long, so tab reloads
+# and reconnect storms after a deploy don't flap their status
+PRESENCE_GRACE_PERIOD = float(os.getenv("PRESENCE_GRACE_PERIOD", "5.0"))
+# A worker that hasn't heartbeated (once per flush) for this long is presumed
+# dead, and its users count as disconnected from it
+PRESENCE_WORKER_TTL = float(os.getenv("PRESENCE_WORKER_TTL", "30"))
+
+
+# In-memory presence for the sockets connected to this process. Which users
+# each worker has sockets for is shared through presence_sockets (migration
+# 011), so a user is only reported offline once no worker has them.
+class PresenceRegistry:
+    def __init__(self, flush_interval=1.0, grace_period=5.0, worker_ttl=30.0):
+        self.flush_interval = flush_interval
+        self.grace_period = grace_period
+        self.worker_ttl = worker_ttl
+        self.worker_id = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._last_reap = 0.0
+        self._sockets = {}         # user_id -> set of sids
+        self._offline_since = {}   # user_id -> monotonic time the last socket closed
+        self._published = {}       # user_id -> last state we broadcast/persisted
+        self._channels = {}        # user_id -> set of channel ids (who should hear about them)
+        self._dirty = set()
+        self._emit = None
+        self._task = None
+        self.batches = 0
+        self.updates = 0
+        self.reaped_workers = 0
+
+    def is_online(self, user_id):
+        return bool(self._sockets.get(user_id)) or user_id in self._offline_since
+
+    def sids_of(self, user_id):
+        return list(self._sockets.get(user_id, ()))
+
+    def online_users(self):
+        return [uid for uid, sids in self._sockets.items() if sids]
+
+    def set_channels(self, user_id, channel_ids):
+        self._channels[user_id] = set(channel_ids)
+
+    def add_channel(self, user_id, channel_id):
+        self._channels.setdefault(user_id, set()).add(channel_id)
+
+    def channels_of(self, user_id):
+        return self._channels.get(user_id, set())
+
+    def connect(self, user_id, sid):
+        sids = self._sockets.setdefault(user_id, set())
+        sids.add(sid)
+        # Reconnected within the grace period: nothing to announce
+        self._offline_since.pop(user_id, None)
+        if len(sids) == 1:
+            self._dirty.add(user_id)
+
+    def disconnect(self, user_id, sid):
+        sids = self._sockets.get(user_id)
+        if not sids:
+            return
+        sids.discard(sid)
+        if not sids:
+            del self._sockets[user_id]
+            self._offline_since[user_id] = time.monotonic()
+
+    async def start(self, emit):
+        # emit(updates) is called with every batch of status changes
+        self._emit = emit
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Whatever is left gets persisted; expire grace periods immediately.
+        # Errors are only logged: shutdown still has to drain the message
+        # writer, and other workers reap our rows once the heartbeat stops
+        try:
+            await self.flush(expire_all=True)
+        except Exception as e:
+            print(f"Error flushing presence on shutdown: {e}")
+        try:
+            await database.execute(
+                "DELETE FROM presence_workers WHERE worker_id = :wid", values={"wid": self.worker_id}
+            )
+        except Exception as e:
+            print(f"Error unregistering presence worker: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_reap >= self.worker_ttl / 2:
+                    self._last_reap = time.monotonic()
+                    await self.reap()
+            except Exception as e:
+                print(f"Error flushing presence: {e}")
+
+    async def flush(self, expire_all=False):
+        now = time.monotonic()
+        for uid, since in list(self._offline_since.items()):
+            if expire_all or now - since >= self.grace_period:
+                del self._offline_since[uid]
+                self._dirty.add(uid)
+
+        dirty, self._dirty = self._dirty, set()
+        seen_at = datetime.utcnow()
+        online, offline = [], []
+        for uid in dirty:
+            state = self.is_online(uid)
+            # Coalesce: only real transitions since the last batch go out
+            if self._published.get(uid, False) == state:
+                continue
+            (online if state else offline).append(uid)
+
+        try:
+            # Heartbeat every tick, so other workers know our rows are live
+            beat = await database.fetch_one(
+                """
+                INSERT INTO presence_workers (worker_id) VALUES (:wid)
+                ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = NOW()
+                RETURNING (xmax = 0) AS created
+                """,
+                values={"wid": self.worker_id},
+                name="presence_heartbeat",
+            )
+            if beat["created"]:
+                # Other workers reaped us after missed heartbeats (our rows
+                # went with it): register everyone connected here again
+                online += [uid for uid in self._published if self.is_online(uid)]
+            if not online and not offline:
+                return
+            gone = await self._persist(online, offline, seen_at)
+        except Exception:
+            # Retry these users on the next tick
+            self._dirty |= dirty
+            raise
+
+        for uid in online:
+            self._published[uid] = True
+        for uid in offline:
+            # Offline is the default, so the map only holds online users
+            self._published.pop(uid, None)
+        # A user still connected to another worker stays online: no update
+        updates = [{"user_id": uid, "is_online": True, "last_seen": seen_at.isoformat()} for uid in online]
+        updates += [{"user_id": uid, "is_online": False, "last_seen": seen_at.isoformat()} for uid in gone]
+        await self._publish(updates)
+        # Membership is only needed while someone may still hear about the user
+        for uid in offline:
+            if not self._sockets.get(uid):
+                self._channels.pop(uid, None)
+
+    async def _publish(self, updates):
+        if not updates:
+            return
+        self.batches += 1
+        self.updates += len(updates)
+        if self._emit:
+            await self._emit(updates)
+
+    async def _persist(self, online, offline, seen_at):
+        # -> the users in offline that no worker has a socket for any more
+        async with database.transaction():
+            await self._lock(online + offline)
+            if online:
+                await database.execute(
+                    """
+                    INSERT INTO presence_sockets (user_id, worker_id)
+                    SELECT id, :wid FROM users WHERE id = ANY(:ids)
+                    ON CONFLICT DO NOTHING
+                    """,
+                    values={"wid": self.worker_id, "ids": online},
+                    name="presence_register",
+                )
+                await database.execute(
+                    "UPDATE users SET is_online = TRUE, last_seen = :seen WHERE id = ANY(:ids)",
+                    values={"ids": online, "seen": seen_at},
+                    name="presence_online",
+                )
+            if not offline:
+                return []
+            await database.execute(
+                "DELETE FROM presence_sockets WHERE worker_id = :wid AND user_id = ANY(:ids)",
+                values={"wid": self.worker_id, "ids": offline},
+                name="presence_unregister",
+            )
+            return await self._mark_offline(offline, seen_at)
+
+    async def reap(self):
+        # Workers that died without a clean shutdown: drop their rows and mark
+        # their users offline unless another worker has them. The updates
+        # only reach users this worker knows the channels of.
+        seen_at = datetime.utcnow()
+        async with database.transaction():
+            rows = await database.fetch_all(
+                """
+                SELECT DISTINCT p.user_id FROM presence_sockets p
+                JOIN presence_workers w ON w.worker_id = p.worker_id
+                WHERE w.heartbeat_at <= NOW() - make_interval(secs => :ttl)
+                """,
+                values={"ttl": self.worker_ttl},
+                name="presence_stale",
+            )
+            user_ids = [row["user_id"] for row in rows]
+            await self._lock(user_ids)
+            workers = await database.fetch_all(
+                """
+                DELETE FROM presence_workers
+                WHERE heartbeat_at <= NOW() - make_interval(secs => :ttl)
+                RETURNING worker_id
+                """,
+                values={"ttl": self.worker_ttl},
+                name="presence_reap",
+            )
+            gone = await self._mark_offline(user_ids, seen_at) if user_ids else []
+        self.reaped_workers += len(workers)
+        await self._publish([
+            {"user_id": uid, "is_online": False, "last_seen": seen_at.isoformat()} for uid in gone
+        ])
+
+    async def _lock(self, user_ids):
+        # Users are locked in id order before their rows change: a worker
+        # marking a user offline waits for one registering them, then sees
+        # its row (and concurrent flushes can't deadlock)
+        if user_ids:
+            await database.execute(
+                "SELECT id FROM users WHERE id = ANY(:ids) ORDER BY id FOR NO KEY UPDATE",
+                values={"ids": sorted(user_ids)},
+                name="presence_lock",
+            )
+
+    async def _mark_offline(self, user_ids, seen_at):
+        # Runs after our own rows are gone, in the same transaction
+        rows = await database.fetch_all(
+            """
+            UPDATE users AS u SET is_online = FALSE, last_seen = :seen
+            WHERE u.id = ANY(:ids) AND u.is_online AND NOT EXISTS (
+                SELECT 1 FROM presence_sockets p JOIN presence_workers w ON w.worker_id = p.worker_id
+                WHERE p.user_id = u.id AND w.heartbeat_at > NOW() - make_interval(secs => :ttl)
+            )
+            RETURNING u.id
+            """,
+            values={"ids": user_ids, "seen": seen_at, "ttl": self.worker_ttl},
+            name="presence_offline",
+        )
+        return [row["id"] for row in rows]
+
+    def stats(self):
+        return {
+            "online_users": len(self._sockets),
+            "pending_offline": len(self._offline_since),
+            "batches": self.batches,
+            "updates": self.updates,
+            "reaped_workers": self.reaped_workers,
+        }
+
+
+presence = PresenceRegistry(
+    flush_interval=PRESENCE_FLUSH_INTERVAL, grace_period=PRESENCE_GRACE_PERIOD, worker_ttl=PRESENCE_WORKER_TTL
+)
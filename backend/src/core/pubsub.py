@@ -0,0 +1,152 @@
+import asyncio
+import json
+import os
+import uuid
+import asyncpg
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from dotenv import load_dotenv
+from src.core.fanout import FastEmitManager, with_fast_emit
+
+load_dotenv()
+
+# Cross-process Socket.IO fan-out. Unset = single-process, in-memory rooms.
+#   redis://host:6379/0         -> Redis (or any Redis-protocol server) pub/sub
+#   postgresql://...            -> Postgres LISTEN/NOTIFY, no extra service needed
+SOCKETIO_MANAGER_URL = os.getenv("SOCKETIO_MANAGER_URL")
+SOCKETIO_CHANNEL = os.getenv("SOCKETIO_CHANNEL", "socketio")
+# Postgres backend: connections publishing NOTIFYs (one statement runs per
+# connection at a time) and the largest event it will carry
+SOCKETIO_PG_PUBLISH_POOL = int(os.getenv("SOCKETIO_PG_PUBLISH_POOL", "4"))
+SOCKETIO_PG_MAX_PAYLOAD = int(os.getenv("SOCKETIO_PG_MAX_PAYLOAD", str(1024 * 1024)))
+
+# NOTIFY payloads must be shorter than 8000 bytes
+NOTIFY_MAX_BYTES = 8000
+CHUNK_PREFIX = "#"
+CHUNK_SIZE = NOTIFY_MAX_BYTES - 100
+RETRYABLE_ERRORS = (asyncpg.PostgresConnectionError, asyncpg.InterfaceError, ConnectionError, OSError)
+
+
+class AsyncPostgresManager(AsyncPubSubManager):
+    # Events over the NOTIFY limit (long messages, big batches) are split
+    # into chunks sent in one transaction, so they arrive together and in
+    # order, and are joined again by the listener. Events over
+    # SOCKETIO_PG_MAX_PAYLOAD are dropped; use the Redis backend for those.
+    name = 'asyncpg'
+
+    def __init__(self, url, channel='socketio', write_only=False, logger=None,
+                 pool_size=4, max_payload=1024 * 1024):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.url = url
+        self.pool_size = pool_size
+        self.max_payload = max_payload
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+        self.chunked = 0
+        self.oversized = 0
+
+    async def _get_pool(self):
+        async with self._pool_lock:
+            if self._pool is None:
+                self._pool = await asyncpg.create_pool(self.url, min_size=1, max_size=self.pool_size)
+            return self._pool
+
+    async def _reset_pool(self):
+        async with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.terminate()
+
+    def _chunks(self, payload):
+        # json.dumps escapes non-ASCII, so characters and bytes line up
+        key = uuid.uuid4().hex
+        parts = [payload[i:i + CHUNK_SIZE] for i in range(0, len(payload), CHUNK_SIZE)]
+        return [f"{CHUNK_PREFIX}{key} {i} {len(parts)} {part}" for i, part in enumerate(parts)]
+
+    async def _publish(self, data):
+        payload = json.dumps(data)
+        if len(payload) > self.max_payload:
+            self.oversized += 1
+            self._get_logger().error(f"Dropping {len(payload)}-byte pubsub event: over SOCKETIO_PG_MAX_PAYLOAD")
+            return
+        chunks = [payload] if len(payload) < NOTIFY_MAX_BYTES else self._chunks(payload)
+        if len(chunks) > 1:
+            self.chunked += 1
+        for retry in (True, False):
+            try:
+                pool = await self._get_pool()
+                # One statement = one transaction for all the chunks
+                return await pool.execute(
+                    "SELECT pg_notify($1, c) FROM unnest($2::text[]) WITH ORDINALITY AS t(c, i) ORDER BY i",
+                    self.channel, chunks,
+                )
+            except RETRYABLE_ERRORS:
+                # Reconnect once, then let the error surface
+                await self._reset_pool()
+                if not retry:
+                    raise
+
+    async def _listen(self):
+        # Reconnects with backoff, like the Redis manager does
+        retry_sleep = 1
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.url)
+                queue = asyncio.Queue()
+
+                def on_notify(connection, pid, channel, payload):
+                    queue.put_nowait(payload)
+
+                await conn.add_listener(self.channel, on_notify)
+                # None wakes the loop below when the connection drops
+                conn.add_termination_listener(lambda connection: queue.put_nowait(None))
+                retry_sleep = 1
+                partial = {}
+                while True:
+                    payload = await queue.get()
+                    if payload is None:
+                        raise ConnectionError("listener connection closed")
+                    if payload.startswith(CHUNK_PREFIX):
+                        payload = self._join_chunk(partial, payload)
+                        if payload is None:
+                            continue
+                    # The base class json-decodes string messages
+                    yield payload
+            except RETRYABLE_ERRORS as e:
+                self._get_logger().error(f"Cannot receive from postgres ({e}), retrying in {retry_sleep} secs")
+                await asyncio.sleep(retry_sleep)
+                retry_sleep = min(retry_sleep * 2, 60)
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+
+    def _join_chunk(self, partial, payload):
+        # -> the whole event once its last chunk is in, else None
+        try:
+            key, index, total, part = payload[len(CHUNK_PREFIX):].split(" ", 3)
+            parts = partial.setdefault(key, [None] * int(total))
+            parts[int(index)] = part
+        except (ValueError, IndexError):
+            return None
+        if any(p is None for p in parts):
+            return None
+        del partial[key]
+        return "".join(parts)
+
+    def stats(self):
+        # Always mixed with FastEmitManager (see create_client_manager)
+        return {**super().stats(), "pubsub_chunked": self.chunked, "pubsub_oversized": self.oversized}
+
+
+def create_client_manager(url=SOCKETIO_MANAGER_URL, channel=SOCKETIO_CHANNEL):
+    # Every variant delivers to its local sockets through FastEmitManager
+    if not url:
+        return FastEmitManager()
+    if url.startswith(("redis://", "rediss://", "redis+sentinel://", "unix://", "valkey://", "valkeys://")):
+        return with_fast_emit(socketio.AsyncRedisManager)(url, channel=channel)
+    if url.startswith(("postgres://", "postgresql://")):
+        return with_fast_emit(AsyncPostgresManager)(
+            url, channel=channel, pool_size=SOCKETIO_PG_PUBLISH_POOL, max_payload=SOCKETIO_PG_MAX_PAYLOAD
+        )
+    raise ValueError(f"Unsupported SOCKETIO_MANAGER_URL scheme: {url.split(':', 1)[0]}")
@@ -0,0 +1,165 @@
+import asyncio
+import math
+import os
+import time
+from dotenv import load_dotenv
+from fastapi import Depends, HTTPException
+from src.core.security import get_current_user_id
+
+load_dotenv()
+
+# Token buckets per (event, scope): "user" buckets are keyed by user id,
+# "channel" buckets by channel id, so one client can't flood, and neither can
+# many clients together flood one channel. Each limit is rate/burst: tokens
+# refilled per second / bucket size.
+RATE_LIMITS = os.getenv(
+    "RATE_LIMITS",
+    "send_message:user=2/10,send_message:channel=50/200,"
+    "typing_start:user=1/5,edit_message:user=1/10,delete_message:user=1/10,"
+    "mark_read:user=5/20,join_channel:user=5/30,search:user=1/10,upload:user=0.5/10",
+)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_NOTICE_INTERVAL = 1.0  # at most one rate_limited notice per bucket per second
+
+
+def parse_limits(spec):
+    # "send_message:user=2/10,..." -> {("send_message", "user"): (2.0, 10.0)}
+    limits = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, value = item.partition("=")
+        event, _, scope = key.strip().partition(":")
+        rate, _, burst = value.partition("/")
+        limits[(event, scope or "user")] = (float(rate), float(burst or rate))
+    return limits
+
+
+class _Bucket:
+    # One per active key (a 56-byte slotted object plus its floats), and
+    # full buckets are swept, so 100k users x a few events stays small
+    __slots__ = ("tokens", "updated", "noticed")
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+        self.noticed = 0.0
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}  # key -> _Bucket
+        self.allowed = 0
+        self.rejected = 0
+
+    def take(self, key, now):
+        # Returns 0.0 if a token was taken, else seconds until one is available
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            self.allowed += 1
+            return 0.0
+        self.rejected += 1
+        return (1 - bucket.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def refund(self, key):
+        # Gives back a token taken for an event another bucket then rejected
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.tokens = min(self.burst, bucket.tokens + 1)
+            self.allowed -= 1
+
+    def should_notify(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None or now - bucket.noticed < RATE_LIMIT_NOTICE_INTERVAL:
+            return False
+        bucket.noticed = now
+        return True
+
+    def sweep(self, now):
+        # A bucket that has refilled completely is the same as no bucket
+        full_after = self.burst / self.rate if self.rate > 0 else float("inf")
+        stale = [key for key, b in self._buckets.items() if now - b.updated >= full_after]
+        for key in stale:
+            del self._buckets[key]
+        return len(stale)
+
+
+class RateLimiter:
+    def __init__(self, limits, enabled=True):
+        self.enabled = enabled
+        self._limits = {key: TokenBucket(rate, burst) for key, (rate, burst) in limits.items()}
+        self._task = None
+
+    def check(self, event, user_id, channel_id=None):
+        # -> (retry_after, notify): retry_after is None when the event may go ahead;
+        # notify says whether to tell the client (throttled per bucket)
+        if not self.enabled:
+            return None, False
+        now = time.monotonic()
+        taken = []
+        for scope, key in (("user", user_id), ("channel", channel_id)):
+            bucket = self._limits.get((event, scope))
+            if bucket is None or key is None:
+                continue
+            retry_after = bucket.take(key, now)
+            if retry_after:
+                # The event is dropped, so nothing it passed is charged for it
+                for earlier, earlier_key in taken:
+                    earlier.refund(earlier_key)
+                return retry_after, bucket.should_notify(key, now)
+            taken.append((bucket, key))
+        return None, False
+
+    async def start_sweeper(self, period=30.0):
+        if self.enabled and self._limits:
+            self._task = asyncio.create_task(self._run(period))
+
+    async def stop_sweeper(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, period):
+        while True:
+            await asyncio.sleep(period)
+            now = time.monotonic()
+            for bucket in self._limits.values():
+                bucket.sweep(now)
+
+    def stats(self):
+        return {
+            f"{event}_{scope}": {
+                "buckets": len(b._buckets),
+                "allowed": b.allowed,
+                "rejected": b.rejected,
+            }
+            for (event, scope), b in self._limits.items()
+        }
+
+
+rate_limiter = RateLimiter(parse_limits(RATE_LIMITS), enabled=RATE_LIMIT_ENABLED)
+
+
+def rest_limit(event):
+    # FastAPI dependency for REST routes that share a bucket with (or mirror) a socket event
+    async def check(user_id: int = Depends(get_current_user_id)):
+        retry_after, _ = rate_limiter.check(event, user_id)
+        if retry_after is not None:
+            raise HTTPException(
+                status_code=429, detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+    return check
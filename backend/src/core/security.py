@@ -1,7 +1,14 @@
+import asyncio
+import hashlib
 import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import jwt
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError, jwt
 from passlib.context import CryptContext
 from dotenv import load_dotenv
 
@@ -11,6 +18,14 @@ SECRET_KEY = os.getenv("JWT_SECRET")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 
 
+# bcrypt runs on a small thread pool (it releases the GIL) so logins never block
+# the event loop. Requests beyond the queue limit are rejected instead of piling up.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "200"))
+
+# Verified tokens are cached by digest so reconnects skip the HMAC + JSON decode
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def verify_password(plain_password, hashed_password):
@@ -19,9 +34,107 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+class PasswordQueueFull(Exception):
+    pass
+
+class PasswordHasher:
+    def __init__(self, workers=4, max_queue=200):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.in_flight = 0   # submitted and not finished (running + queued)
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def _run(self, fn, *args):
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise PasswordQueueFull()
+        self.in_flight += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        self.completed += 1
+        return result
+
+    async def hash(self, password):
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password, hashed_password):
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queued": max(0, self.in_flight - self.workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+password_hasher = PasswordHasher(workers=PASSWORD_HASH_WORKERS, max_queue=PASSWORD_HASH_MAX_QUEUE)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
+
+class InvalidToken(Exception):
+    pass
+
+class TokenVerifier:
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._cache = OrderedDict()  # sha256(token) -> claims
+        self.hits = 0
+        self.misses = 0
+
+    def decode(self, token: str) -> dict:
+        key = hashlib.sha256(token.encode()).digest()
+        claims = self._cache.get(key)
+        if claims is not None:
+            if claims["exp"] > time.time():
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return claims
+            del self._cache[key]
+
+        self.misses += 1
+        try:
+            claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            int(claims["sub"])
+        except (JWTError, KeyError, TypeError, ValueError):
+            raise InvalidToken()
+
+        self._cache[key] = claims
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return claims
+
+    def stats(self):
+        return {"size": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+token_verifier = TokenVerifier(max_size=TOKEN_CACHE_SIZE)
+
+def decode_access_token(token: str) -> dict:
+    return token_verifier.decode(token)
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+# FastAPI dependency: the authenticated user's id from "Authorization: Bearer <jwt>"
+async def get_current_user_id(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)) -> int:
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        claims = decode_access_token(credentials.credentials)
+    except InvalidToken:
+        raise HTTPException(status_code=401, detail="Invalid or expired token", headers={"WWW-Authenticate": "Bearer"})
+    return int(claims["sub"])
@@ -0,0 +1,286 @@
+import asyncio
+import hashlib
+import os
+import re
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Attachment blobs are content-addressed: the key is the sha256 of the bytes,
+# so re-uploading a file stores nothing new. Uploads stream into a temp file
+# (hashed on the way) and are moved into place once complete; the event loop
+# never touches the disk, and no upload is ever held in memory whole.
+ATTACHMENT_STORAGE = os.getenv("ATTACHMENT_STORAGE", "local")
+ATTACHMENT_DIR = os.getenv("ATTACHMENT_DIR", "attachments")
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(25 * 1024 * 1024)))
+ATTACHMENT_IO_WORKERS = int(os.getenv("ATTACHMENT_IO_WORKERS", "4"))
+# Parser output is gathered up to this size before each write to disk
+ATTACHMENT_WRITE_CHUNK = 256 * 1024
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class BlobTooLarge(Exception):
+    pass
+
+
+class BlobWriter:
+    # One upload in progress. write() buffers; full chunks are hashed and
+    # written on the store's I/O pool.
+    def __init__(self, store, tmp_path, max_bytes):
+        self.store = store
+        self.tmp_path = tmp_path
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._buffer = bytearray()
+        self._file = None
+
+    async def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise BlobTooLarge()
+        self._buffer += data
+        if len(self._buffer) >= ATTACHMENT_WRITE_CHUNK:
+            await self._flush()
+
+    async def _flush(self):
+        chunk, self._buffer = bytes(self._buffer), bytearray()
+        await self.store.run(self._write_chunk, chunk)
+
+    def _write_chunk(self, chunk):
+        if self._file is None:
+            self.tmp_path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.tmp_path, "wb")
+        self._hash.update(chunk)  # releases the GIL for large chunks
+        self._file.write(chunk)
+
+    async def commit(self):
+        # -> (sha256 hex, size, deduplicated)
+        await self._flush()
+        sha = self._hash.hexdigest()
+        deduplicated = await self.store.run(self._finish, sha)
+        self.store.uploads += 1
+        self.store.bytes_written += 0 if deduplicated else self.size
+        self.store.deduplicated += deduplicated
+        return sha, self.size, deduplicated
+
+    def _finish(self, sha):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        return self.store.place(self.tmp_path, sha)
+
+    async def abort(self):
+        await self.store.run(self._discard)
+        self.store.aborted += 1
+
+    def _discard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class BlobStore(ABC):
+    # Storage backend interface. Blobs are keyed by sha256; a variant
+    # ("thumb", ...) is a small derived file stored next to its blob.
+    def __init__(self, io_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="blob-io")
+        self.uploads = 0
+        self.deduplicated = 0
+        self.aborted = 0
+        self.bytes_written = 0
+        self.deleted = 0
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    @abstractmethod
+    def writer(self, max_bytes=ATTACHMENT_MAX_BYTES):
+        ...
+
+    @abstractmethod
+    def place(self, tmp_path, sha):
+        # Moves a finished upload to its key (runs on the I/O pool); True if
+        # the blob already existed. Placing must refresh the blob's age, so
+        # the collector's grace period covers an upload until its row exists.
+        ...
+
+    @abstractmethod
+    async def exists(self, sha, variant=None):
+        ...
+
+    @abstractmethod
+    async def put_variant(self, sha, variant, data):
+        ...
+
+    @abstractmethod
+    def relative_path(self, sha, variant=None):
+        # Key -> path under the store's root, as a proxy location sees it
+        # (ATTACHMENT_ACCEL_PREFIX)
+        ...
+
+    @abstractmethod
+    def scan(self, older_than):
+        # Async iterator over batches of shas with a blob or variant last
+        # written before older_than (epoch seconds)
+        ...
+
+    @abstractmethod
+    async def delete(self, sha, older_than):
+        # Removes the blob and its variants, unless the blob was written
+        # again since older_than (re-uploaded while the collector ran).
+        # -> True if anything was removed
+        ...
+
+    @abstractmethod
+    async def clean_temp(self, older_than):
+        # Removes uploads in progress since before older_than (the worker
+        # writing them died); -> count
+        ...
+
+    def local_path(self, sha, variant=None):
+        # A file on this machine that can be sent with sendfile, or None for
+        # backends that keep blobs elsewhere
+        return None
+
+    def stats(self):
+        return {
+            "uploads": self.uploads,
+            "deduplicated": self.deduplicated,
+            "aborted": self.aborted,
+            "bytes_written": self.bytes_written,
+            "deleted": self.deleted,
+        }
+
+
+class LocalBlobStore(BlobStore):
+    # <root>/blobs/ab/cd/<sha256>, <root>/variants/<variant>/ab/<sha256>,
+    # <root>/tmp/ for uploads in progress (same filesystem, so the final move
+    # is an atomic rename)
+    def __init__(self, root, io_workers=4):
+        super().__init__(io_workers)
+        self.root = Path(root).resolve()
+
+    def writer(self, max_bytes=ATTACHMENT_MAX_BYTES):
+        return BlobWriter(self, self.root / "tmp" / uuid.uuid4().hex, max_bytes)
+
+    def relative_path(self, sha, variant=None):
+        if variant:
+            return Path("variants", variant, sha[:2], sha)
+        return Path("blobs", sha[:2], sha[2:4], sha)
+
+    def local_path(self, sha, variant=None):
+        return self.root / self.relative_path(sha, variant)
+
+    def place(self, tmp_path, sha):
+        # Same bytes either way; replacing an existing blob (rather than
+        # dropping the upload) gives it a fresh mtime
+        final = self.local_path(sha)
+        existed = final.exists()
+        final.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, final)
+        return existed
+
+    async def exists(self, sha, variant=None):
+        return await self.run(self.local_path(sha, variant).exists)
+
+    async def put_variant(self, sha, variant, data):
+        await self.run(self._write_variant, self.local_path(sha, variant), data)
+
+    def _write_variant(self, path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    async def scan(self, older_than):
+        # One two-hex-digit prefix directory per batch, listed on the I/O pool
+        for prefix in await self.run(self._prefixes):
+            shas = await self.run(self._scan_prefix, prefix, older_than)
+            if shas:
+                yield shas
+
+    def _prefixes(self):
+        dirs = [self.root / "blobs"] + self._variant_dirs()
+        return sorted({p.name for d in dirs if d.is_dir() for p in d.iterdir() if p.is_dir()})
+
+    def _variant_dirs(self):
+        variants = self.root / "variants"
+        return [d for d in variants.iterdir() if d.is_dir()] if variants.is_dir() else []
+
+    def _scan_prefix(self, prefix, older_than):
+        shas = set()
+        dirs = [d / prefix for d in self._variant_dirs()]
+        blobs = self.root / "blobs" / prefix
+        if blobs.is_dir():
+            dirs += [d for d in blobs.iterdir() if d.is_dir()]
+        for d in dirs:
+            if not d.is_dir():
+                continue
+            with os.scandir(d) as entries:
+                for entry in entries:
+                    try:
+                        if entry.stat().st_mtime >= older_than:
+                            continue
+                        if SHA256_RE.match(entry.name):
+                            shas.add(entry.name)
+                        elif entry.name.endswith(".tmp"):
+                            # A variant write that died halfway
+                            os.unlink(entry.path)
+                    except FileNotFoundError:
+                        pass  # renamed or removed while listing
+        return shas
+
+    async def delete(self, sha, older_than):
+        return await self.run(self._delete, sha, older_than)
+
+    def _delete(self, sha, older_than):
+        blob = self.local_path(sha)
+        try:
+            if blob.stat().st_mtime >= older_than:
+                return False
+        except FileNotFoundError:
+            pass  # variants left behind by an earlier delete
+        removed = False
+        for path in [blob] + [d / sha[:2] / sha for d in self._variant_dirs()]:
+            try:
+                path.unlink()
+                removed = True
+            except FileNotFoundError:
+                pass
+        self.deleted += removed
+        return removed
+
+    async def clean_temp(self, older_than):
+        return await self.run(self._clean_temp, older_than)
+
+    def _clean_temp(self, older_than):
+        tmp = self.root / "tmp"
+        if not tmp.is_dir():
+            return 0
+        removed = 0
+        with os.scandir(tmp) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < older_than:
+                        os.unlink(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass  # finished or aborted meanwhile
+        return removed
+
+    def stats(self):
+        return {**super().stats(), "backend": "local"}
+
+
+STORAGE_BACKENDS = {
+    "local": lambda: LocalBlobStore(ATTACHMENT_DIR, io_workers=ATTACHMENT_IO_WORKERS),
+}
+
+blob_store = STORAGE_BACKENDS[ATTACHMENT_STORAGE]()
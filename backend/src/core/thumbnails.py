@@ -0,0 +1,89 @@
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it attachments just have no thumbnails
+    Image = None
+
+load_dotenv()
+
+# Image decode + resize runs on its own small thread pool (Pillow releases the
+# GIL while decoding and resampling), like bcrypt in security.py. When the
+# pool is backed up, uploads go through without a thumbnail instead of waiting.
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+THUMBNAIL_MAX_QUEUE = int(os.getenv("THUMBNAIL_MAX_QUEUE", "50"))
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "320"))  # longest side, px
+# Bigger images are skipped (decompression bombs)
+THUMBNAIL_MAX_PIXELS = int(os.getenv("THUMBNAIL_MAX_PIXELS", "40000000"))
+THUMBNAIL_TYPES = frozenset(("image/jpeg", "image/png", "image/gif", "image/webp"))
+
+
+def render_thumbnail(path, size=THUMBNAIL_SIZE, max_pixels=THUMBNAIL_MAX_PIXELS):
+    # -> JPEG bytes, or None if the image is too large to decode
+    with Image.open(path) as im:
+        if im.width * im.height > max_pixels:
+            return None
+        im.draft("RGB", (size, size))  # JPEG: decode at a reduced scale to begin with
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail((size, size))
+        if im.mode in ("RGBA", "LA", "P"):
+            im = im.convert("RGBA")
+            background = Image.new("RGB", im.size, (255, 255, 255))
+            background.paste(im, mask=im.getchannel("A"))
+            im = background
+        elif im.mode != "RGB":
+            im = im.convert("RGB")
+        out = io.BytesIO()
+        im.save(out, "JPEG", quality=80, optimize=True)
+        return out.getvalue()
+
+
+class Thumbnailer:
+    def __init__(self, workers=2, max_queue=50):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.enabled = Image is not None and workers > 0
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="thumbnail")
+        self.in_flight = 0
+        self.completed = 0
+        self.skipped = 0  # pool full or image too large
+        self.failed = 0   # not an image Pillow can read
+
+    async def make(self, path):
+        # -> thumbnail bytes or None; never raises for a bad image
+        if not self.enabled:
+            return None
+        if self.in_flight >= self.workers + self.max_queue:
+            self.skipped += 1
+            return None
+        self.in_flight += 1
+        try:
+            data = await asyncio.get_running_loop().run_in_executor(self._executor, render_thumbnail, path)
+        except Exception as e:
+            self.failed += 1
+            print(f"Thumbnail failed for {path}: {e}")
+            return None
+        finally:
+            self.in_flight -= 1
+        self.completed += 1
+        if data is None:
+            self.skipped += 1
+        return data
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queued": max(0, self.in_flight - self.workers),
+            "completed": self.completed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+        }
+
+
+thumbnailer = Thumbnailer(workers=THUMBNAIL_WORKERS, max_queue=THUMBNAIL_MAX_QUEUE)
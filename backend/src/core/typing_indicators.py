@@ -0,0 +1,74 @@
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# At most one typing_start per (user, channel) per interval, no matter how
+# often the client emits; an indicator with no refresh expires on its own.
+TYPING_INTERVAL = float(os.getenv("TYPING_INTERVAL", "2.0"))
+TYPING_EXPIRY = float(os.getenv("TYPING_EXPIRY", "6.0"))
+
+
+class TypingThrottle:
+    def __init__(self, interval=2.0, expiry=6.0):
+        self.interval = interval
+        self.expiry = expiry
+        # (user_key, channel_id) -> [last_emitted_at, expires_at, payload]
+        self._state = {}
+        self._emit_stop = None
+        self._task = None
+        self.relayed = 0
+        self.suppressed = 0
+
+    def start(self, user_key, channel_id, payload):
+        # Returns True when a typing_start should actually be relayed
+        now = time.monotonic()
+        state = self._state.get((user_key, channel_id))
+        if state is None:
+            self._state[(user_key, channel_id)] = [now, now + self.expiry, payload]
+            self.relayed += 1
+            return True
+        state[1] = now + self.expiry
+        if now - state[0] >= self.interval:
+            state[0] = now
+            self.relayed += 1
+            return True
+        self.suppressed += 1
+        return False
+
+    def stop(self, user_key, channel_id):
+        # Returns True when there was an indicator to clear
+        return self._state.pop((user_key, channel_id), None) is not None
+
+    def expired(self):
+        now = time.monotonic()
+        stale = [key for key, state in self._state.items() if state[1] <= now]
+        return [(key, self._state.pop(key)[2]) for key in stale]
+
+    async def start_sweeper(self, emit_stop, period=1.0):
+        # emit_stop(channel_id, payload) is called for every indicator that expired
+        self._emit_stop = emit_stop
+        self._task = asyncio.create_task(self._run(period))
+
+    async def stop_sweeper(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, period):
+        while True:
+            await asyncio.sleep(period)
+            for (_, channel_id), payload in self.expired():
+                try:
+                    await self._emit_stop(channel_id, payload)
+                except Exception as e:
+                    print(f"Error expiring typing indicator: {e}")
+
+
+typing_throttle = TypingThrottle(interval=TYPING_INTERVAL, expiry=TYPING_EXPIRY)
@@ -0,0 +1,95 @@
+import os
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from src.core.database import database
+
+load_dotenv()
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+
+# Bounded LRU + TTL cache of user identity (id -> username/email).
+# Presence is deliberately not cached: it changes far more often than identity.
+class UserCache:
+    def __init__(self, max_size=10000, ttl=300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # id -> (expires_at, profile)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, profile = entry
+        if expires_at < time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return profile
+
+    def put(self, profile):
+        self._entries[profile["id"]] = (time.monotonic() + self.ttl, profile)
+        self._entries.move_to_end(profile["id"])
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id):
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    async def get(self, user_id):
+        profile = self._lookup(user_id)
+        if profile is not None:
+            self.hits += 1
+            return profile
+        self.misses += 1
+        row = await database.fetch_one(
+            "SELECT id, username, email FROM users WHERE id = :uid", values={"uid": user_id}, name="user_lookup"
+        )
+        if row is None:
+            return None
+        profile = dict(row)
+        self.put(profile)
+        return profile
+
+    async def get_many(self, user_ids):
+        # One query for all misses, e.g. the distinct senders of a history page
+        found, missing = {}, []
+        for uid in set(user_ids):
+            profile = self._lookup(uid)
+            if profile is not None:
+                found[uid] = profile
+            else:
+                missing.append(uid)
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        if missing:
+            rows = await database.fetch_all(
+                "SELECT id, username, email FROM users WHERE id = ANY(:ids)", values={"ids": missing},
+                name="user_lookup_many",
+            )
+            for row in rows:
+                profile = dict(row)
+                self.put(profile)
+                found[profile["id"]] = profile
+        return found
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+user_cache = UserCache(max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
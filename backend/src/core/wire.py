@@ -0,0 +1,156 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+try:
+    import msgpack
+except ImportError:  # optional; without it only the columnar JSON form is offered
+    msgpack = None
+
+load_dotenv()
+
+# Opt-in compact encodings, for large rooms and mobile clients.
+#
+# Sockets: connect with auth {format: "compact"} and chat events arrive as
+# positional arrays with epoch-millisecond timestamps instead of dicts with
+# ISO strings. Still JSON text, so the backpressure classifier and the
+# encode-once fan-out work as before; the fan-out encodes a room broadcast at
+# most once per format. Emits that bypass it (SOCKETIO_FAST_FANOUT=false) are
+# sent as plain JSON dicts, so clients should accept both shapes.
+#   new_message      [id, channel_id, sender, content, created_ms, edited_ms?, attachments?]
+#   message_edited   [id, channel_id, content, edited_ms]
+#   message_deleted  [id, channel_id]
+#   presence_batch   [[user_id, online (1/0), last_seen_ms], ...]
+#   batch            [[event, compact data], ...]
+# attachments are [id, filename, content_type, size, has_thumbnail].
+#
+# Message lists (history pages, reconnect catch-up) use a columnar form:
+# one array per field, ids and timestamps delta-coded, sender names
+# interned, and the rare edited_at/attachments as sparse [row, value] pairs.
+# HTTP clients ask for it with Accept (COLUMNAR_MEDIA_TYPE, or
+# MSGPACK_MEDIA_TYPE for the same structure as MessagePack).
+WIRE_COMPACT_ENABLED = os.getenv("WIRE_COMPACT_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPACT = "compact"
+COLUMNAR_MEDIA_TYPE = "application/vnd.teachat.columnar+json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+COLUMNAR_VERSION = 1
+
+_EPOCH = datetime(1970, 1, 1)
+_MS = timedelta(milliseconds=1)
+
+# Socket.IO sids that negotiated the compact format (this worker's only)
+compact_sids = set()
+
+
+def epoch_ms(value):
+    # Naive datetimes are UTC throughout (see security.py); accepts the ISO
+    # strings the JSON events already carry, too
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // _MS
+
+
+def _attachment(a):
+    return [a["id"], a["filename"], a["content_type"], a["size"], a["has_thumbnail"]]
+
+
+def compact_message(m):
+    out = [m["id"], int(m["channel_id"]), m["sender"], m["content"], epoch_ms(m["created_at"])]
+    edited = m.get("edited_at")
+    attachments = m.get("attachments")
+    if edited or attachments:
+        out.append(epoch_ms(edited))
+    if attachments:
+        out.append([_attachment(a) for a in attachments])
+    return out
+
+
+def _edited(d):
+    return [d["id"], int(d["channel_id"]), d["content"], epoch_ms(d["edited_at"])]
+
+
+def _deleted(d):
+    return [d["id"], int(d["channel_id"])]
+
+
+def _presence(d):
+    return [[u["user_id"], 1 if u["is_online"] else 0, epoch_ms(u.get("last_seen"))] for u in d["updates"]]
+
+
+def _batch(items):
+    return [[event, compact_event(event, data)] for event, data in items]
+
+
+COMPACT_EVENTS = {
+    "new_message": compact_message,
+    "message_edited": _edited,
+    "message_deleted": _deleted,
+    "presence_batch": _presence,
+    "batch": _batch,
+}
+
+
+def compact_event(event, data):
+    encode = COMPACT_EVENTS.get(event)
+    return encode(data) if encode else data
+
+
+def columnar(messages):
+    # List of message dicts (rows or socket payloads) -> columnar dict
+    ids, created, senders, sender_idx, contents, channels = [], [], {}, [], [], []
+    edited, attachments = [], []
+    prev_id = prev_ts = 0
+    for i, m in enumerate(messages):
+        ts = epoch_ms(m["created_at"])
+        ids.append(m["id"] - prev_id)
+        created.append(ts - prev_ts)
+        prev_id, prev_ts = m["id"], ts
+        sender_idx.append(senders.setdefault(m["sender"], len(senders)))
+        contents.append(m["content"])
+        channels.append(int(m["channel_id"]))
+        if m.get("edited_at"):
+            edited.append([i, epoch_ms(m["edited_at"])])
+        if m.get("attachments"):
+            attachments.append([i, [_attachment(a) for a in m["attachments"]]])
+    out = {
+        "v": COLUMNAR_VERSION,
+        "id": ids,
+        "created_at": created,
+        "senders": list(senders),
+        "sender": sender_idx,
+        "content": contents,
+        # Pages are one channel; a single value instead of a column
+        "channel_id": channels[0] if channels and channels.count(channels[0]) == len(channels) else channels,
+    }
+    if edited:
+        out["edited_at"] = edited
+    if attachments:
+        out["attachments"] = attachments
+    return out
+
+
+def negotiate(accept):
+    # Accept header -> media type of a compact page, or None for plain JSON
+    if not WIRE_COMPACT_ENABLED or not accept:
+        return None
+    if msgpack is not None and MSGPACK_MEDIA_TYPE in accept:
+        return MSGPACK_MEDIA_TYPE
+    if COLUMNAR_MEDIA_TYPE in accept:
+        return COLUMNAR_MEDIA_TYPE
+    return None
+
+
+def encode_page(messages, media_type):
+    page = columnar(messages)
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return msgpack.packb(page)
+    return json.dumps(page, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def stats():
+    return {"enabled": WIRE_COMPACT_ENABLED, "msgpack": msgpack is not None, "compact_sockets": len(compact_sids)}
@@ -1,9 +1,24 @@
 ﻿from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from src.core.database import database
-from src.routers import auth, channels, messages, users # <--- Added users
-from src.sockets import sio_app
+from src.core.database import connect_all, disconnect_all, metric_samples as database_samples, stats as database_stats
+from src.core.message_writer import WRITE_BEHIND_ENABLED, message_writer
+from src.core.metrics import METRICS_TOKEN, MetricsMiddleware, metrics
+from src.core.backpressure import outbound_stats
+from src.core.history_cache import history_cache
+from src.core.user_cache import user_cache
+from src.core.partitions import partition_maintainer
+from src.core.attachments import attachment_collector
+from src.routers import attachments, auth, channels, messages, users # <--- Added users
+from src.core.presence import presence
+from src.core.rate_limit import rate_limiter
+from src.core.storage import blob_store
+from src.core.thumbnails import thumbnailer
+from src.core import wire
+from src.core.security import get_current_user_id, password_hasher, token_verifier
+from src.core.typing_indicators import typing_throttle
+from src.sockets import sio, sio_app, emit_message_dropped, emit_presence_batch, emit_typing_stop, fanout_batcher, metric_samples as socket_samples
 import os
 from dotenv import load_dotenv
 
@@ -11,10 +26,35 @@ load_dotenv()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await database.connect()
+    await connect_all()
     print("✅ Database Connected")
+    if WRITE_BEHIND_ENABLED:
+        await message_writer.start(emit_message_dropped)
+    await presence.start(emit_presence_batch)
+    await typing_throttle.start_sweeper(emit_typing_stop)
+    await rate_limiter.start_sweeper()
+    await partition_maintainer.start()
+    await attachment_collector.start()
+    await metrics.start()
     yield
-    await database.disconnect()
+    # Each step runs even if an earlier one fails: queued messages were
+    # already broadcast, so the writer must drain, and the pools must close
+    for step in (
+        metrics.stop,
+        partition_maintainer.stop,
+        attachment_collector.stop,
+        typing_throttle.stop_sweeper,
+        rate_limiter.stop_sweeper,
+        fanout_batcher.close,
+        presence.stop,
+        # Flush queued messages while the pool is still open
+        message_writer.stop,
+        disconnect_all,
+    ):
+        try:
+            await step()
+        except Exception as e:
+            print(f"Error during shutdown ({step.__qualname__}): {e}")
     print("❌ Database Disconnected")
 
 app = FastAPI(lifespan=lifespan)
@@ -27,15 +67,54 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Sync-Version", "ETag"],
 )
 
+# Request timing by route for /metrics
+app.add_middleware(MetricsMiddleware)
+
 app.mount("/socket.io", sio_app)
 
 app.include_router(auth.router, prefix="/api/auth", tags=["Auth"])
-app.include_router(channels.router, prefix="/api/channels", tags=["Channels"])
-app.include_router(messages.router, prefix="/api/messages", tags=["Messages"])
-app.include_router(users.router, prefix="/api/users", tags=["Users"]) # <--- Added this
+# Everything except /api/auth needs a valid bearer token
+authenticated = [Depends(get_current_user_id)]
+app.include_router(channels.router, prefix="/api/channels", tags=["Channels"], dependencies=authenticated)
+app.include_router(messages.router, prefix="/api/messages", tags=["Messages"], dependencies=authenticated)
+app.include_router(users.router, prefix="/api/users", tags=["Users"], dependencies=authenticated) # <--- Added this
+app.include_router(attachments.router, prefix="/api/attachments", tags=["Attachments"], dependencies=authenticated)
 
 @app.get("/")
 def read_root():
     return {"message": "TeaChat API is running"}
+
+# Pool sizing: connection wait times, active connections and per-query latency
+@app.get("/api/stats/db", dependencies=authenticated)
+def db_stats():
+    return database_stats()
+
+# Gauges read from each component's stats() at scrape time
+metrics.register_samples(database_samples)
+metrics.register_samples(socket_samples)
+metrics.register("outbound", outbound_stats.stats)
+metrics.register("fanout", sio.manager.stats)
+metrics.register("fanout_batcher", fanout_batcher.stats)
+metrics.register("presence", presence.stats)
+metrics.register("message_writer", message_writer.stats)
+metrics.register("rate_limit", rate_limiter.stats)
+metrics.register("history_cache", history_cache.stats)
+metrics.register("user_cache", user_cache.stats)
+metrics.register("password_hasher", password_hasher.stats)
+metrics.register("token_verifier", token_verifier.stats)
+metrics.register("channel_list_cache", channels.channel_list_cache.stats)
+metrics.register("partitions", partition_maintainer.stats)
+metrics.register("attachments", blob_store.stats)
+metrics.register("attachment_gc", attachment_collector.stats)
+metrics.register("thumbnails", thumbnailer.stats)
+metrics.register("wire", wire.stats)
+
+# Prometheus scrape endpoint (METRICS_TOKEN, if set, must be sent as a bearer token)
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import hashlib
+import os
+import re
+import time
+from pathlib import Path
+import asyncpg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Ordered, checksummed schema migrations.
+#
+#   python -m src.migrate            # apply everything pending
+#   python -m src.migrate --status   # list applied / pending migrations
+#
+# Files are migrations/NNN_name.sql, applied in NNN order and recorded in
+# schema_migrations. An applied file whose checksum changed aborts the run.
+#
+# Directives (SQL comments):
+#   -- migrate:no-transaction   first line of a file: run each statement on
+#                               its own (needed for CREATE INDEX CONCURRENTLY)
+#   -- migrate:batch            the next statement takes the previous cursor
+#                               as $1 (starting at 0) and returns the next one;
+#                               it is re-run, one transaction per batch, until
+#                               it returns NULL. Only in no-transaction files.
+#   -- migrate:skip-if <query>  skip the next statement when <query> returns
+#                               true (for steps that can't be made idempotent
+#                               in SQL, like CREATE INDEX CONCURRENTLY)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+# DDL waits at most this long for a table lock instead of queueing behind a
+# long transaction and blocking every query that arrives after it
+MIGRATION_LOCK_TIMEOUT = os.getenv("MIGRATION_LOCK_TIMEOUT", "5s")
+MIGRATION_LOCK_RETRIES = int(os.getenv("MIGRATION_LOCK_RETRIES", "10"))
+ADVISORY_LOCK_ID = 0x7EAC4A7  # one runner at a time per database
+
+FILENAME_RE = re.compile(r"^(\d+)_(.+)\.sql$")
+CONCURRENT_INDEX_RE = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.I
+)
+
+SCHEMA_MIGRATIONS_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+  version INTEGER PRIMARY KEY,
+  name TEXT NOT NULL,
+  checksum TEXT NOT NULL,
+  applied_at TIMESTAMP NOT NULL DEFAULT NOW(),
+  duration_ms INTEGER NOT NULL
+)
+"""
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration:
+    def __init__(self, path):
+        match = FILENAME_RE.match(path.name)
+        self.path = path
+        self.version = int(match.group(1))
+        self.name = match.group(2)
+        self.sql = path.read_text(encoding="utf-8-sig")
+        self.checksum = hashlib.sha256(self.sql.encode()).hexdigest()
+        first_line = self.sql.lstrip().split("\n", 1)[0].strip().lower()
+        self.transactional = first_line != "-- migrate:no-transaction"
+
+    def __repr__(self):
+        return f"{self.version:03d}_{self.name}"
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    migrations = [Migration(p) for p in sorted(directory.glob("*.sql")) if FILENAME_RE.match(p.name)]
+    migrations.sort(key=lambda m: m.version)
+    for a, b in zip(migrations, migrations[1:]):
+        if a.version == b.version:
+            raise MigrationError(f"Duplicate migration version: {a} and {b}")
+    return migrations
+
+
+def split_statements(sql):
+    # Split on top-level semicolons, skipping over quotes, comments and
+    # $tag$ ... $tag$ function bodies. Returns (statement, directives) pairs.
+    statements, buf, directives = [], [], {}
+    i, n = 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if sql.startswith("--", i):
+            end = sql.find("\n", i)
+            end = n if end == -1 else end
+            directive = re.match(r"--\s*migrate:(batch|skip-if)\b\s*(.*)", sql[i:end].strip(), re.I)
+            if directive:
+                directives[directive.group(1).lower()] = directive.group(2).strip() or True
+            buf.append(sql[i:end])
+            i = end
+        elif sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            end = n if end == -1 else end + 2
+            buf.append(sql[i:end])
+            i = end
+        elif c in ("'", '"'):
+            end = i + 1
+            while end < n:
+                if sql[end] == c:
+                    if end + 1 < n and sql[end + 1] == c:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            buf.append(sql[i:end + 1])
+            i = end + 1
+        elif c == "$" and (tag := re.match(r"\$(\w*)\$", sql[i:])):
+            close = sql.find(tag.group(0), i + len(tag.group(0)))
+            end = n if close == -1 else close + len(tag.group(0))
+            buf.append(sql[i:end])
+            i = end
+        elif c == ";":
+            statements.append(("".join(buf).strip(), directives))
+            buf, directives = [], {}
+            i += 1
+        else:
+            buf.append(c)
+            i += 1
+    statements.append(("".join(buf).strip(), directives))
+    return [(s, d) for s, d in statements if _has_code(s)]
+
+
+def _has_code(statement):
+    code = re.sub(r"--[^\n]*", "", statement)
+    return bool(code.strip())
+
+
+async def _with_lock_retries(conn, fn):
+    # lock_timeout makes DDL give up quickly; back off and try again
+    for attempt in range(MIGRATION_LOCK_RETRIES + 1):
+        try:
+            return await fn()
+        except asyncpg.exceptions.LockNotAvailableError:
+            if attempt == MIGRATION_LOCK_RETRIES:
+                raise
+            delay = min(0.5 * 2 ** attempt, 30)
+            print(f"   lock not available, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def _drop_invalid_index(conn, statement):
+    # A failed CREATE INDEX CONCURRENTLY leaves an INVALID index behind, and
+    # IF NOT EXISTS would then skip it forever
+    match = CONCURRENT_INDEX_RE.search(statement)
+    if not match:
+        return
+    invalid = await conn.fetchval(
+        """
+        SELECT NOT i.indisvalid FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = $1 AND pg_table_is_visible(c.oid)
+        """,
+        match.group(1),
+    )
+    if invalid:
+        print(f"   dropping invalid index {match.group(1)} left by an earlier run")
+        await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{match.group(1)}"')
+
+
+async def _build_index_concurrently(conn, statement):
+    # The build only takes a SHARE UPDATE EXCLUSIVE lock (reads and writes
+    # carry on), but it has to wait out older transactions, so it runs
+    # without lock_timeout
+    await _drop_invalid_index(conn, statement)
+    await conn.execute("SET lock_timeout = 0")
+    try:
+        await conn.execute(statement)
+    finally:
+        await conn.execute(f"SET lock_timeout = '{MIGRATION_LOCK_TIMEOUT}'")
+
+
+async def _run_batches(conn, statement):
+    cursor, batches = 0, 0
+    while cursor is not None:
+        async def step():
+            async with conn.transaction():
+                return await conn.fetchval(statement, cursor)
+        cursor = await _with_lock_retries(conn, step)
+        batches += 1
+        if batches % 50 == 0:
+            print(f"   {batches} batches, cursor at {cursor}")
+    print(f"   backfill done in {batches} batches")
+
+
+async def apply_migration(conn, migration):
+    start = time.perf_counter()
+    statements = split_statements(migration.sql)
+
+    if migration.transactional:
+        if any(directives for _, directives in statements):
+            raise MigrationError(f"{migration}: migrate:batch / skip-if need a no-transaction migration")
+
+        async def run_all():
+            async with conn.transaction():
+                for statement, _ in statements:
+                    await conn.execute(statement)
+                await _record(conn, migration, start)
+        await _with_lock_retries(conn, run_all)
+        return
+
+    # Statements are idempotent (IF NOT EXISTS etc.), so a half-applied
+    # no-transaction migration is simply re-run from the top
+    for statement, directives in statements:
+        if "skip-if" in directives and await conn.fetchval(directives["skip-if"]):
+            continue
+        if "batch" in directives:
+            await _run_batches(conn, statement)
+            continue
+        if CONCURRENT_INDEX_RE.search(statement):
+            await _build_index_concurrently(conn, statement)
+        else:
+            await _with_lock_retries(conn, lambda: conn.execute(statement))
+    await _record(conn, migration, start)
+
+
+async def _record(conn, migration, start):
+    await conn.execute(
+        "INSERT INTO schema_migrations (version, name, checksum, duration_ms) VALUES ($1, $2, $3, $4)",
+        migration.version, migration.name, migration.checksum,
+        int((time.perf_counter() - start) * 1000),
+    )
+
+
+async def migrate(database_url, status_only=False):
+    migrations = load_migrations()
+    conn = await asyncpg.connect(database_url)
+    try:
+        # Taken before lock_timeout is set, so a second runner just waits its turn
+        await conn.execute("SELECT pg_advisory_lock($1)", ADVISORY_LOCK_ID)
+        await conn.execute(f"SET lock_timeout = '{MIGRATION_LOCK_TIMEOUT}'")
+        await conn.execute(SCHEMA_MIGRATIONS_SQL)
+        applied = {r["version"]: r for r in await conn.fetch("SELECT * FROM schema_migrations")}
+
+        changed = [m for m in migrations if m.version in applied and applied[m.version]["checksum"] != m.checksum]
+        if changed:
+            names = ", ".join(str(m) for m in changed)
+            raise MigrationError(f"Applied migrations were modified since: {names}. Add a new migration instead.")
+
+        pending = [m for m in migrations if m.version not in applied]
+        if status_only:
+            for m in migrations:
+                row = applied.get(m.version)
+                state = f"applied {row['applied_at']:%Y-%m-%d %H:%M} ({row['duration_ms']} ms)" if row else "pending"
+                print(f"{m}  {state}")
+            return
+
+        if not pending:
+            print("✅ Schema is up to date.")
+            return
+        for m in pending:
+            mode = "" if m.transactional else " (no transaction)"
+            print(f"🛠️  Applying {m}{mode}...")
+            await apply_migration(conn, m)
+        print(f"✅ Applied {len(pending)} migration(s).")
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--status", action="store_true", help="list migrations without applying anything")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("DATABASE_URL is not set")
+
+    try:
+        asyncio.run(migrate(args.database_url, status_only=args.status))
+    except MigrationError as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
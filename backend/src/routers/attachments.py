@@ -0,0 +1,205 @@
+import os
+import re
+from urllib.parse import quote
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from src.schemas.message import AttachmentOut
+from src.core.attachments import ATTACHMENT_FIELDS
+from src.core.database import database
+from src.core.rate_limit import rest_limit
+from src.core.security import get_current_user_id
+from src.core.storage import ATTACHMENT_MAX_BYTES, BlobTooLarge, blob_store
+from src.core.thumbnails import THUMBNAIL_TYPES, thumbnailer
+
+router = APIRouter()
+
+# With nginx in front, set this to an `internal` location aliased to
+# ATTACHMENT_DIR (e.g. /_blobs/) and nginx sends the file itself with
+# sendfile; otherwise FileResponse does (Range requests, and zero-copy
+# http.response.pathsend on servers that support it)
+ATTACHMENT_ACCEL_PREFIX = os.getenv("ATTACHMENT_ACCEL_PREFIX")
+# Only these are shown inline; anything else downloads (no HTML/SVG served from our origin)
+INLINE_TYPES = THUMBNAIL_TYPES
+CONTENT_TYPE_RE = re.compile(r"^[\w.+-]+/[\w.+-]+$")
+BLOB_HEADERS = {
+    "Cache-Control": "private, max-age=31536000, immutable",
+    "X-Content-Type-Options": "nosniff",
+}
+
+
+class UploadParser:
+    # Push parser over a multipart/form-data body: bytes of the first part
+    # with a filename come out of feed() as they arrive, the rest is skipped
+    def __init__(self, boundary):
+        self.filename = None
+        self.content_type = None
+        self.found = False
+        self._in_file = False
+        self._chunks = []
+        self._headers = {}
+        self._field = b""
+        self._value = b""
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field,
+            "on_header_value": self._header_value,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        })
+
+    def feed(self, data):
+        self._parser.write(data)
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+    def finish(self):
+        self._parser.finalize()
+
+    def _part_begin(self):
+        self._headers = {}
+
+    def _header_field(self, data, start, end):
+        self._field += data[start:end]
+
+    def _header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field, self._value = b"", b""
+
+    def _headers_finished(self):
+        _, params = parse_options_header(self._headers.get(b"content-disposition", b""))
+        filename = params.get(b"filename")
+        if filename is None or self.found:
+            return
+        self._in_file = self.found = True
+        self.filename = _clean_filename(filename.decode("utf-8", "replace"))
+        content_type, _ = parse_options_header(self._headers.get(b"content-type", b""))
+        self.content_type = content_type.decode("latin-1").lower()
+
+    def _part_data(self, data, start, end):
+        if self._in_file:
+            self._chunks.append(data[start:end])
+
+    def _part_end(self):
+        self._in_file = False
+
+
+def _clean_filename(name):
+    # Browsers may send a full path ("C:\fakepath\x.png")
+    name = re.split(r"[\\/]", name)[-1].strip().replace("\x00", "")
+    return name[:255] or "file"
+
+
+async def _read_upload(request: Request):
+    # -> (parser, sha, size); the body is hashed and written as it streams in
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > ATTACHMENT_MAX_BYTES + 64 * 1024:
+        raise HTTPException(status_code=413, detail="File too large")
+
+    parser = UploadParser(params[b"boundary"])
+    writer = blob_store.writer()
+    try:
+        async for chunk in request.stream():
+            for data in parser.feed(chunk):
+                await writer.write(data)
+        parser.finish()
+        if not parser.found:
+            raise HTTPException(status_code=400, detail="No file in upload")
+        sha, size, _ = await writer.commit()
+    except BlobTooLarge:
+        await writer.abort()
+        raise HTTPException(status_code=413, detail="File too large")
+    except MultipartParseError:
+        await writer.abort()
+        raise HTTPException(status_code=400, detail="Malformed multipart body")
+    except BaseException:
+        # Includes the client going away mid-upload (ClientDisconnect)
+        await writer.abort()
+        raise
+    return parser, sha, size
+
+
+async def _thumbnail(sha, content_type):
+    # Shared blob, shared thumbnail: only made the first time
+    if content_type not in THUMBNAIL_TYPES or not thumbnailer.enabled:
+        return False
+    if await blob_store.exists(sha, "thumb"):
+        return True
+    path = blob_store.local_path(sha)
+    data = await thumbnailer.make(path) if path else None
+    if not data:
+        return False
+    await blob_store.put_variant(sha, "thumb", data)
+    return True
+
+
+@router.post("/", response_model=AttachmentOut, status_code=201, dependencies=[Depends(rest_limit("upload"))])
+async def upload_attachment(request: Request, user_id: int = Depends(get_current_user_id)):
+    parser, sha, size = await _read_upload(request)
+    content_type = parser.content_type if CONTENT_TYPE_RE.match(parser.content_type or "") else "application/octet-stream"
+    has_thumbnail = await _thumbnail(sha, content_type)
+    row = await database.fetch_one(
+        f"""
+        INSERT INTO attachments (sha256, size, content_type, filename, uploaded_by, has_thumbnail)
+        VALUES (:sha, :size, :ct, :filename, :uid, :thumb)
+        RETURNING {ATTACHMENT_FIELDS}
+        """,
+        values={"sha": sha, "size": size, "ct": content_type, "filename": parser.filename,
+                "uid": user_id, "thumb": has_thumbnail},
+        name="attachment_insert",
+    )
+    return {**row}
+
+
+async def _visible_attachment(attachment_id: int, user_id: int):
+    # Same visibility as message history once it is on a message; until then
+    # only the uploader can fetch it
+    row = await database.fetch_one(
+        """
+        SELECT sha256, content_type, filename, has_thumbnail FROM attachments
+        WHERE id = :id AND (message_id IS NOT NULL OR uploaded_by = :uid)
+        """,
+        values={"id": attachment_id, "uid": user_id},
+        name="attachment_get",
+    )
+    if not row:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    return row
+
+
+async def _blob_response(sha, variant, content_type, filename, disposition):
+    # Blobs never change under a key, so the key is the ETag (If-Range works too)
+    headers = {**BLOB_HEADERS, "ETag": f'"{sha}{"-" + variant if variant else ""}"'}
+    headers["Content-Disposition"] = f"{disposition}; filename*=utf-8''{quote(filename)}" if filename else disposition
+    if ATTACHMENT_ACCEL_PREFIX:
+        # nginx serves the file (and Range) from the internal location
+        accel = ATTACHMENT_ACCEL_PREFIX.rstrip("/") + "/" + blob_store.relative_path(sha, variant).as_posix()
+        return Response(media_type=content_type, headers={**headers, "X-Accel-Redirect": accel})
+    path = blob_store.local_path(sha, variant)
+    if path is None or not await blob_store.exists(sha, variant):
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    return FileResponse(path, media_type=content_type, headers=headers)
+
+
+@router.get("/{attachment_id}")
+async def download_attachment(attachment_id: int, user_id: int = Depends(get_current_user_id)):
+    row = await _visible_attachment(attachment_id, user_id)
+    disposition = "inline" if row["content_type"] in INLINE_TYPES else "attachment"
+    return await _blob_response(row["sha256"], None, row["content_type"], row["filename"], disposition)
+
+
+@router.get("/{attachment_id}/thumbnail")
+async def download_thumbnail(attachment_id: int, user_id: int = Depends(get_current_user_id)):
+    row = await _visible_attachment(attachment_id, user_id)
+    if not row["has_thumbnail"]:
+        raise HTTPException(status_code=404, detail="No thumbnail")
+    return await _blob_response(row["sha256"], "thumb", "image/jpeg", None, "inline")
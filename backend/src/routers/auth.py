@@ -1,14 +1,22 @@
 ﻿from fastapi import APIRouter, HTTPException, status
 from src.schemas.auth import UserRegister, UserLogin, UserOut
 from src.core.database import database
-from src.core.security import get_password_hash, verify_password, create_access_token
+from src.core.security import PasswordQueueFull, password_hasher, create_access_token
+from src.core.user_cache import user_cache
 from asyncpg.exceptions import UniqueViolationError
 
 router = APIRouter()
 
+def _busy():
+    # Too many hashes queued: shed load rather than let logins pile up
+    return HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+
 @router.post("/register", response_model=UserOut)
 async def register(user: UserRegister):
-    hashed_pw = get_password_hash(user.password)
+    try:
+        hashed_pw = await password_hasher.hash(user.password)
+    except PasswordQueueFull:
+        raise _busy()
     # We use a default False for is_online
     query = """
         INSERT INTO users (username, email, password_hash, is_online)
@@ -19,6 +27,8 @@ async def register(user: UserRegister):
     
     try:
         new_user = await database.fetch_one(query=query, values=values)
+        # Drop anything cached under this id (e.g. a recycled id after a reset)
+        user_cache.invalidate(new_user['id'])
         return new_user
     except UniqueViolationError:
         raise HTTPException(status_code=400, detail="Email or Username already exists")
@@ -28,7 +38,11 @@ async def login(creds: UserLogin):
     query = "SELECT * FROM users WHERE email = :email"
     user = await database.fetch_one(query=query, values={"email": creds.email})
 
-    if not user or not verify_password(creds.password, user['password_hash']):
+    try:
+        valid = bool(user) and await password_hasher.verify(creds.password, user['password_hash'])
+    except PasswordQueueFull:
+        raise _busy()
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     # Generate Token
@@ -1,31 +1,112 @@
-﻿from fastapi import APIRouter, HTTPException, Depends, status
-from typing import List
-from src.schemas.channel import ChannelCreate, ChannelOut
-from src.core.database import database
-
-# REMOVED: from src.routers.auth import get_current_user (This was causing the crash)
+﻿from fastapi import APIRouter, HTTPException, Depends, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from typing import List, Optional
+import json
+import os
+from src.schemas.channel import ChannelCreate, ChannelOut, ChannelUnread
+from src.core.database import database, read_database
+from src.core.listing_cache import ListingCache
+from src.core.pagination import InvalidCursor, decode_cursor, encode_cursor
+from src.core.security import get_current_user_id
+from src.sockets import add_channel_member
 
 router = APIRouter()
 
-# Temporary helper: Pretend we are always User #1 until we wire up real JWTs
-async def get_current_user_id():
-    return 1 
+# Sidebar loads are served from here until a channel is created or joined
+channel_list_cache = ListingCache(ttl=float(os.getenv("CHANNEL_CACHE_TTL", "30")))
+# Unread badges stop counting here; the client shows "99+"
+UNREAD_COUNT_CAP = int(os.getenv("UNREAD_COUNT_CAP", "99"))
+
+async def _channel_page(request: Request, key, base_query: str, values: dict, limit: int, cursor: Optional[str]):
+    cached = channel_list_cache.get(key)
+    if cached is None:
+        seek = ""
+        values = {**values, "limit": limit}
+        if cursor:
+            try:
+                ts, cid = decode_cursor(cursor)
+            except InvalidCursor:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            if ts is None:
+                seek = "AND (c.created_at, c.id) < (SELECT created_at, id FROM channels WHERE id = :cid)"
+            else:
+                seek = "AND (c.created_at, c.id) < (:ts, :cid)"
+                values["ts"] = ts
+            values["cid"] = cid
+
+        # member_count is maintained by a trigger on channel_members (migration 004).
+        # Primary, not the read pool: the cache would keep a lagging listing for the whole TTL
+        rows = await database.fetch_all(
+            query=base_query.format(seek=seek) + " ORDER BY c.created_at DESC, c.id DESC LIMIT :limit",
+            values=values,
+            name="channel_list",
+        )
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id']) if len(rows) == limit else None
+        body = json.dumps(jsonable_encoder([ChannelOut(**row) for row in rows])).encode()
+        cached = channel_list_cache.put(key, body, next_cursor)
+
+    headers = {"ETag": cached.etag}
+    if cached.next_cursor:
+        headers["X-Next-Cursor"] = cached.next_cursor
+    if channel_list_cache.matches(cached, request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
 
 @router.get("/", response_model=List[ChannelOut])
-async def get_channels():
-    # Fetch all channels with a count of members
+async def get_channels(request: Request, limit: int = 100, cursor: Optional[str] = None):
     query = """
-        SELECT c.id, c.name, c.description, c.created_at, 
-               COUNT(cm.user_id) as member_count
+        SELECT c.id, c.name, c.description, c.created_at, c.member_count
         FROM channels c
-        LEFT JOIN channel_members cm ON c.id = cm.channel_id
-        GROUP BY c.id
-        ORDER BY c.created_at DESC
+        WHERE TRUE {seek}
     """
-    return await database.fetch_all(query=query)
+    return await _channel_page(request, ("all", limit, cursor), query, {}, limit, cursor)
+
+@router.get("/mine", response_model=List[ChannelOut])
+async def get_my_channels(request: Request, limit: int = 100, cursor: Optional[str] = None,
+                          user_id: int = Depends(get_current_user_id)):
+    query = """
+        SELECT c.id, c.name, c.description, c.created_at, c.member_count
+        FROM channel_members cm
+        JOIN channels c ON c.id = cm.channel_id
+        WHERE cm.user_id = :uid {seek}
+    """
+    return await _channel_page(request, ("mine", user_id, limit, cursor), query, {"uid": user_id}, limit, cursor)
+
+@router.get("/unread", response_model=List[ChannelUnread])
+async def get_unread_counts(user_id: int = Depends(get_current_user_id)):
+    # One capped index range count per membership (read cursors: migration 009),
+    # so the cost follows the number of channels, not the number of messages.
+    # The user's own messages never count as unread
+    rows = await read_database.fetch_all(
+        """
+        SELECT cm.channel_id, rs.last_read_id, (
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM messages m
+                WHERE m.channel_id = cm.channel_id AND m.user_id <> :uid
+                  AND m.created_at >= COALESCE(rs.last_read_at, '-infinity')
+                  AND (m.created_at, m.id) > (COALESCE(rs.last_read_at, '-infinity'), COALESCE(rs.last_read_id, 0))
+                LIMIT :limit
+            ) unread
+        ) AS unread
+        FROM channel_members cm
+        LEFT JOIN channel_read_state rs ON rs.user_id = cm.user_id AND rs.channel_id = cm.channel_id
+        WHERE cm.user_id = :uid
+        """,
+        values={"uid": user_id, "limit": UNREAD_COUNT_CAP + 1},
+        name="unread_counts",
+    )
+    return [
+        {
+            "channel_id": row['channel_id'],
+            "last_read_id": row['last_read_id'],
+            "unread": min(row['unread'], UNREAD_COUNT_CAP),
+            "capped": row['unread'] > UNREAD_COUNT_CAP,
+        }
+        for row in rows
+    ]
 
 @router.post("/", response_model=ChannelOut)
-async def create_channel(channel: ChannelCreate):
+async def create_channel(channel: ChannelCreate, user_id: int = Depends(get_current_user_id)):
     # 1. Create the channel
     query = """
         INSERT INTO channels (name, description)
@@ -33,23 +114,26 @@ async def create_channel(channel: ChannelCreate):
         RETURNING id, name, description, created_at
     """
     values = {"name": channel.name, "desc": channel.description}
-    new_channel = await database.fetch_one(query=query, values=values)
-    
-    # 2. Add the creator (User 1) as a member automatically
-    user_id = await get_current_user_id()
-    await database.execute(
-        "INSERT INTO channel_members (channel_id, user_id) VALUES (:cid, :uid)",
-        values={"cid": new_channel['id'], "uid": user_id}
-    )
+    async with database.transaction():
+        new_channel = await database.fetch_one(query=query, values=values)
+
+        # 2. Add the creator as a member automatically
+        await database.execute(
+            "INSERT INTO channel_members (channel_id, user_id) VALUES (:cid, :uid)",
+            values={"cid": new_channel['id'], "uid": user_id}
+        )
+    channel_list_cache.bump()
+    await add_channel_member(user_id, new_channel['id'])
 
     return {**new_channel, "member_count": 1}
 
 @router.post("/{channel_id}/join")
-async def join_channel(channel_id: int):
-    user_id = await get_current_user_id()
+async def join_channel(channel_id: int, user_id: int = Depends(get_current_user_id)):
     try:
         query = "INSERT INTO channel_members (channel_id, user_id) VALUES (:cid, :uid)"
         await database.execute(query=query, values={"cid": channel_id, "uid": user_id})
+        channel_list_cache.bump()
+        await add_channel_member(user_id, channel_id)
         return {"message": "Joined channel"}
     except Exception:
         return {"message": "Already a member or error"}
@@ -1,19 +1,191 @@
-﻿from fastapi import APIRouter, HTTPException
-from typing import List
-from src.schemas.message import MessageOut
-from src.core.database import database
+﻿from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from typing import List, Optional
+from src.schemas.message import MessageEdit, MessageEdited, MessageOut, MessageSearchResult
+from src.core.attachments import with_attachments
+from src.core.database import database, read_database
+from src.core.pagination import InvalidCursor, decode_cursor, encode_cursor, decode_text_cursor, encode_text_cursor
+from src.core.security import get_current_user_id
+from src.core.rate_limit import rest_limit
+from src.core.user_cache import user_cache
+from src.core.history_cache import history_cache
+from src.core import wire
+from src.sockets import edit_message_content
 
 router = APIRouter()
 
+# Keyset predicates: seek straight into idx_messages_channel_created_id.
+# An id-only cursor resolves its created_at through the primary key.
+# The plain created_at bound is redundant with the row comparison, but it is
+# what lets Postgres prune the monthly partitions (migration 008)
+SEEK_CONDITIONS = {
+    ("before", True): "m.created_at <= :ts AND (m.created_at, m.id) < (:ts, :mid)",
+    ("before", False): "m.created_at <= (SELECT created_at FROM messages WHERE id = :mid)"
+                       " AND (m.created_at, m.id) < (SELECT created_at, id FROM messages WHERE id = :mid)",
+    ("after", True): "m.created_at >= :ts AND (m.created_at, m.id) > (:ts, :mid)",
+    ("after", False): "m.created_at >= (SELECT created_at FROM messages WHERE id = :mid)"
+                      " AND (m.created_at, m.id) > (SELECT created_at, id FROM messages WHERE id = :mid)",
+}
+
+# Ranked full-text search over the GIN-indexed search_vector (migration 006).
+# Only the returned page pays for ts_headline.
+SEARCH_QUERY = """
+    WITH q AS (SELECT websearch_to_tsquery('english', :q) AS query),
+    page AS (
+        SELECT m.id, m.content, m.created_at, m.edited_at, m.channel_id, m.user_id,
+               ts_rank_cd(m.search_vector, q.query) AS rank
+        FROM messages m, q
+        WHERE m.search_vector @@ q.query AND m.user_id IS NOT NULL {scope} {seek}
+        ORDER BY rank DESC, m.id DESC
+        LIMIT :limit
+    )
+    SELECT page.*,
+           ts_headline('english', page.content, q.query,
+                       'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=30, MinWords=10') AS highlight
+    FROM page, q
+    ORDER BY page.rank DESC, page.id DESC
+"""
+
+@router.get("/search", response_model=List[MessageSearchResult], dependencies=[Depends(rest_limit("search"))])
+async def search_messages(
+    q: str,
+    response: Response,
+    channel_id: Optional[int] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    user_id: int = Depends(get_current_user_id),
+):
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Empty search query")
+
+    values = {"q": q, "limit": limit}
+    if channel_id is not None:
+        scope = "AND m.channel_id = :cid"
+        values["cid"] = channel_id
+    else:
+        # Without a channel, search every channel the user belongs to
+        scope = "AND m.channel_id IN (SELECT channel_id FROM channel_members WHERE user_id = :uid)"
+        values["uid"] = user_id
+
+    seek = ""
+    if cursor:
+        try:
+            rank, mid = decode_text_cursor(cursor)
+            values.update({"rank": float(rank), "mid": mid})
+        except (InvalidCursor, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        seek = "AND (ts_rank_cd(m.search_vector, q.query), m.id) < (:rank, :mid)"
+
+    rows = await read_database.fetch_all(SEARCH_QUERY.format(scope=scope, seek=seek), values=values, name="message_search")
+    users = await user_cache.get_many(row["user_id"] for row in rows)
+    rows = [
+        {**row, "sender": users[row["user_id"]]["username"]}
+        for row in rows if row["user_id"] in users
+    ]
+    rows = await with_attachments(rows)
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_text_cursor(repr(rows[-1]["rank"]), rows[-1]["id"])
+    return rows
+
+def _set_next_cursor(response: Response, rows, limit: int, direction: Optional[str]):
+    if len(rows) == limit:
+        edge = rows[0] if direction == "after" else rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(edge["created_at"], edge["id"])
+
+# Clients that send Accept: application/vnd.teachat.columnar+json (or
+# application/msgpack) get the page in the columnar form from core/wire.py
+def _history_page(request: Request, response: Response, rows):
+    response.headers["Vary"] = "Accept"
+    media_type = wire.negotiate(request.headers.get("accept"))
+    if media_type is None:
+        return rows
+    headers = {k: v for k, v in response.headers.items() if k in ("vary", "x-next-cursor")}
+    return Response(wire.encode_page(rows, media_type), media_type=media_type, headers=headers)
+
 @router.get("/{channel_id}", response_model=List[MessageOut])
-async def get_message_history(channel_id: int, limit: int = 50, offset: int = 0):
-    # Retrieve messages with the sender's username
-    query = """
-        SELECT m.id, m.content, m.created_at, m.channel_id, u.username as sender
+async def get_message_history(
+    channel_id: int,
+    request: Request,
+    response: Response,
+    limit: int = 50,
+    offset: int = 0,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+):
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
+
+    values = {"cid": channel_id, "limit": limit}
+    direction = "before" if before else "after" if after else None
+
+    if direction:
+        try:
+            ts, mid = decode_cursor(before or after)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        values["mid"] = mid
+        if ts is not None:
+            values["ts"] = ts
+        seek = "AND " + SEEK_CONDITIONS[(direction, ts is not None)]
+        order = "ASC" if direction == "after" else "DESC"
+        paging = "LIMIT :limit"
+    else:
+        # Legacy offset paging (first page, or clients that still send offset)
+        seek = ""
+        order = "DESC"
+        paging = "LIMIT :limit OFFSET :offset"
+        values["offset"] = offset
+
+    # The newest page of an active channel is usually already in memory
+    first_page = direction is None and offset == 0
+    marker = None
+    if first_page:
+        cached = history_cache.get_page(channel_id, limit)
+        if cached is not None:
+            _set_next_cursor(response, cached, limit, direction)
+            return _history_page(request, response, cached)
+        if history_cache.enabled and limit <= history_cache.per_channel:
+            # Fetch a full buffer's worth so the cache can be primed from this query
+            marker = history_cache.write_marker(channel_id)
+            values["limit"] = history_cache.per_channel
+
+    # id breaks created_at ties; sender names come from the user cache, not a JOIN
+    query = f"""
+        SELECT m.id, m.content, m.created_at, m.edited_at, m.channel_id, m.user_id
         FROM messages m
-        JOIN users u ON m.user_id = u.id
-        WHERE m.channel_id = :cid
-        ORDER BY m.created_at DESC
-        LIMIT :limit OFFSET :offset
+        WHERE m.channel_id = :cid AND m.user_id IS NOT NULL {seek}
+        ORDER BY m.created_at {order}, m.id {order}
+        {paging}
     """
-    return await database.fetch_all(query=query, values={"cid": channel_id, "limit": limit, "offset": offset})
+    # A query that primes the cache goes to the primary: a lagging replica
+    # would leave the buffer missing the newest messages
+    db = database if marker is not None else read_database
+    rows = await db.fetch_all(query=query, values=values, name="message_history")
+    users = await user_cache.get_many(row["user_id"] for row in rows)
+    rows = [
+        {**row, "sender": users[row["user_id"]]["username"]}
+        for row in rows if row["user_id"] in users
+    ]
+    # Cached entries keep their attachments, so a cached page needs no lookup
+    rows = await with_attachments(rows, db)
+
+    if marker is not None:
+        history_cache.prime(channel_id, rows, marker)
+        rows = rows[:limit]
+
+    # Pages are always returned newest first
+    if direction == "after":
+        rows = list(reversed(rows))
+
+    _set_next_cursor(response, rows, limit, direction)
+    return _history_page(request, response, rows)
+
+@router.patch("/{message_id}", response_model=MessageEdited, dependencies=[Depends(rest_limit("edit_message"))])
+async def edit_message(message_id: int, body: MessageEdit, user_id: int = Depends(get_current_user_id)):
+    content = body.content.strip()
+    if not content:
+        raise HTTPException(status_code=400, detail="Message content cannot be empty")
+    edited = await edit_message_content(user_id, message_id, content)
+    if edited is None:
+        # Same answer for "no such message" and "not yours"
+        raise HTTPException(status_code=404, detail="Message not found")
+    return edited
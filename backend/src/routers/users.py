@@ -1,16 +1,100 @@
-﻿from fastapi import APIRouter
-from src.core.database import database
-from typing import List
+﻿from fastapi import APIRouter, HTTPException, Response
+from src.core.database import read_database
+from src.core.pagination import InvalidCursor, decode_text_cursor, encode_text_cursor
+from typing import List, Optional
+from datetime import datetime
 from pydantic import BaseModel
 
 class UserStatus(BaseModel):
     id: int
     username: str
     is_online: bool
+    last_seen: Optional[datetime] = None
 
 router = APIRouter()
 
+def _like_prefix(q: str) -> str:
+    return q.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+# Sync watermark: a user's version is the id of the transaction that last
+# changed it (migration 012), and no transaction older than the oldest one
+# still running can commit any more, so everything below it is settled
+SAFE_VERSION = "txid_snapshot_xmin(txid_current_snapshot()) - 1"
+
 @router.get("/", response_model=List[UserStatus])
-async def get_all_users():
-    # Return all users so we can build the sidebar list
-    return await database.fetch_all("SELECT id, username, is_online FROM users ORDER BY username ASC")
+async def get_all_users(
+    response: Response,
+    limit: int = 200,
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    since: Optional[int] = None,
+):
+    if since is not None:
+        # Delta sync: only users whose profile or presence changed after `since`.
+        # While X-Next-Cursor comes back, call again with the same since and
+        # that cursor; the last page carries the X-Sync-Version for next time.
+        values = {"since": since, "limit": limit}
+        seek = ""
+        if cursor:
+            try:
+                version, uid = decode_text_cursor(cursor)
+                values.update({"version": int(version), "uid": uid})
+            except (InvalidCursor, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            seek = "AND (version, id) > (:version, :uid)"
+        # One statement, so the watermark and the rows come from one snapshot
+        rows = await read_database.fetch_all(
+            f"""
+            WITH s AS (SELECT {SAFE_VERSION} AS safe)
+            SELECT s.safe, u.* FROM s LEFT JOIN LATERAL (
+                SELECT id, username, is_online, last_seen, version FROM users
+                WHERE version > :since AND version <= s.safe {seek}
+                ORDER BY version, id
+                LIMIT :limit
+            ) u ON TRUE
+            """,
+            values=values,
+            name="user_delta_sync",
+        )
+        safe = rows[0]['safe']
+        if since > safe:
+            raise HTTPException(status_code=410, detail="Sync version is ahead of the server; reload the directory")
+        rows = [row for row in rows if row['id'] is not None]
+        if len(rows) == limit:
+            response.headers["X-Next-Cursor"] = encode_text_cursor(str(rows[-1]['version']), rows[-1]['id'])
+        else:
+            response.headers["X-Sync-Version"] = str(safe)
+        return rows
+
+    # Directory listing: keyset-paginated by lower(username), optional prefix search
+    conditions, values = [], {"limit": limit}
+    if q:
+        conditions.append("lower(username) COLLATE \"C\" LIKE :prefix")
+        values["prefix"] = _like_prefix(q)
+    if cursor:
+        try:
+            key, uid = decode_text_cursor(cursor)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        conditions.append("(lower(username) COLLATE \"C\", id) > (:key, :uid)")
+        values.update({"key": key, "uid": uid})
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+
+    if not cursor:
+        # Starting point for later ?since= calls. Read before the listing:
+        # whatever changes from here on has a higher version
+        version = await read_database.fetch_val(f"SELECT {SAFE_VERSION}", name="user_sync_version")
+        response.headers["X-Sync-Version"] = str(version)
+    rows = await read_database.fetch_all(
+        f"""
+        SELECT id, username, is_online, last_seen FROM users
+        {where}
+        ORDER BY lower(username) COLLATE "C", id
+        LIMIT :limit
+        """,
+        values=values,
+        name="user_directory",
+    )
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_text_cursor(rows[-1]['username'].lower(), rows[-1]['id'])
+    return rows
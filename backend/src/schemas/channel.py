@@ -12,4 +12,11 @@ class ChannelOut(BaseModel):
     description: Optional[str] = None
     created_at: datetime
     # We will simply return member count for the list view
-    member_count: int = 0 
+    member_count: int = 0
+
+class ChannelUnread(BaseModel):
+    channel_id: int
+    last_read_id: Optional[int] = None
+    unread: int
+    # True when there are more than UNREAD_COUNT_CAP unread ("99+")
+    capped: bool = False
@@ -1,13 +1,37 @@
 ﻿from pydantic import BaseModel
 from datetime import datetime
+from typing import List, Optional
 
 class MessageCreate(BaseModel):
     content: str
     channel_id: int
 
+class AttachmentOut(BaseModel):
+    id: int
+    filename: str
+    content_type: str
+    size: int
+    has_thumbnail: bool = False
+
 class MessageOut(BaseModel):
     id: int
     content: str
     sender: str  # We return the username, not just the ID
     created_at: datetime
     channel_id: int
+    edited_at: Optional[datetime] = None
+    attachments: List[AttachmentOut] = []
+
+class MessageEdit(BaseModel):
+    content: str
+
+# The message_edited delta: just enough to patch one row in place
+class MessageEdited(BaseModel):
+    id: int
+    channel_id: int
+    content: str
+    edited_at: datetime
+
+class MessageSearchResult(MessageOut):
+    rank: float
+    highlight: str  # content excerpt with matches wrapped in <mark></mark>
@@ -1,56 +1,251 @@
-﻿import socketio
+﻿import os
+import socketio
+from src.core import attachments
 from src.core.database import database
+from src.core.message_writer import WRITE_BEHIND_ENABLED, message_writer
+from src.core.user_cache import user_cache
+from src.core.history_cache import history_cache
+from src.core.pubsub import create_client_manager
+from src.core.backpressure import AsyncServer
+from src.core.fanout import FANOUT_BATCH_MAX, FANOUT_BATCH_MS, BroadcastBatcher
+from src.core.presence import presence
+from src.core.rate_limit import rate_limiter
+from src.core.typing_indicators import typing_throttle
+from src.core.security import InvalidToken, decode_access_token
+from src.core.metrics import METRICS_MAX_ROOMS, instrument_handlers
+from src.core import wire
+from datetime import datetime
 from urllib.parse import parse_qs
 
 # 1. Initialize Socket.IO Server
-sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+# With SOCKETIO_MANAGER_URL set, rooms and emits are shared across uvicorn workers
+# Each socket's outbound queue is bounded (see core/backpressure.py)
+sio = AsyncServer(async_mode='asgi', cors_allowed_origins='*', client_manager=create_client_manager())
 sio_app = socketio.ASGIApp(sio)
+# Chat events for a room can be coalesced into one "batch" frame (FANOUT_BATCH_MS)
+fanout_batcher = BroadcastBatcher(sio, FANOUT_BATCH_MS, FANOUT_BATCH_MAX)
 
-# Helper to update status
-async def update_presence(user_id: int, is_online: bool):
-    if not user_id: return
-    try:
-        query = "UPDATE users SET is_online = :status WHERE id = :uid"
-        await database.execute(query=query, values={"status": is_online, "uid": user_id})
-        await sio.emit('status_update', {"user_id": user_id, "is_online": is_online})
-    except Exception as e:
-        print(f"Error updating presence: {e}")
+# Every socket of a user sits in members:<channel_id> for each channel they belong to
+def members_room(channel_id):
+    return f"members:{channel_id}"
+
+# Presence: the registry batches status changes and calls this once per flush.
+# Each change only goes to sockets that share a channel with that user; users
+# with the same channel set share one emit (socket.io dedupes across rooms).
+async def emit_presence_batch(updates):
+    groups = {}
+    for update in updates:
+        channel_ids = frozenset(presence.channels_of(update["user_id"]))
+        if channel_ids:
+            groups.setdefault(channel_ids, []).append(update)
+    for channel_ids, group in groups.items():
+        await sio.emit('presence_batch', {"updates": group}, to=[members_room(c) for c in channel_ids])
+
+# Called by the REST routers when a user gains a channel membership
+async def add_channel_member(user_id: int, channel_id: int):
+    presence.add_channel(user_id, channel_id)
+    for sid in presence.sids_of(user_id):
+        await sio.enter_room(sid, members_room(channel_id))
+
+# Evicts from the hot buffer and tells the room; channel_id is the message's
+# own, never one a client sent
+async def emit_message_deleted(msg_id, channel_id):
+    history_cache.remove(channel_id, msg_id)
+    room = str(channel_id)
+    await fanout_batcher.emit('message_deleted', {"id": msg_id, "channel_id": room}, room=room)
+
+# Write-behind messages are broadcast before they are written; one the DB
+# rejects is retracted like a delete
+async def emit_message_dropped(record):
+    await emit_message_deleted(record["id"], record["channel_id"])
+
+# Channels are never deleted, so one seen once is remembered for good
+known_channels = set()
+
+async def channel_exists(channel_id: int):
+    if channel_id not in known_channels:
+        found = await database.fetch_val(
+            "SELECT 1 FROM channels WHERE id = :cid", values={"cid": channel_id}, name="channel_exists"
+        )
+        if not found:
+            return False
+        known_channels.add(channel_id)
+    return True
+
+# Typing indicators that were never stopped are cleared by the throttle's sweeper
+async def emit_typing_stop(channel_id, payload):
+    await sio.emit('typing_stop', payload, room=channel_id)
+
+# Over-limit events are dropped. The client gets a rate_limited event (at most
+# once a second per bucket) and, for events with an ack, the same error as the ack
+async def over_limit(sid, event, user_id, channel_id=None):
+    retry_after, notify = rate_limiter.check(event, user_id, channel_id)
+    if retry_after is None:
+        return None
+    error = {"error": "rate_limited", "event": event, "retry_after": round(retry_after, 3)}
+    if notify:
+        await sio.emit('rate_limited', error, to=sid)
+    return error
 
 # --- EVENT HANDLERS ---
 
 @sio.event
-async def connect(sid, environ):
-    query_string = environ.get('QUERY_STRING', '')
-    params = parse_qs(query_string)
-    user_id_list = params.get('user_id')
-    
-    if user_id_list:
-        user_id = int(user_id_list[0])
-        # Save session so we know who to mark offline later
-        await sio.save_session(sid, {'user_id': user_id})
-        await update_presence(user_id, True)
-        print(f"⚡ User {user_id} Connected ({sid})")
-    else:
-        print(f"  Anonymous Connection ({sid})")
+async def connect(sid, environ, auth=None):
+    # Token comes from the Socket.IO auth payload ({token}) or ?token= for older clients
+    token = (auth or {}).get('token')
+    if not token:
+        token = (parse_qs(environ.get('QUERY_STRING', '')).get('token') or [None])[0]
+    try:
+        claims = decode_access_token(token or "")
+    except InvalidToken:
+        print(f"  Rejected unauthenticated connection ({sid})")
+        raise ConnectionRefusedError('authentication failed')
+
+    # Identity is verified once here; events read it from the session
+    user_id = int(claims['sub'])
+    # Opt-in compact wire format (see core/wire.py)
+    compact = wire.WIRE_COMPACT_ENABLED and (auth or {}).get('format') == wire.COMPACT
+    await sio.save_session(sid, {'user_id': user_id, 'compact': compact})
+
+    # Nothing is registered until this succeeds, so a failed connect leaves
+    # nothing behind; and the channels are known before the first presence
+    # flush can announce the user
+    rows = await database.fetch_all(
+        "SELECT channel_id FROM channel_members WHERE user_id = :uid", values={"uid": user_id}, name="member_channels"
+    )
+    channel_ids = [row['channel_id'] for row in rows]
+    presence.set_channels(user_id, channel_ids)
+    for cid in channel_ids:
+        await sio.enter_room(sid, members_room(cid))
+    presence.connect(user_id, sid)
+    if compact:
+        wire.compact_sids.add(sid)
+    print(f"⚡ User {user_id} Connected ({sid})")
 
 @sio.event
 async def disconnect(sid):
+    wire.compact_sids.discard(sid)
     session = await sio.get_session(sid)
     user_id = session.get('user_id')
     if user_id:
-        await update_presence(user_id, False)
+        presence.disconnect(user_id, sid)
         print(f"  User {user_id} Disconnected")
 
+# Reconnect catch-up: more missed messages than this and the client is told
+# to refetch history instead
+CATCH_UP_MAX_MESSAGES = int(os.getenv("CATCH_UP_MAX_MESSAGES", "200"))
+
+def _socket_message(m):
+    # Same shape as the new_message event
+    return {
+        "id": m['id'],
+        "content": m['content'],
+        "sender": m['sender'],
+        "channel_id": str(m['channel_id']),
+        "created_at": m['created_at'].isoformat(),
+        "edited_at": m['edited_at'].isoformat() if m.get('edited_at') else None,
+        "attachments": m.get('attachments') or [],
+    }
+
+# Messages in a channel after last_seen_id, oldest first, or None when the gap
+# is too large (or the anchor message is gone) and the client should refetch
+async def messages_since(channel_id: int, last_seen_id: int, limit: int = CATCH_UP_MAX_MESSAGES):
+    cached = history_cache.since(channel_id, last_seen_id)
+    if cached is not None:
+        return [_socket_message(m) for m in reversed(cached)] if len(cached) <= limit else None
+
+    pending = message_writer.pending(last_seen_id) if WRITE_BEHIND_ENABLED else None
+    if pending:
+        anchor = pending['created_at']
+    else:
+        anchor = await database.fetch_val(
+            "SELECT created_at FROM messages WHERE id = :mid AND channel_id = :cid",
+            values={"mid": last_seen_id, "cid": channel_id},
+            name="message_anchor",
+        )
+        if anchor is None:
+            return None
+
+    # Taken before the seek: a message flushed meanwhile is then in one of the
+    # two (or both; deduped by id), and anything queued later arrives live
+    queued = message_writer.pending_since(channel_id, anchor, last_seen_id) if WRITE_BEHIND_ENABLED else []
+
+    # Forward seek on idx_messages_channel_created_id; one row past the limit
+    # tells us whether the gap is too large
+    rows = await database.fetch_all(
+        """
+        SELECT m.id, m.content, m.created_at, m.edited_at, m.channel_id, m.user_id
+        FROM messages m
+        WHERE m.channel_id = :cid AND m.user_id IS NOT NULL
+          AND m.created_at >= :ts AND (m.created_at, m.id) > (:ts, :mid)
+        ORDER BY m.created_at, m.id
+        LIMIT :limit
+        """,
+        values={"cid": channel_id, "ts": anchor, "mid": last_seen_id, "limit": limit + 1},
+        name="message_catch_up",
+    )
+    if queued:
+        written = {row['id'] for row in rows}
+        rows = [dict(row) for row in rows] + [r for r in queued if r['id'] not in written]
+        rows.sort(key=lambda r: (r['created_at'], r['id']))
+    if len(rows) > limit:
+        return None
+    rows = await attachments.with_attachments(rows, database)
+    users = await user_cache.get_many(row['user_id'] for row in rows)
+    return [
+        _socket_message({**row, "sender": users[row['user_id']]['username']})
+        for row in rows if row['user_id'] in users
+    ]
+
 @sio.event
 async def join_channel(sid, data):
     channel_id = str(data.get("channel_id"))
+    session = await sio.get_session(sid)
+    limited = await over_limit(sid, 'join_channel', session['user_id'])
+    if limited:
+        return limited
+    # Join first: anything sent while we query arrives live (clients dedupe by id)
     await sio.enter_room(sid, channel_id)
 
+    last_seen = data.get("last_seen_message_id")
+    if last_seen is None:
+        return None
+    try:
+        missed = await messages_since(int(channel_id), int(last_seen))
+    except Exception as e:
+        print(f"Error catching up channel {channel_id}: {e}")
+        missed = None
+    # One batched reply; gap=True means "too much missed, refetch history"
+    messages = missed or []
+    if session.get('compact'):
+        messages = wire.columnar(messages)
+    return {"channel_id": channel_id, "messages": messages, "gap": missed is None}
+
 @sio.event
 async def send_message(sid, data):
     content = data.get("content")
     channel_id = str(data.get("channel_id"))
-    user_id = data.get("user_id")
+    user_id = (await sio.get_session(sid))['user_id']
+    limited = await over_limit(sid, 'send_message', user_id, channel_id)
+    if limited:
+        return limited
+    # Uploaded beforehand via POST /api/attachments; a message may be attachments only
+    attachment_ids = attachments.parse_ids(data.get("attachment_ids"))
+    if attachment_ids is None:
+        return {"error": f"attachment_ids must be a list of at most {attachments.ATTACHMENTS_PER_MESSAGE} ids"}
+    if attachment_ids and content is None:
+        content = ""
+    # Checked up front: with write-behind a bad row would only fail at flush
+    # time, after the message went out
+    if not isinstance(content, str) or not (content.strip() or attachment_ids):
+        return {"error": "content is required"}
+    if "\x00" in content:
+        return {"error": "content must not contain NUL characters"}
+    try:
+        if not await channel_exists(int(channel_id)):
+            return {"error": "channel not found"}
+    except ValueError:
+        return {"error": "channel_id is required"}
 
     query = """
         INSERT INTO messages (content, channel_id, user_id)
@@ -58,46 +253,236 @@ async def send_message(sid, data):
         RETURNING id, content, created_at
     """
     try:
-        # DB needs Integer for channel_id
-        msg = await database.fetch_one(query=query, values={"content": content, "cid": int(channel_id), "uid": user_id})
-        user = await database.fetch_one("SELECT username FROM users WHERE id = :uid", values={"uid": user_id})
+        if WRITE_BEHIND_ENABLED:
+            # id/created_at assigned in-process; the row is written by the batch flusher
+            msg = await message_writer.submit(int(channel_id), user_id, content)
+        else:
+            # DB needs Integer for channel_id
+            msg = await database.fetch_one(query=query, values={"content": content, "cid": int(channel_id), "uid": user_id}, name="message_insert")
+        user = await user_cache.get(user_id)
+        # The id is known before the row is written (write-behind), so this
+        # can run before the broadcast either way
+        attached = await attachments.claim(user_id, int(channel_id), msg['id'], attachment_ids)
         
         response_data = {
             "id": msg['id'],
             "content": msg['content'],
             "sender": user['username'],
             "channel_id": channel_id, # Frontend expects String for room matching
-            "created_at": msg['created_at'].isoformat()
+            "created_at": msg['created_at'].isoformat(),
+            "attachments": attached,
         }
+        # Keep the channel's hot history in step before anyone can refetch it
+        history_cache.append({
+            "id": msg['id'],
+            "content": msg['content'],
+            "sender": user['username'],
+            "user_id": user_id,
+            "channel_id": int(channel_id),
+            "created_at": msg['created_at'],
+            "edited_at": None,
+            "attachments": attached,
+        })
         # Room needs String
-        await sio.emit('new_message', response_data, room=channel_id)
+        await fanout_batcher.emit('new_message', response_data, room=channel_id)
+
+        if WRITE_BEHIND_ENABLED and message_writer.ack_persisted:
+            # Sender's ack only fires once the row is committed
+            return {"id": msg['id'], "persisted": await message_writer.wait_persisted(msg)}
+        return {"id": msg['id']}
     except Exception as e:
         print(f"Error saving message: {e}")
 
 # --- NEW: TYPING INDICATORS ---
+# Throttled per (user, channel): a fast typist relays at most one typing_start per interval
+# The payload is built here from the session: clients only say which channel
+async def _typing_payload(sid, data):
+    # -> (channel_id, payload), or None unless the socket is in that channel's room
+    try:
+        channel_id = str(int(data['channel_id']))
+    except (KeyError, TypeError, ValueError):
+        return None
+    if channel_id not in sio.rooms(sid):
+        return None
+    user_id = (await sio.get_session(sid))['user_id']
+    user = await user_cache.get(user_id)
+    if user is None:
+        return None
+    return channel_id, {"channel_id": channel_id, "user_id": user_id, "username": user['username']}
+
 @sio.event
 async def typing_start(sid, data):
-    # data: { channel_id, username }
-    # Broadcast to room EXCLUDING the sender (skip_sid)
-    await sio.emit('typing_start', data, room=str(data['channel_id']), skip_sid=sid)
+    # data: { channel_id }
+    typing = await _typing_payload(sid, data)
+    if typing is None:
+        return
+    channel_id, payload = typing
+    if await over_limit(sid, 'typing_start', payload['user_id']):
+        return
+    if typing_throttle.start(payload['user_id'], channel_id, payload):
+        # Broadcast to room EXCLUDING the sender (skip_sid)
+        await sio.emit('typing_start', payload, room=channel_id, skip_sid=sid)
 
 @sio.event
 async def typing_stop(sid, data):
-    await sio.emit('typing_stop', data, room=str(data['channel_id']), skip_sid=sid)
+    typing = await _typing_payload(sid, data)
+    if typing is None:
+        return
+    channel_id, payload = typing
+    if typing_throttle.stop(payload['user_id'], channel_id):
+        await sio.emit('typing_stop', payload, room=channel_id, skip_sid=sid)
 
 # --- NEW: DELETE MESSAGE ---
 @sio.event
 async def delete_message(sid, data):
-    msg_id = data.get("message_id")
-    user_id = data.get("user_id")
-    channel_id = str(data.get("channel_id"))
+    user_id = (await sio.get_session(sid))['user_id']
+    if await over_limit(sid, 'delete_message', user_id):
+        return
+    try:
+        msg_id = int(data["message_id"])
+    except (KeyError, TypeError, ValueError):
+        return
     
     # 1. Verify ownership (Security Check: Only author can delete)
-    query = "SELECT user_id FROM messages WHERE id = :id"
-    msg = await database.fetch_one(query, values={"id": msg_id})
+    pending = message_writer.pending(msg_id) if WRITE_BEHIND_ENABLED else None
+    if pending:
+        if pending['user_id'] != user_id:
+            return
+        if message_writer.discard(msg_id):
+            # Never reached the DB, so there is nothing to delete there (but
+            # its attachments were claimed straight away)
+            await attachments.release(msg_id)
+            await emit_message_deleted(msg_id, pending['channel_id'])
+            return
+        # Mid-flush: let the row land, then delete it normally
+        await message_writer.wait_persisted(pending)
+
+    query = "SELECT user_id, channel_id FROM messages WHERE id = :id"
+    msg = await database.fetch_one(query, values={"id": msg_id}, name="message_owner")
     
     if msg and msg['user_id'] == user_id:
         # 2. Delete from DB
-        await database.execute("DELETE FROM messages WHERE id = :id", values={"id": msg_id})
+        await database.execute("DELETE FROM messages WHERE id = :id", values={"id": msg_id}, name="message_delete")
+        await attachments.release(msg_id)
         # 3. Broadcast Deletion Event to remove from UI
-        await sio.emit('message_deleted', {"id": msg_id, "channel_id": channel_id}, room=channel_id)
\ No newline at end of file
+        await emit_message_deleted(msg_id, msg['channel_id'])
+
+# --- READ CURSORS ---
+# Moves the user's read cursor for a channel forward to message_id (never back)
+# and tells their other sockets, so badges clear on every device.
+@sio.event
+async def mark_read(sid, data):
+    user_id = (await sio.get_session(sid))['user_id']
+    limited = await over_limit(sid, 'mark_read', user_id)
+    if limited:
+        return limited
+    try:
+        channel_id, msg_id = int(data["channel_id"]), int(data["message_id"])
+    except (KeyError, TypeError, ValueError):
+        return {"error": "channel_id and message_id are required"}
+
+    pending = message_writer.pending(msg_id) if WRITE_BEHIND_ENABLED else None
+    if pending and pending['channel_id'] == channel_id:
+        read_at = pending['created_at']
+    else:
+        read_at = await database.fetch_val(
+            "SELECT created_at FROM messages WHERE id = :mid AND channel_id = :cid",
+            values={"mid": msg_id, "cid": channel_id},
+            name="message_anchor",
+        )
+        if read_at is None:
+            return {"error": "not found"}
+
+    row = await database.fetch_one(
+        """
+        INSERT INTO channel_read_state (user_id, channel_id, last_read_id, last_read_at)
+        SELECT :uid, :cid, :mid, :ts
+        WHERE EXISTS (SELECT 1 FROM channel_members WHERE user_id = :uid AND channel_id = :cid)
+        ON CONFLICT (user_id, channel_id) DO UPDATE
+        SET last_read_id = EXCLUDED.last_read_id, last_read_at = EXCLUDED.last_read_at, updated_at = NOW()
+        WHERE (channel_read_state.last_read_at, channel_read_state.last_read_id)
+            < (EXCLUDED.last_read_at, EXCLUDED.last_read_id)
+        RETURNING last_read_id
+        """,
+        values={"uid": user_id, "cid": channel_id, "mid": msg_id, "ts": read_at},
+        name="mark_read",
+    )
+    if row:
+        state = {"channel_id": channel_id, "last_read_id": msg_id}
+        for other in presence.sids_of(user_id):
+            if other != sid:
+                await sio.emit('read_state', state, to=other)
+    return {"channel_id": channel_id, "last_read_id": msg_id, "advanced": row is not None}
+
+# --- EDIT MESSAGE ---
+# Shared by the edit_message event and PATCH /api/messages/{id}. Returns the
+# message_edited delta, or None when the message doesn't exist or isn't the user's.
+async def edit_message_content(user_id: int, msg_id: int, content: str):
+    pending = message_writer.pending(msg_id) if WRITE_BEHIND_ENABLED else None
+    if pending:
+        if pending['user_id'] != user_id:
+            return None
+        # Naive UTC, like the queued created_at (sessions are pinned to UTC)
+        edited_at = datetime.utcnow()
+        if message_writer.edit(msg_id, content, edited_at):
+            # Not written yet: the INSERT will carry the new content
+            channel_id = pending['channel_id']
+        else:
+            # Mid-flush: let the row land, then update it normally
+            await message_writer.wait_persisted(pending)
+            pending = None
+
+    if not pending:
+        # Ownership check and update in one statement; the DB clock stamps it
+        row = await database.fetch_one(
+            """
+            UPDATE messages SET content = :content, edited_at = NOW()
+            WHERE id = :id AND user_id = :uid
+            RETURNING channel_id, edited_at
+            """,
+            values={"content": content, "id": msg_id, "uid": user_id},
+            name="message_edit",
+        )
+        if not row:
+            return None
+        channel_id, edited_at = row['channel_id'], row['edited_at']
+
+    history_cache.edit(channel_id, msg_id, content, edited_at)
+    delta = {"id": msg_id, "channel_id": str(channel_id), "content": content, "edited_at": edited_at.isoformat()}
+    # Only the changed fields go out; clients patch the row in place
+    await fanout_batcher.emit('message_edited', delta, room=str(channel_id))
+    return {**delta, "channel_id": channel_id, "edited_at": edited_at}
+
+@sio.event
+async def edit_message(sid, data):
+    user_id = (await sio.get_session(sid))['user_id']
+    limited = await over_limit(sid, 'edit_message', user_id)
+    if limited:
+        return limited
+    content = (data.get("content") or "").strip()
+    if not content or data.get("message_id") is None:
+        return {"error": "content and message_id are required"}
+    try:
+        edited = await edit_message_content(user_id, int(data["message_id"]), content)
+    except Exception as e:
+        print(f"Error editing message: {e}")
+        return {"error": "edit failed"}
+    if edited is None:
+        return {"error": "not found"}
+    return {"id": edited["id"], "edited_at": edited["edited_at"].isoformat()}
+
+# --- METRICS ---
+# Read when /metrics is scraped (this worker's sockets and rooms only)
+def metric_samples():
+    yield "connected_sockets", {}, len(sio.eio.sockets)
+    rooms = sio.manager.rooms.get('/', {})
+    sizes = sorted(
+        ((room, len(members)) for room, members in rooms.items() if isinstance(room, str) and room.isdigit()),
+        key=lambda r: r[1], reverse=True,
+    )
+    yield "channel_rooms", {}, len(sizes)
+    for room, n in sizes[:METRICS_MAX_ROOMS]:
+        yield "room_members", {"room": room}, n
+
+# Every handler above gets timed; keep this after the last @sio.event
+instrument_handlers(sio)
@@ -1,4 +1,5 @@
 ﻿import asyncio
+import os
 import socketio
 
 # Initialize Client
@@ -20,14 +21,14 @@ async def new_message(data):
     print(f"   Says: {data['content']}")
 
 async def main():
-    await sio.connect('http://localhost:4000')
+    # Use the access_token returned by POST /api/auth/login
+    await sio.connect('http://localhost:4000', auth={'token': os.environ['TEACHAT_TOKEN']})
     
-    # Send a message acting as User 1 in Channel 1
+    # Send a message as the token's user in Channel 1
     print("📤 Sending message...")
     await sio.emit('send_message', {
         'content': 'Hello from the Python Test Script!',
-        'channel_id': 1,
-        'user_id': 1
+        'channel_id': 1
     })
     
     # Keep alive long enough to receive the reply
@@ -3,9 +3,10 @@ import { io } from 'socket.io-client';
 import { motion, AnimatePresence } from 'framer-motion';
 import { 
   Users, Hash, LogOut, Send, PlusCircle, X, 
-  MessageSquare, Settings, Zap, Search, ArrowUpCircle, Trash2, Loader2, Menu 
+  MessageSquare, Settings, Zap, Search, ArrowUpCircle, Trash2, Pencil, Loader2, Menu, Paperclip, FileText 
 } from 'lucide-react'; // Added 'Menu' to imports
 import api from '../api';
+import { WIRE_FORMAT, COLUMNAR, decoded, decodeMessages } from '../wire';
 
 // --- Visual Components ---
 const TeachatMiniLogo = () => { 
@@ -30,13 +31,58 @@ const TeachatMiniLogo = () => {
   );
 };
 
+// Attachment downloads need the bearer token, so they are fetched as blobs
+const openAttachment = async (att) => {
+  const res = await api.get(`/attachments/${att.id}`, { responseType: 'blob' });
+  const url = URL.createObjectURL(res.data);
+  const link = document.createElement('a');
+  link.href = url;
+  if (!att.content_type.startsWith('image/')) link.download = att.filename;
+  link.target = '_blank';
+  link.click();
+  setTimeout(() => URL.revokeObjectURL(url), 60000);
+};
+
+const formatSize = (bytes) => bytes < 1024 ? `${bytes} B` : bytes < 1048576 ? `${(bytes / 1024).toFixed(0)} KB` : `${(bytes / 1048576).toFixed(1)} MB`;
+
+const AttachmentThumbnail = ({ att }) => {
+  const [src, setSrc] = useState(null);
+  useEffect(() => {
+    let url = null;
+    api.get(`/attachments/${att.id}/thumbnail`, { responseType: 'blob' })
+      .then(res => { url = URL.createObjectURL(res.data); setSrc(url); })
+      .catch(() => {});
+    return () => { if (url) URL.revokeObjectURL(url); };
+  }, [att.id]);
+  return src
+    ? <img src={src} alt={att.filename} className="max-w-[240px] max-h-[240px] rounded-lg cursor-pointer" onClick={() => openAttachment(att)} />
+    : <div className="w-40 h-24 rounded-lg bg-black/30 animate-pulse" />;
+};
+
+const AttachmentList = ({ attachments }) => (
+  <div className="flex flex-wrap gap-2 mt-2">
+    {attachments.map(att => att.has_thumbnail ? (
+      <AttachmentThumbnail key={att.id} att={att} />
+    ) : (
+      <button key={att.id} type="button" onClick={() => openAttachment(att)} className="flex items-center gap-2 px-3 py-2 rounded-lg bg-black/30 hover:bg-black/50 text-xs transition-colors">
+        <FileText className="w-4 h-4 shrink-0" />
+        <span className="truncate max-w-[180px]">{att.filename}</span>
+        <span className="opacity-60">{formatSize(att.size)}</span>
+      </button>
+    ))}
+  </div>
+);
+
 export default function ChatPage({ user, onLogout }) {
   // --- State ---
   const [channels, setChannels] = useState([]);
+  const [unread, setUnread] = useState({}); // channel_id -> { unread, capped }
   const [allUsers, setAllUsers] = useState([]); 
   const [activeChannel, setActiveChannel] = useState(null);
   const [messages, setMessages] = useState([]);
   const [messageInput, setMessageInput] = useState('');
+  const [pendingAttachments, setPendingAttachments] = useState([]); // uploaded, not sent yet
+  const [uploading, setUploading] = useState(false);
   const [socket, setSocket] = useState(null);
   const [showCreateModal, setShowCreateModal] = useState(false);
   const [newChannelName, setNewChannelName] = useState('');
@@ -52,12 +98,18 @@ export default function ChatPage({ user, onLogout }) {
   const [isMobileMenuOpen, setIsMobileMenuOpen] = useState(false);
   
   const typingTimeoutRef = useRef(null); 
+  const fileInputRef = useRef(null);
+  const resyncRef = useRef(false);
+  const messagesRef = useRef([]);
+  messagesRef.current = messages;
+  const lastReadRef = useRef({}); // channel_id -> last message id sent in mark_read
 
   // 1. INITIALIZE SOCKET
   useEffect(() => {
     const newSocket = io('https://teachat-backend.onrender.com',  {
       transports: ['websocket', 'polling'],
-      query: { user_id: user.id } 
+      // Compact event payloads (see wire.js)
+      auth: { token: localStorage.getItem('token'), format: WIRE_FORMAT }
     });
     setSocket(newSocket);
     fetchChannels();
@@ -70,7 +122,7 @@ export default function ChatPage({ user, onLogout }) {
     if (!socket) return;
 
     // MESSAGE RECEIVED
-    socket.on('new_message', (msg) => {
+    socket.on('new_message', decoded('new_message', (msg) => {
       if (activeChannel && String(msg.channel_id) === String(activeChannel.id)) {
         setMessages((prev) => {
           const exists = prev.some(m => m.id === msg.id || (m.tempId && m.content === msg.content));
@@ -79,14 +131,15 @@ export default function ChatPage({ user, onLogout }) {
         });
         setOffset(prev => prev + 1);
       }
-    });
+    }));
 
-    // PRESENCE
-    socket.on('status_update', (update) => {
+    // PRESENCE (server sends status changes in batches)
+    socket.on('presence_batch', decoded('presence_batch', ({ updates }) => {
+      const changed = new Map(updates.map(update => [update.user_id, update.is_online]));
       setAllUsers(prevUsers => prevUsers.map(u => 
-        u.id === update.user_id ? { ...u, is_online: update.is_online } : u
+        changed.has(u.id) ? { ...u, is_online: changed.get(u.id) } : u
       ));
-    });
+    }));
 
     // TYPING INDICATORS
     socket.on('typing_start', (data) => {
@@ -106,18 +159,90 @@ export default function ChatPage({ user, onLogout }) {
     });
 
     // MESSAGE DELETED
-    socket.on('message_deleted', (data) => {
+    socket.on('message_deleted', decoded('message_deleted', (data) => {
       if (activeChannel && String(data.channel_id) === String(activeChannel.id)) {
         setMessages(prev => prev.filter(m => m.id !== data.id));
       }
+    }));
+
+    // MESSAGE EDITED (delta: id, content, edited_at)
+    socket.on('message_edited', decoded('message_edited', (data) => {
+      if (activeChannel && String(data.channel_id) === String(activeChannel.id)) {
+        setMessages(prev => prev.map(m =>
+          m.id === data.id ? { ...m, content: data.content, edited_at: data.edited_at } : m
+        ));
+      }
+    }));
+
+    // RATE LIMITED: the server dropped the event; unsent optimistic messages go away
+    socket.on('rate_limited', ({ event, retry_after }) => {
+      console.warn(`Rate limited on ${event}, retry in ${retry_after}s`);
+      if (event === 'send_message') {
+        setMessages(prev => prev.filter(m => !m.tempId));
+      }
+    });
+
+    // READ ON ANOTHER DEVICE
+    socket.on('read_state', (data) => {
+      setUnread(prev => ({ ...prev, [data.channel_id]: { unread: 0, capped: false } }));
+    });
+
+    // BATCHED BROADCASTS (server may coalesce a room's events into one frame)
+    socket.on('batch', (items) => {
+      items.forEach(([event, data]) => {
+        socket.listeners(event).forEach(handler => handler(data));
+      });
+    });
+
+    // SLOW CONNECTION: the server dropped our backlog and will close the socket;
+    // once it reconnects, rejoin and reload instead of trusting the gap
+    socket.on('resync', () => {
+      resyncRef.current = true;
+    });
+    // RECONNECT: rejoin the room and ask only for what we missed since the
+    // newest message we have; reload the page if the gap is too big
+    socket.on('connect', async () => {
+      if (!activeChannel) return;
+      const lastSeen = messagesRef.current.find(m => !m.tempId);
+      if (resyncRef.current || !lastSeen) {
+        resyncRef.current = false;
+        socket.emit('join_channel', { channel_id: activeChannel.id });
+        loadMessages(activeChannel.id, 0, true);
+        return;
+      }
+      try {
+        const res = await socket.timeout(10000).emitWithAck('join_channel', {
+          channel_id: activeChannel.id, last_seen_message_id: lastSeen.id
+        });
+        if (res.gap) {
+          loadMessages(activeChannel.id, 0, true);
+          return;
+        }
+        // Oldest first; skip anything that already arrived live
+        const caughtUp = decodeMessages(res.messages);
+        setMessages(prev => {
+          const known = new Set(prev.map(m => m.id));
+          const missed = caughtUp.filter(m => !known.has(m.id)).reverse();
+          return missed.length ? [...missed, ...prev] : prev;
+        });
+        setOffset(prev => prev + caughtUp.length);
+      } catch (err) {
+        loadMessages(activeChannel.id, 0, true);
+      }
     });
 
     return () => {
       socket.off('new_message');
-      socket.off('status_update');
+      socket.off('batch');
+      socket.off('resync');
+      socket.off('connect');
+      socket.off('presence_batch');
       socket.off('typing_start');
       socket.off('typing_stop');
       socket.off('message_deleted');
+      socket.off('message_edited');
+      socket.off('read_state');
+      socket.off('rate_limited');
     };
   }, [socket, activeChannel]);
 
@@ -135,17 +260,38 @@ export default function ChatPage({ user, onLogout }) {
     }
   }, [activeChannel, socket]);
 
+  // 4. READ CURSOR: mark the newest message of the open channel as read
+  // (debounced, so a burst of messages is one mark_read)
+  useEffect(() => {
+    if (!socket || !activeChannel) return;
+    const newest = messages.find(m => !m.tempId);
+    if (!newest || lastReadRef.current[activeChannel.id] === newest.id) return;
+    const timer = setTimeout(() => {
+      lastReadRef.current[activeChannel.id] = newest.id;
+      socket.emit('mark_read', { channel_id: activeChannel.id, message_id: newest.id });
+      setUnread(prev => ({ ...prev, [activeChannel.id]: { unread: 0, capped: false } }));
+    }, 1000);
+    return () => clearTimeout(timer);
+  }, [messages, activeChannel, socket]);
+
+  // 5. UNREAD BADGES: one capped count per channel, refreshed periodically
+  useEffect(() => {
+    fetchUnread();
+    const interval = setInterval(fetchUnread, 30000);
+    return () => clearInterval(interval);
+  }, []);
+
   // --- ACTIONS ---
 
   const handleInputChange = (e) => {
     setMessageInput(e.target.value);
     
     if (socket && activeChannel) {
-      socket.emit('typing_start', { channel_id: activeChannel.id, username: user.username });
+      socket.emit('typing_start', { channel_id: activeChannel.id });
       
       if (typingTimeoutRef.current) clearTimeout(typingTimeoutRef.current);
       typingTimeoutRef.current = setTimeout(() => {
-        socket.emit('typing_stop', { channel_id: activeChannel.id, username: user.username });
+        socket.emit('typing_stop', { channel_id: activeChannel.id });
       }, 2000);
     }
   };
@@ -160,16 +306,26 @@ export default function ChatPage({ user, onLogout }) {
     }
   };
 
+  const handleEditMessage = (msg) => {
+    const content = window.prompt("Edit message", msg.content);
+    if (content && content.trim() && content !== msg.content) {
+      socket.emit('edit_message', { message_id: msg.id, content });
+    }
+  };
+
   const loadMessages = async (channelId, currentOffset, isInitial = false) => {
     try {
       const limit = 20;
-      const res = await api.get(`/messages/${channelId}?limit=${limit}&offset=${currentOffset}`);
-      if (res.data.length < limit) setHasMore(false);
+      const res = await api.get(`/messages/${channelId}?limit=${limit}&offset=${currentOffset}`, {
+        headers: { Accept: COLUMNAR }
+      });
+      const page = decodeMessages(res.data);
+      if (page.length < limit) setHasMore(false);
       if (isInitial) {
-        setMessages(res.data);
+        setMessages(page);
         setOffset(limit);
       } else {
-        setMessages(prev => [...prev, ...res.data]);
+        setMessages(prev => [...prev, ...page]);
         setOffset(prev => prev + limit);
       }
     } catch (err) { console.error(err); }
@@ -183,6 +339,13 @@ export default function ChatPage({ user, onLogout }) {
     } catch (err) { console.error(err); }
   };
 
+  const fetchUnread = async () => {
+    try {
+      const res = await api.get('/channels/unread');
+      setUnread(Object.fromEntries(res.data.map(c => [c.channel_id, c])));
+    } catch (err) { console.error(err); }
+  };
+
   const fetchUsers = async () => {
     try {
       const res = await api.get('/users');
@@ -190,25 +353,48 @@ export default function ChatPage({ user, onLogout }) {
     } catch (err) { console.error(err); }
   };
 
+  // Files go up over HTTP first; the message then just carries their ids
+  const handleFileSelect = async (e) => {
+    const files = Array.from(e.target.files || []);
+    e.target.value = '';
+    if (!files.length) return;
+    setUploading(true);
+    try {
+      for (const file of files) {
+        const form = new FormData();
+        form.append('file', file);
+        const res = await api.post('/attachments/', form, { headers: { 'Content-Type': 'multipart/form-data' } });
+        setPendingAttachments(prev => [...prev, res.data]);
+      }
+    } catch (err) {
+      alert(err.response?.status === 413 ? 'File is too large' : 'Upload failed');
+    } finally {
+      setUploading(false);
+    }
+  };
+
   const handleSendMessage = async (e) => {
     e.preventDefault();
-    if (!messageInput.trim() || !activeChannel) return;
+    if ((!messageInput.trim() && !pendingAttachments.length) || !activeChannel || uploading) return;
 
     const tempContent = messageInput;
+    const tempAttachments = pendingAttachments;
     setMessageInput('');
-    socket.emit('typing_stop', { channel_id: activeChannel.id, username: user.username });
+    setPendingAttachments([]);
+    socket.emit('typing_stop', { channel_id: activeChannel.id });
 
     const tempMsg = {
       id: Date.now(), tempId: Date.now(), content: tempContent,
       sender: user.username, created_at: new Date().toISOString(),
-      channel_id: String(activeChannel.id)
+      channel_id: String(activeChannel.id), attachments: tempAttachments
     };
     
     setMessages((prev) => [tempMsg, ...prev]);
     setOffset(prev => prev + 1);
 
     socket.emit('send_message', {
-      content: tempContent, channel_id: activeChannel.id, user_id: user.id
+      content: tempContent, channel_id: activeChannel.id, user_id: user.id,
+      attachment_ids: tempAttachments.map(a => a.id)
     });
   };
 
@@ -272,6 +458,9 @@ export default function ChatPage({ user, onLogout }) {
               {channels.map(channel => (
                 <motion.div key={channel.id} onClick={() => setActiveChannel(channel)} whileHover={{ x: 4 }} className={`group cursor-pointer px-3 py-2.5 rounded-xl text-sm font-medium transition-all duration-200 flex items-center gap-3 ${activeChannel?.id === channel.id ? 'bg-indigo-600/20 text-indigo-300 border border-indigo-500/30 shadow-[0_0_15px_-5px_rgba(79,70,229,0.3)]' : 'text-gray-400 hover:bg-white/5 hover:text-white'}`}>
                   <span className={`text-lg ${activeChannel?.id === channel.id ? 'text-indigo-400' : 'text-gray-600 group-hover:text-gray-400'}`}>#</span>{channel.name}
+                  {activeChannel?.id !== channel.id && unread[channel.id]?.unread > 0 && (
+                    <span className="ml-auto text-[10px] font-bold text-white bg-indigo-600 px-2 py-0.5 rounded-full">{unread[channel.id].unread}{unread[channel.id].capped && '+'}</span>
+                  )}
                 </motion.div>
               ))}
             </div>
@@ -377,6 +566,8 @@ export default function ChatPage({ user, onLogout }) {
                     </div>
                     <div className={`relative px-5 py-3 rounded-2xl text-sm leading-relaxed shadow-md backdrop-blur-sm ${isMe ? 'bg-indigo-600/80 text-white rounded-br-none border border-indigo-500/50' : 'bg-gray-800/80 text-gray-200 rounded-bl-none border border-white/5'}`}>
                       {msg.content}
+                      {msg.edited_at && <span className="ml-2 text-[10px] opacity-60">(edited)</span>}
+                      {msg.attachments?.length > 0 && <AttachmentList attachments={msg.attachments} />}
                       
                       {/* DELETE BUTTON (Hover) */}
                       {isMe && (
@@ -388,6 +579,17 @@ export default function ChatPage({ user, onLogout }) {
                           <Trash2 className="w-3.5 h-3.5" />
                         </button>
                       )}
+
+                      {/* EDIT BUTTON (Hover) */}
+                      {isMe && msg.id && (
+                        <button 
+                          onClick={() => handleEditMessage(msg)}
+                          className="absolute -left-16 top-1/2 -translate-y-1/2 p-1.5 text-gray-500 hover:text-indigo-300 bg-gray-900/50 rounded-full opacity-0 group-hover:opacity-100 transition-opacity"
+                          title="Edit Message"
+                        >
+                          <Pencil className="w-3.5 h-3.5" />
+                        </button>
+                      )}
                     </div>
                   </div>
                 </motion.div>
@@ -409,11 +611,23 @@ export default function ChatPage({ user, onLogout }) {
 
         {/* Input Area */}
         <div className="p-4 md:p-6 bg-black/40 border-t border-white/10 z-20 backdrop-blur-md">
+          {pendingAttachments.length > 0 && (
+            <div className="max-w-4xl mx-auto flex flex-wrap gap-2 mb-3">
+              {pendingAttachments.map(att => (
+                <span key={att.id} className="flex items-center gap-2 px-3 py-1.5 rounded-lg bg-gray-800/80 text-xs text-gray-300 border border-white/10">
+                  <Paperclip className="w-3.5 h-3.5" />
+                  <span className="truncate max-w-[160px]">{att.filename}</span>
+                  <button type="button" onClick={() => setPendingAttachments(prev => prev.filter(a => a.id !== att.id))} className="text-gray-500 hover:text-white"><X className="w-3.5 h-3.5" /></button>
+                </span>
+              ))}
+            </div>
+          )}
           <form onSubmit={handleSendMessage} className="relative max-w-4xl mx-auto flex items-center gap-2 md:gap-4">
-            <button type="button" className="text-gray-400 hover:text-white transition-colors"><PlusCircle className="w-6 h-6" /></button>
+            <input type="file" multiple ref={fileInputRef} onChange={handleFileSelect} className="hidden" />
+            <button type="button" onClick={() => fileInputRef.current?.click()} disabled={!activeChannel || uploading} title="Attach files" className="text-gray-400 hover:text-white transition-colors disabled:opacity-50">{uploading ? <Loader2 className="w-6 h-6 animate-spin" /> : <PlusCircle className="w-6 h-6" />}</button>
             <div className="relative flex-1">
               <input type="text" value={messageInput} onChange={handleInputChange} placeholder={`Message #${activeChannel?.name || '...'}`} disabled={!activeChannel} className="w-full bg-gray-900/80 text-white placeholder-gray-500 rounded-xl pl-4 pr-12 py-3 md:py-4 border border-white/10 focus:border-indigo-500/50 focus:ring-1 focus:ring-indigo-500/50 focus:outline-none transition-all shadow-inner text-sm md:text-base" />
-              <button type="submit" disabled={!activeChannel || !messageInput.trim()} className="absolute right-2 top-1/2 -translate-y-1/2 p-1.5 md:p-2 bg-indigo-600 text-white rounded-lg hover:bg-indigo-500 disabled:opacity-50 disabled:bg-gray-700 transition-all transform active:scale-95"><Send className="w-4 h-4" /></button>
+              <button type="submit" disabled={!activeChannel || uploading || (!messageInput.trim() && !pendingAttachments.length)} className="absolute right-2 top-1/2 -translate-y-1/2 p-1.5 md:p-2 bg-indigo-600 text-white rounded-lg hover:bg-indigo-500 disabled:opacity-50 disabled:bg-gray-700 transition-all transform active:scale-95"><Send className="w-4 h-4" /></button>
             </div>
           </form>
           <div className="text-center mt-2 hidden md:block"><span className="text-[10px] text-gray-600">Press Enter to send Ã¢â‚¬Â¢ Shift + Enter for new line</span></div>
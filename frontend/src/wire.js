@@ -0,0 +1,60 @@
+// Decoders for the compact wire format (backend/src/core/wire.py). Payloads
+// are turned back into the objects the JSON format carries, so the rest of
+// the UI doesn't care which one the server sent.
+
+export const WIRE_FORMAT = 'compact';
+export const COLUMNAR = 'application/vnd.teachat.columnar+json';
+
+// Epoch ms -> the same naive UTC ISO strings the JSON format uses
+const iso = (ms) => (ms == null ? null : new Date(ms).toISOString().slice(0, -1));
+
+const attachment = ([id, filename, content_type, size, has_thumbnail]) => ({
+  id, filename, content_type, size, has_thumbnail
+});
+
+const message = ([id, channelId, sender, content, createdAt, editedAt = null, attachments = []]) => ({
+  id, channel_id: String(channelId), sender, content,
+  created_at: iso(createdAt), edited_at: iso(editedAt), attachments: attachments.map(attachment)
+});
+
+const decoders = {
+  new_message: message,
+  message_edited: ([id, channelId, content, editedAt]) => ({
+    id, channel_id: String(channelId), content, edited_at: iso(editedAt)
+  }),
+  message_deleted: ([id, channelId]) => ({ id, channel_id: String(channelId) }),
+  presence_batch: (updates) => ({
+    updates: updates.map(([user_id, online, lastSeen]) => ({ user_id, is_online: !!online, last_seen: iso(lastSeen) }))
+  }),
+};
+
+// Compact payloads are arrays; anything else already has the JSON shape
+export const decodeEvent = (event, data) =>
+  Array.isArray(data) && decoders[event] ? decoders[event](data) : data;
+
+// socket.on('new_message', decoded('new_message', (msg) => ...))
+export const decoded = (event, handler) => (data) => handler(decodeEvent(event, data));
+
+// Columnar message list (history page, reconnect catch-up) -> array of messages
+export const decodeMessages = (page) => {
+  if (Array.isArray(page)) return page;
+  const out = [];
+  let id = 0;
+  let ts = 0;
+  for (let i = 0; i < page.id.length; i++) {
+    id += page.id[i];
+    ts += page.created_at[i];
+    out.push({
+      id,
+      sender: page.senders[page.sender[i]],
+      content: page.content[i],
+      channel_id: Array.isArray(page.channel_id) ? page.channel_id[i] : page.channel_id,
+      created_at: iso(ts),
+      edited_at: null,
+      attachments: [],
+    });
+  }
+  (page.edited_at || []).forEach(([i, ms]) => { out[i].edited_at = iso(ms); });
+  (page.attachments || []).forEach(([i, list]) => { out[i].attachments = list.map(attachment); });
+  return out;
+};